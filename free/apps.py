@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RestAppConfig(AppConfig):
     name = 'free'
+
+    def ready(self):
+        from free import signals  # noqa: F401
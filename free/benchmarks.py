@@ -0,0 +1,173 @@
+import io
+import os
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import django
+from django.core.management import call_command
+from django.db import connection
+
+from free.cache import busy_calendar_cache
+from free.models import Employee, Meeting
+from free.serializers import RequestFreeTimeSerializer
+from free.utils import slots
+from free.utils.parser import get_datetime_text
+from freebusy.settings import BASE_DIR
+
+# Window sizes (days) and participants counts of the free time scenarios
+WINDOWS = (1, 7, 30, 365)
+PARTICIPANTS = (2, 10, 50)
+ENGINES = ('sweep', 'bitmap')
+
+
+def measure(func, repeat):
+    """
+    Timings (seconds) of `repeat` calls. Setup of each call is done by the function itself.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def result(scenario, params, timings):
+    return {
+        'scenario': scenario,
+        'params': params,
+        'repeat': len(timings),
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+    }
+
+
+def result_key(result_data):
+    return result_data['scenario'], tuple(sorted(result_data['params'].items()))
+
+
+@contextmanager
+def isolated_busy_calendar_cache(temp_dir):
+    """
+    The cache uses the generation file in `temp_dir` and no snapshot - loading into the test database
+    bumps the generation, which must not drop calendars cached by the running API processes.
+    """
+    cache = busy_calendar_cache
+    saved = (cache.generation_file, cache.invalidations_file, cache.snapshot_file, cache.generation,
+             cache.invalidations_position)
+    cache.generation_file = os.path.join(temp_dir, 'busy_cache_generation')
+    cache.invalidations_file = cache.generation_file + '.invalidations'
+    cache.snapshot_file = None
+    cache.bump_generation()
+    try:
+        yield
+    finally:
+        (cache.generation_file, cache.invalidations_file, cache.snapshot_file, cache.generation,
+         cache.invalidations_position) = saved
+        cache.clear()
+
+
+def benchmark_loaddata(file_name):
+    """
+    Bulk load into the empty database and the incremental reload of the same (unchanged) file.
+    """
+    results = []
+    for scenario, options in [('loaddata_bulk', {'bulk': True}), ('loaddata_incremental', {'incremental': True})]:
+        timings = measure(lambda: call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(),
+                                               **options), 1)
+        results.append(result(scenario, {'meetings': Meeting.objects.count()}, timings))
+    return results
+
+
+def free_time_query(external_ids, earliest_start, window, duration=60, office_hours='8-17', engine='sweep'):
+    query = RequestFreeTimeSerializer(data={
+        'employee_ids': ",".join(external_ids),
+        'duration': duration,
+        'earliest_start': get_datetime_text(earliest_start),
+        'latest_start': get_datetime_text(earliest_start + timedelta(days=window)),
+        'office_hours': office_hours,
+    }, engine=engine)
+    if not query.is_valid():
+        raise ValueError(query.error)
+    return query
+
+
+def benchmark_free_time(windows=WINDOWS, participants=PARTICIPANTS, engines=ENGINES, repeat=5):
+    """
+    Free time pipeline stages for each window size and participants count, on the loaded data.
+    """
+    external_ids = list(Employee.objects.order_by('id').values_list('external_id', flat=True))
+    first_meeting = Meeting.objects.order_by('start').values_list('start', flat=True).first()
+    if first_meeting is None:
+        return []
+    earliest_start = datetime.combine(first_meeting.date(), datetime.min.time()) + timedelta(hours=8)
+
+    def uncached_possible_start_times(query):
+        slots.possible_start_times.cache_clear()
+        slots.day_template.cache_clear()
+        query._possible_start_times()
+
+    def cold_freetimes(query):
+        busy_calendar_cache.clear()
+        query.get_freetimes()
+
+    results = []
+    for window in windows:
+        for amount in participants:
+            if amount > len(external_ids):
+                continue
+            params = {'window_days': window, 'participants': amount}
+            query = free_time_query(external_ids[:amount], earliest_start, window)
+            results.append(result('employees_meetings', params,
+                                  measure(lambda: list(query._employees_meetings()), repeat)))
+            results.append(result('possible_start_times', params,
+                                  measure(lambda: uncached_possible_start_times(query), repeat)))
+            for engine in engines:
+                query = free_time_query(external_ids[:amount], earliest_start, window, engine=engine)
+                engine_params = dict(params, engine=engine)
+                results.append(result('get_freetimes_cold', engine_params,
+                                      measure(lambda: cold_freetimes(query), repeat)))
+                query.get_freetimes()
+                results.append(result('get_freetimes_warm', engine_params,
+                                      measure(lambda: query.get_freetimes(), repeat)))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=BASE_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+def compare(previous_results, results, threshold=1.2):
+    """
+    `(result, previous median, ratio, regression)` for results measured in both runs.
+    Regression - the median is slower more than `threshold` times.
+    """
+    previous = {result_key(previous_result): previous_result for previous_result in previous_results}
+    comparison = []
+    for current in results:
+        previous_result = previous.get(result_key(current))
+        if previous_result is None or not previous_result['median']:
+            continue
+        ratio = current['median'] / previous_result['median']
+        comparison.append((current, previous_result['median'], ratio, ratio > threshold))
+    return comparison
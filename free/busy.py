@@ -0,0 +1,151 @@
+import threading
+import weakref
+from contextlib import contextmanager
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from free.models import BusyInterval, Employee, Meeting
+from free.utils.engines import merge_busy_intervals
+
+_maintenance = threading.local()
+
+
+def maintenance_paused():
+    return getattr(_maintenance, 'paused', False)
+
+
+@contextmanager
+def rebuilt_busy_intervals():
+    """
+    Busy intervals are not maintained meeting by meeting (bulk loading). Employees whose meetings
+    were changed are collected (see `mark_changed`) and only their busy intervals are rebuilt at the end.
+    """
+    _maintenance.paused = True
+    _maintenance.changed_employee_ids = set()
+    try:
+        yield
+    finally:
+        _maintenance.paused = False
+        employee_ids = _maintenance.changed_employee_ids
+        _maintenance.changed_employee_ids = set()
+        if employee_ids:
+            rebuild_busy_intervals(employee_ids=employee_ids)
+
+
+def mark_changed(*employee_ids):
+    """
+    Employees whose busy intervals are rebuilt when the maintenance is resumed.
+    """
+    _maintenance.changed_employee_ids.update(employee_id for employee_id in employee_ids if employee_id is not None)
+
+
+def rebuild_busy_intervals(batch_size=1000, employee_id=None, employee_ids=None):
+    """
+    Merge meetings of all employees (or the given ones) again. Returns the amount of stored intervals.
+    """
+    if employee_id is not None:
+        employee_ids = [employee_id]
+    if employee_ids is None:
+        return _rebuild_busy_intervals(Meeting.objects.all(), BusyInterval.objects.all(), batch_size)
+    employee_ids = sorted(employee_ids)
+    counter = 0
+    for i in range(0, len(employee_ids), batch_size):
+        batch_ids = employee_ids[i:i + batch_size]
+        counter += _rebuild_busy_intervals(Meeting.objects.filter(employee_id__in=batch_ids),
+                                           BusyInterval.objects.filter(employee_id__in=batch_ids), batch_size)
+    return counter
+
+
+def _rebuild_busy_intervals(meetings, busy_intervals, batch_size):
+    meetings = meetings.filter(start__isnull=False, end__isnull=False).order_by('employee_id', 'start', 'end')
+    with transaction.atomic():
+        busy_intervals.delete()
+        buffer = []
+        counter = 0
+        employees_meetings = meetings.values_list('employee_id', 'start', 'end').iterator(chunk_size=batch_size)
+        for meetings_employee_id, rows in groupby(employees_meetings, key=lambda row: row[0]):
+            for start, end in merge_busy_intervals((start, end) for _, start, end in rows):
+                buffer.append(BusyInterval(employee_id=meetings_employee_id, start=start, end=end))
+            if len(buffer) >= batch_size:
+                BusyInterval.objects.bulk_create(buffer, batch_size=batch_size)
+                counter += len(buffer)
+                buffer = []
+        BusyInterval.objects.bulk_create(buffer, batch_size=batch_size)
+        counter += len(buffer)
+    return counter
+
+
+def add_meeting(meeting):
+    """
+    New meeting is merged only with busy intervals which it overlaps or touches.
+
+     ---Xxx----Xxx---      ---Xxxxxxxxx---
+         --Xxxxx--     ->
+    """
+    if meeting.start is None or meeting.end is None:
+        return
+    with transaction.atomic():
+        touched = list(BusyInterval.objects.filter(employee_id=meeting.employee_id,
+                                                   start__lte=meeting.end,
+                                                   end__gte=meeting.start).values_list('id', 'start', 'end'))
+        existing = sorted((start, end) for _, start, end in touched)
+        merged = merge_busy_intervals(existing + [(meeting.start, meeting.end)])
+        if merged == existing:
+            # Meeting is already covered by the busy time
+            return
+        BusyInterval.objects.filter(id__in=[interval_id for interval_id, _, _ in touched]).delete()
+        BusyInterval.objects.bulk_create(BusyInterval(employee_id=meeting.employee_id, start=start, end=end)
+                                         for start, end in merged)
+
+
+def remove_meeting(employee_id, start, end):
+    """
+    Only busy intervals which the meeting overlaps or touches are merged again from their remaining meetings.
+
+     ---Xxxxxxxxx---      ---Xxx----Xxx---
+         --Xxxxx--    ->
+    """
+    if start is None or end is None:
+        return
+    with transaction.atomic():
+        touched = list(BusyInterval.objects.filter(employee_id=employee_id,
+                                                   start__lte=end,
+                                                   end__gte=start).values_list('id', 'start', 'end'))
+        if not touched:
+            return
+        first = min(interval_start for _, interval_start, _ in touched)
+        last = max(interval_end for _, _, interval_end in touched)
+        meetings = Meeting.objects.filter(employee_id=employee_id, start__gte=first, end__lte=last)
+        merged = merge_busy_intervals(meetings.values_list('start', 'end'))
+        BusyInterval.objects.filter(id__in=[interval_id for interval_id, _, _ in touched]).delete()
+        BusyInterval.objects.bulk_create(BusyInterval(employee_id=employee_id, start=start, end=end)
+                                         for start, end in merged)
+
+
+def deleted_with_employee(origin):
+    """
+    Whether meetings are deleted by the cascade from employees (`origin` of the deletion signal).
+    """
+    return isinstance(origin, Employee) or (isinstance(origin, QuerySet) and origin.model is Employee)
+
+
+def remove_deleted_meeting(meeting, origin=None):
+    """
+    Busy time of the deleted meeting. Meetings deleted together (queryset, cascade) are all deleted
+    before the first `post_delete` signal, so the busy intervals of each employee are rebuilt only once.
+    Busy intervals of deleted employees are deleted with them.
+    """
+    if origin is None or origin is meeting:
+        remove_meeting(meeting.employee_id, meeting.start, meeting.end)
+        return
+    if deleted_with_employee(origin):
+        return
+    deletion = getattr(_maintenance, 'deletion', None)
+    if deletion is None or deletion[0]() is not origin:
+        deletion = _maintenance.deletion = (weakref.ref(origin), set())
+    rebuilt_employee_ids = deletion[1]
+    if meeting.employee_id not in rebuilt_employee_ids:
+        rebuilt_employee_ids.add(meeting.employee_id)
+        rebuild_busy_intervals(employee_id=meeting.employee_id)
@@ -0,0 +1,344 @@
+import os
+import threading
+from collections import OrderedDict
+
+from free.models import BusyInterval, Employee
+from free.snapshot import BusySnapshot
+from free.utils.minutes import BusyCalendar
+from freebusy.settings import BUSY_CACHE_GENERATION_FILE, BUSY_CACHE_MAX_INTERVALS, BUSY_SNAPSHOT_FILE
+
+
+class BusyCalendarCache:
+    """
+    In-process cache of employees busy time, keyed by the employee `external_id`.
+    Each entry keeps all busy intervals of the employee (merged meetings, see `free.busy`)
+    as `BusyCalendar` - microseconds columns sorted by start time.
+
+    The least recently used employees are evicted when the cache holds more than `max_intervals`
+    intervals (each employee entry counts as one more). Meetings saved through the ORM invalidate
+    the employee with signals (see `free.signals`) - the external id is appended to the invalidations log
+    (`<generation file>.invalidations`), so other processes drop the employee when they read the log.
+    Bulk writes (ex. `loaddata`) and changes of employees bump the generation - a byte is appended to
+    the generation file (its size is the generation, so no bump is missed like with modification times
+    within one timestamp tick) and the log is emptied, so every process drops its whole cache.
+
+    Calendars which are not cached are read from the snapshot (see `free.snapshot`), when it is given
+    and it was exported at the current generation - new processes are warmed up without database queries.
+    Employees invalidated after the export (by the position in the invalidations log) are loaded from
+    the database. `clear` drops the snapshot, it is opened again when the file is replaced (exported again).
+    """
+
+    def __init__(self, max_intervals=BUSY_CACHE_MAX_INTERVALS, generation_file=BUSY_CACHE_GENERATION_FILE,
+                 snapshot_file=BUSY_SNAPSHOT_FILE):
+        self.max_intervals = max_intervals
+        self.generation_file = generation_file
+        self.generation = self.file_generation()
+        self.invalidations_file = generation_file + '.invalidations' if generation_file else None
+        # Size of the invalidations log which was already read
+        self.invalidations_position = 0
+        self.invalidations_lock = threading.Lock()
+        # External ids by primary keys of employees - meetings refer to employees by primary keys
+        self.employees_external_ids = {}
+        self.intervals_counter = 0
+        self.invalidations_counter = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.snapshot_file = snapshot_file
+        # Opened lazily, the modification time tells whether the file was replaced
+        self.snapshot = None
+        self.snapshot_mtime = None
+        # Positions of the latest invalidations in the log by external ids, None - not read from the log yet
+        self.snapshot_stale_ids = {}
+
+    def busy_intervals(self, external_ids, earliest_start, latest_end):
+        """
+        Meetings of the employees between earliest_start and latest_end, ordered by start time.
+        The same meetings as `RequestFreeTimeSerializer._employees_meetings` selects.
+        """
+        calendars = self.calendars(external_ids, earliest_start, latest_end)
+        return busy_intervals_between(calendars.values(), earliest_start, latest_end)
+
+    async def abusy_intervals(self, external_ids, earliest_start, latest_end):
+        calendars = await self.acalendars(external_ids, earliest_start, latest_end)
+        return busy_intervals_between(calendars.values(), earliest_start, latest_end)
+
+    def calendars(self, external_ids, earliest_start, latest_end):
+        """
+        Meetings of each employee (by `external_id`) sorted by start time, at least those between
+        earliest_start and latest_end. Employees which are not cached are loaded with one query.
+        """
+        external_ids = set(external_ids)
+        self._synchronize()
+        if self.max_intervals <= 0:
+            calendars, missing_ids = self._snapshot_calendars(external_ids, earliest_start, latest_end)
+            if missing_ids:
+                calendars.update(self._load_calendars(missing_ids, earliest_start, latest_end))
+            return calendars
+        return self._calendars(external_ids)
+
+    def invalidate(self, external_id):
+        """
+        Drop the calendar of the employee in this process and (through the invalidations log) in all other ones.
+        """
+        if external_id is None:
+            return
+        self._invalidate(external_id, None)
+        if self.invalidations_file:
+            with open(self.invalidations_file, 'a') as file:
+                file.write(external_id + '\n')
+
+    def external_id(self, employee_id):
+        """
+        External id of the employee by the primary key, cached until the generation is bumped.
+        """
+        external_id = self.employees_external_ids.get(employee_id)
+        if external_id is None:
+            external_id = Employee.objects.filter(pk=employee_id).values_list('external_id', flat=True).first()
+            if external_id is not None:
+                self.employees_external_ids[employee_id] = external_id
+        return external_id
+
+    def invalidations_size(self):
+        try:
+            return os.stat(self.invalidations_file).st_size if self.invalidations_file else 0
+        except OSError:
+            return 0
+
+    def _invalidate(self, external_id, position):
+        with self.lock:
+            self.invalidations_counter += 1
+            if position is None or self.snapshot is None or position > self.snapshot.invalidations_position:
+                self.snapshot_stale_ids[external_id] = position
+            calendar = self.entries.pop(external_id, None)
+            if calendar is not None:
+                self.intervals_counter -= len(calendar) + 1
+
+    def clear(self):
+        with self.lock:
+            self.invalidations_counter += 1
+            self.entries.clear()
+            self.intervals_counter = 0
+            self.employees_external_ids = {}
+            self.snapshot_stale_ids = {}
+            self._drop_snapshot()
+
+    def bump_generation(self):
+        """
+        Drop cached calendars in this process and (by growing the generation file) in all other ones.
+        """
+        if self.invalidations_file:
+            # Employees invalidated before are dropped with the whole cache
+            open(self.invalidations_file, 'w').close()
+        if self.generation_file:
+            # Appends are atomic, concurrent bumps are all counted
+            with open(self.generation_file, 'ab') as file:
+                file.write(b'.')
+        self.clear()
+        self.generation = self.file_generation()
+        self.invalidations_position = 0
+
+    def file_generation(self):
+        if not self.generation_file:
+            return None
+        try:
+            return os.stat(self.generation_file).st_size
+        except OSError:
+            return None
+
+    async def acalendars(self, external_ids, earliest_start, latest_end):
+        """
+        `calendars` for async views - meetings which are not cached are loaded with the async ORM.
+        """
+        external_ids = set(external_ids)
+        self._synchronize()
+        if self.max_intervals <= 0:
+            calendars, missing_ids = self._snapshot_calendars(external_ids, earliest_start, latest_end)
+            if missing_ids:
+                calendars.update(await self._aload_calendars(missing_ids, earliest_start, latest_end))
+            return calendars
+        calendars, missing_ids, invalidations_counter = self._cached_calendars(external_ids)
+        if missing_ids:
+            loaded_calendars, missing_ids = self._snapshot_calendars(missing_ids)
+            if missing_ids:
+                loaded_calendars.update(await self._aload_calendars(missing_ids))
+            calendars.update(loaded_calendars)
+            self._store_loaded(loaded_calendars, invalidations_counter)
+        return calendars
+
+    def _calendars(self, external_ids):
+        calendars, missing_ids, invalidations_counter = self._cached_calendars(external_ids)
+        if missing_ids:
+            loaded_calendars, missing_ids = self._snapshot_calendars(missing_ids)
+            if missing_ids:
+                loaded_calendars.update(self._load_calendars(missing_ids))
+            calendars.update(loaded_calendars)
+            self._store_loaded(loaded_calendars, invalidations_counter)
+        return calendars
+
+    def _snapshot_calendars(self, external_ids, earliest_start=None, latest_end=None):
+        """
+        Calendars read from the snapshot and ids of employees which must be loaded from the database.
+        """
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return {}, list(external_ids)
+        calendars = {}
+        missing_ids = []
+        for external_id in external_ids:
+            if external_id in snapshot and external_id not in self.snapshot_stale_ids:
+                calendars[external_id] = snapshot.calendar(external_id, earliest_start, latest_end)
+            else:
+                missing_ids.append(external_id)
+        return calendars, missing_ids
+
+    def _current_snapshot(self):
+        if not self.snapshot_file:
+            return None
+        try:
+            mtime = os.stat(self.snapshot_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self.lock:
+            if mtime != self.snapshot_mtime:
+                self.snapshot_mtime = mtime
+                try:
+                    self.snapshot = BusySnapshot(self.snapshot_file)
+                except (OSError, ValueError):
+                    self.snapshot = None
+                # Employees invalidated before the export are up to date in the new snapshot
+                self.snapshot_stale_ids = {
+                    external_id: position for external_id, position in self.snapshot_stale_ids.items()
+                    if self.snapshot is None or (position is not None
+                                                 and position > self.snapshot.invalidations_position)}
+            snapshot = self.snapshot
+        # Data were loaded after the snapshot was exported
+        if snapshot is None or snapshot.generation != self.file_generation():
+            return None
+        return snapshot
+
+    def _drop_snapshot(self):
+        # Not closed - other threads might be reading it, the memory map is closed when it is not referenced.
+        self.snapshot = None
+
+    def _synchronize(self):
+        """
+        Changes made by other processes - the bumped generation and employees invalidated since the last read
+        of the invalidations log.
+        """
+        generation = self.file_generation()
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+            self.invalidations_position = 0
+        if not self.invalidations_file:
+            return
+        size = self.invalidations_size()
+        if size == self.invalidations_position:
+            return
+        with self.invalidations_lock:
+            if size < self.invalidations_position:
+                # Emptied by the generation bump
+                self.invalidations_position = 0
+            with open(self.invalidations_file, 'rb') as file:
+                file.seek(self.invalidations_position)
+                data = file.read(size - self.invalidations_position)
+            # The last line might be still written
+            end = data.rfind(b'\n') + 1
+            position = self.invalidations_position
+            self.invalidations_position += end
+        for line in data[:end].splitlines(keepends=True):
+            position += len(line)
+            self._invalidate(line.decode().rstrip('\n'), position)
+
+    def _cached_calendars(self, external_ids):
+        """
+        Cached calendars, ids of employees which must be loaded and the invalidations counter
+        at the time of the lookup.
+        """
+        calendars = {}
+        missing_ids = []
+        with self.lock:
+            for external_id in external_ids:
+                calendar = self.entries.get(external_id)
+                if calendar is None:
+                    missing_ids.append(external_id)
+                else:
+                    self.entries.move_to_end(external_id)
+                    calendars[external_id] = calendar
+            return calendars, missing_ids, self.invalidations_counter
+
+    def _store_loaded(self, loaded_calendars, invalidations_counter):
+        with self.lock:
+            # Calendars loaded while some meeting was saved might be already outdated.
+            if invalidations_counter == self.invalidations_counter:
+                for external_id, calendar in loaded_calendars.items():
+                    self._store(external_id, calendar)
+
+    def _store(self, external_id, calendar):
+        previous = self.entries.pop(external_id, None)
+        if previous is not None:
+            self.intervals_counter -= len(previous) + 1
+        if len(calendar) + 1 > self.max_intervals:
+            return
+        self.entries[external_id] = calendar
+        self.intervals_counter += len(calendar) + 1
+        while self.intervals_counter > self.max_intervals:
+            _, evicted = self.entries.popitem(last=False)
+            self.intervals_counter -= len(evicted) + 1
+
+    @staticmethod
+    def _load_calendars(external_ids, earliest_start=None, latest_end=None):
+        """
+        One query for all employees which are not cached. Employees without meetings get empty calendars.
+        Only meetings between earliest_start and latest_end are loaded when the window is given.
+        """
+        calendars = {external_id: BusyCalendar() for external_id in external_ids}
+        meetings = BusyCalendarCache._meetings(external_ids, earliest_start, latest_end)
+        for external_id, start, end in meetings:
+            calendars[external_id].append(start, end)
+        return calendars
+
+    @staticmethod
+    async def _aload_calendars(external_ids, earliest_start=None, latest_end=None):
+        calendars = {external_id: BusyCalendar() for external_id in external_ids}
+        meetings = BusyCalendarCache._meetings(external_ids, earliest_start, latest_end)
+        async for external_id, start, end in meetings:
+            calendars[external_id].append(start, end)
+        return calendars
+
+    @staticmethod
+    def _meetings(external_ids, earliest_start, latest_end):
+        """
+        Meetings are read from the busy intervals table - already merged, so there are less rows.
+        The window is the one of all possible meetings - latest_end is the end of the meeting starting
+        at the latest start, so merged and separate meetings give the same free time slots.
+        """
+        busy_intervals = BusyInterval.objects.filter(employee__external_id__in=external_ids).order_by('start')
+        if earliest_start is not None and latest_end is not None:
+            busy_intervals = busy_intervals.filter(start__lt=latest_end, end__gt=earliest_start)
+        return busy_intervals.values_list('employee__external_id', 'start', 'end')
+
+
+def busy_intervals_between(calendars, earliest_start, latest_end):
+    """
+    Meetings of the calendars between earliest_start and latest_end, ordered by start time.
+    """
+    busy_intervals = []
+    for calendar in calendars:
+        busy_intervals.extend(calendar.intervals(earliest_start, latest_end))
+    busy_intervals.sort()
+    return busy_intervals
+
+
+def busy_minutes_between(calendars, earliest_start, latest_end, round_starts_up=False):
+    """
+    The same as `busy_intervals_between` as (start, end) minutes - no datetime is created.
+    """
+    busy_minutes = []
+    for calendar in calendars:
+        busy_minutes.extend(calendar.minutes(earliest_start, latest_end, round_starts_up))
+    busy_minutes.sort()
+    return busy_minutes
+
+
+busy_calendar_cache = BusyCalendarCache()
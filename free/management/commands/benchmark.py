@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from free import benchmarks
+from free.utils.synthetic import write_synthetic_file
+
+
+def int_list(text):
+    return [int(value) for value in text.split(',')]
+
+
+class Command(BaseCommand):
+    """
+    Performance scenarios of `loaddata` and the free time pipeline, run on a separate test database.
+    Results are written as JSON, so runs of different commits can be compared (`--compare`).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', type=str, help="Dump file to load instead of the synthetic one")
+        parser.add_argument('--employees', type=int, default=140, help="Synthetic employees [140]")
+        parser.add_argument('--meetings', type=int, default=70, help="Synthetic meetings per employee [70]")
+        parser.add_argument('--overlap', type=float, default=0.1,
+                            help="Probability that a synthetic meeting overlaps the previous one [0.1]")
+        parser.add_argument('--days', type=int, default=90, help="Days with synthetic meetings [90]")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data [0]")
+        parser.add_argument('--windows', type=int_list, default=list(benchmarks.WINDOWS),
+                            help="Free time windows in days [1,7,30,365]")
+        parser.add_argument('--participants', type=int_list, default=list(benchmarks.PARTICIPANTS),
+                            help="Participants of free time queries [2,10,50]")
+        parser.add_argument('--repeat', type=int, default=5, help="Repeats of each scenario [5]")
+        parser.add_argument('--output', type=str, help="Write results to the JSON file")
+        parser.add_argument('--compare', type=str, help="Compare with results of a previous run (JSON file)")
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help="Slower medians by more than this ratio are regressions [1.2]")
+
+    def handle(self, *args, **options):
+        synthetic = None
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_name = options['file']
+            if file_name is None:
+                synthetic = {name: options[name] for name in ('employees', 'meetings', 'overlap', 'days', 'seed')}
+                file_name = write_synthetic_file(os.path.join(temp_dir, 'freebusy.txt'),
+                                                 employees=options['employees'],
+                                                 meetings_per_employee=options['meetings'],
+                                                 overlap=options['overlap'], days=options['days'],
+                                                 seed=options['seed'])
+
+            # Never touch the configured database and the busy calendar cache files of API processes
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                with benchmarks.isolated_busy_calendar_cache(temp_dir):
+                    results = benchmarks.benchmark_loaddata(file_name)
+                    results += benchmarks.benchmark_free_time(options['windows'], options['participants'],
+                                                              repeat=options['repeat'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for result in results:
+            params = ' '.join(f"{name}={value}" for name, value in result['params'].items())
+            self.stdout.write(f"{result['scenario']:<22} {params:<50} median {result['median'] * 1000:10.3f} ms")
+
+        report = {'environment': benchmarks.environment(), 'synthetic': synthetic,
+                  'file': options['file'], 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                previous = json.load(file)
+            regressions = 0
+            for result, previous_median, ratio, regression in benchmarks.compare(previous['results'], results,
+                                                                                 options['threshold']):
+                params = ' '.join(f"{name}={value}" for name, value in result['params'].items())
+                line = f"{result['scenario']:<22} {params:<50} {previous_median * 1000:10.3f} ms -> " \
+                       f"{result['median'] * 1000:10.3f} ms ({ratio:.2f}x)"
+                if regression:
+                    regressions += 1
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+            style = self.style.ERROR if regressions else self.style.SUCCESS
+            self.stdout.write(style(f"{regressions} regressions compared with {previous['environment']['commit']}"))
+
+# python3 manage.py benchmark --output benchmark.json
+# python3 manage.py benchmark --compare benchmark.json
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from free.cache import busy_calendar_cache
+from free.snapshot import write_snapshot
+from freebusy.settings import BUSY_SNAPSHOT_FILE
+
+
+class Command(BaseCommand):
+    """
+    Export busy intervals of all employees to the binary snapshot, which is memory mapped by API processes
+    (`BUSY_SNAPSHOT_FILE`). The snapshot is used until the next `loaddata` - export it after loading the data.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', type=str, default=BUSY_SNAPSHOT_FILE or 'busy.snapshot',
+                            help=f"The name of the snapshot file [{BUSY_SNAPSHOT_FILE or 'busy.snapshot'}]")
+
+    def handle(self, *args, **options):
+        file_name = options['file']
+        start_time = time.time()
+        # Snapshot is valid only at the current generation of the data, employees invalidated
+        # while it is exported are read from the database
+        employees, intervals = write_snapshot(file_name, busy_calendar_cache.file_generation(),
+                                              busy_calendar_cache.invalidations_size())
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"Exported {employees} employees and {intervals} busy intervals "
+                                             f"to {file_name} ({os.path.getsize(file_name)} bytes) "
+                                             f"in {elapsed:.2f} s"))
+
+# python3 manage.py exportsnapshot --file busy.snapshot
@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
-import requests
 from django.core.management.base import BaseCommand
 
+from free.utils import compression, download
+
 
 class Command(BaseCommand):
+    """
+    Download the dump file. The body is streamed into `<file>.part` and renamed when completed.
+    An interrupted download is resumed and an unchanged file is not downloaded again
+    (validators are kept in `<file>.meta.json`).
+    """
 
     def add_arguments(self, parser):
         parser.add_argument('--file', type=str, help="The name of the target file [freebusy.txt]")
         parser.add_argument('--url', type=str, help="Download file via http request")
+        parser.add_argument('--force', action='store_true', help="Download the whole file again")
+        parser.add_argument('--chunk-size', type=int, default=download.CHUNK_SIZE,
+                            help=f"Bytes written at once [{download.CHUNK_SIZE}]")
 
     def handle(self, *args, **options):
         try:
@@ -19,17 +28,21 @@ class Command(BaseCommand):
             if file_name is None:
                 file_name = "freebusy.txt"
 
-            # Make http request for remote file data
-            data = requests.get(remote_url)
-
-            # Save file data to local copy
-            with open(file_name, 'wb') as file:
-                file.write(data.content)
+            result = download.download(remote_url, file_name, options['chunk_size'], options['force'])
 
-            self.stdout.write(self.style.SUCCESS('Download completed'))
+            if result == download.NOT_MODIFIED:
+                self.stdout.write(self.style.SUCCESS('File is up to date'))
+            elif result == download.RESUMED:
+                self.stdout.write(self.style.SUCCESS('Download resumed and completed'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Download completed'))
+            # Compressed file is kept as it is, `loaddata` decompresses it while loading
+            file_compression = compression.detect_file(file_name)
+            if file_compression:
+                self.stdout.write(f"File is {file_compression} compressed")
 
         except Exception as e:
-            self.stdout.write(self.style.ERROR(e))
+            self.stdout.write(self.style.ERROR(str(e)))
             exit(1)
 
-# python3 manage.py fetchdata
\ No newline at end of file
+# python3 manage.py fetchdata
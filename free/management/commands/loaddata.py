@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import time
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from django.core.management.base import BaseCommand
-from django.db import OperationalError
+from django.db import OperationalError, transaction
+from free import busy
+from free.cache import busy_calendar_cache
 from free.models import Employee, Meeting
-from freebusy.settings import DATETIME_FORMAT
+from free.utils import compression, download, dump
+from free.utils.parser import get_datetime_fast, get_line_fingerprint
 
 
 class Command(BaseCommand):
@@ -17,11 +20,35 @@ class Command(BaseCommand):
         self.file_lines_counter = 0
         self.file_name = "freebusy.txt"
         self.errors = []
+        self.batch_size = 1000
+        self.employees = {}
+        self.meetings = {}
+        self.fingerprints = {}
+        self.seen_fingerprints = set()
+        self.incremental = False
+        self.workers = None
+        self.url = None
+        self.unchanged_counter = 0
+        self.employees_buffer = []
+        self.meetings_buffer = []
+        self.fingerprints_buffer = []
+        self.deferred_meetings = []
+        self.employees_counter = 0
+        self.meetings_counter = 0
         super().__init__()
 
     def add_arguments(self, parser):
         parser.add_argument('--file', type=str, help="Download data from the provided path [freebusy.txt]")
         parser.add_argument('--verbose', type=str, default='Yes', help="Show traversed data [Yes]")
+        parser.add_argument('--bulk', action='store_true',
+                            help="Load data in a single pass with bulk inserts in a single transaction (much faster)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk insert [1000]")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Bulk mode with lines parsed in the given number of processes")
+        parser.add_argument('--incremental', action='store_true',
+                            help="Bulk mode which inserts only new lines and deletes meetings removed from the file")
+        parser.add_argument('--url', type=str, default=None,
+                            help="Bulk mode with the file streamed from the URL - lines are loaded while downloading")
 
     def print_io(self, line, force_print=False):
         if "ERROR" in line:
@@ -41,20 +68,14 @@ class Command(BaseCommand):
             self.file_lines_counter = 0
             self.items_counter = 0
             try:
-                with open(self.file_name, 'r') as file:
-                    # Get line one by one since file might be big.
-                    while True:
-                        line = file.readline()
-                        self.file_lines_counter += 1
-                        # if line is empty end of the file is reached
-                        if not line:
-                            break
-
-                        func(self, line)
+                # Get line one by one since file might be big.
+                for line in dump.read_lines(self.file_name):
+                    self.file_lines_counter += 1
+                    func(self, line)
 
                 return self.items_counter
             except Exception as e:
-                self.print_io(self.style.WARNING(f"[{func.__name__}] ") + self.style.ERROR(e), force_print=True)
+                self.print_io(self.style.WARNING(f"[{func.__name__}] ") + self.style.ERROR(str(e)), force_print=True)
 
         return wrap
 
@@ -80,10 +101,10 @@ class Command(BaseCommand):
             elif len(data) == 1:
                 self.print_io(self.style.ERROR(f'{self.file_lines_counter}:ERROR:TRASH:') + line)
         except OperationalError as e:
-            self.print_io(self.style.WARNING(f"[handle_employee_data] ") + self.style.ERROR(e), force_print=True)
+            self.print_io(self.style.WARNING(f"[handle_employee_data] ") + self.style.ERROR(str(e)), force_print=True)
             exit(1)
         except Exception as e:
-            self.print_io(self.style.WARNING(f"[handle_employee_data] ") + self.style.ERROR(e), force_print=True)
+            self.print_io(self.style.WARNING(f"[handle_employee_data] ") + self.style.ERROR(str(e)), force_print=True)
 
     @stream_lines_from_file
     def handle_meeting_data(self, line=""):
@@ -93,15 +114,17 @@ class Command(BaseCommand):
             if data_len == 4:
                 self.items_counter += 1
                 external_id = data[0]
-                start = datetime.strptime(data[1], DATETIME_FORMAT)
-                end = datetime.strptime(data[2], DATETIME_FORMAT)
+                start = get_datetime_fast(data[1])
+                end = get_datetime_fast(data[2])
                 if start >= end:
                     self.print_io(self.style.ERROR(f'{self.file_lines_counter}:ERROR:START >= END:') + line)
                 else:
                     employees = Employee.objects.filter(external_id=external_id)
                     if employees.exists():
                         employee = employees.first()
-                        meeting, created = Meeting.objects.get_or_create(employee=employee, start=start, end=end)
+                        meeting, created = Meeting.objects.get_or_create(
+                            employee=employee, start=start, end=end,
+                            defaults={'fingerprint': get_line_fingerprint(line)})
                         if not created:
                             self.print_io(self.style.WARNING(f'{self.items_counter}:ALREADY LOADED:') + f"{meeting}")
                         else:
@@ -112,10 +135,189 @@ class Command(BaseCommand):
             elif data_len == 3 or data_len > 4:
                 self.print_io(self.style.ERROR(f'{self.file_lines_counter}:ERROR:TRASH:') + line)
         except OperationalError as e:
-            self.print_io(self.style.WARNING(f"[handle_meeting_data] ") + self.style.ERROR(e), force_print=True)
+            self.print_io(self.style.WARNING(f"[handle_meeting_data] ") + self.style.ERROR(str(e)), force_print=True)
+            exit(1)
+        except Exception as e:
+            self.print_io(self.style.WARNING(f"[handle_meeting_data] ") + self.style.ERROR(str(e)), force_print=True)
+
+    def prefetch_data(self):
+        """
+        Bulk mode keeps all employees and meetings in memory, so no query is made per line.
+        """
+        self.employees = {employee.external_id: employee for employee in Employee.objects.all()}
+        self.meetings = {}
+        self.fingerprints = {}
+        meetings = Meeting.objects.values_list('employee__external_id', 'start', 'end', 'id', 'fingerprint')
+        for external_id, start, end, meeting_id, fingerprint in meetings:
+            self.meetings[(external_id, start, end)] = (meeting_id, fingerprint)
+            if fingerprint is not None:
+                self.fingerprints[fingerprint] = meeting_id
+
+    def flush_employees(self):
+        Employee.objects.bulk_create(self.employees_buffer, batch_size=self.batch_size)
+        if any(employee.pk is None for employee in self.employees_buffer):
+            # Not every database returns primary keys from bulk inserts.
+            employees_ids = dict(Employee.objects.filter(
+                external_id__in=[employee.external_id for employee in self.employees_buffer]
+            ).values_list('external_id', 'id'))
+            for employee in self.employees_buffer:
+                employee.pk = employees_ids[employee.external_id]
+        self.employees_buffer = []
+
+    def flush_meetings(self):
+        # Employees of buffered meetings must be stored first.
+        self.flush_employees()
+        Meeting.objects.bulk_create(self.meetings_buffer, batch_size=self.batch_size)
+        # Inserted without signals
+        busy.mark_changed(*(meeting.employee_id for meeting in self.meetings_buffer))
+        self.meetings_buffer = []
+        Meeting.objects.bulk_update(self.fingerprints_buffer, ['fingerprint'], batch_size=self.batch_size)
+        self.fingerprints_buffer = []
+
+    def delete_stale_meetings(self):
+        """
+        Meetings loaded from the previous file, which lines are not present in the current one.
+        """
+        stale_ids = {meeting_id for fingerprint, meeting_id in self.fingerprints.items()
+                     if fingerprint not in self.seen_fingerprints}
+        stale_ids = list(stale_ids)
+        for i in range(0, len(stale_ids), self.batch_size):
+            Meeting.objects.filter(id__in=stale_ids[i:i + self.batch_size]).delete()
+        if stale_ids:
+            stale_ids = set(stale_ids)
+            self.meetings = {meeting_key: meeting for meeting_key, meeting in self.meetings.items()
+                             if meeting[0] not in stale_ids}
+        return len(stale_ids)
+
+    def line_text(self, offset):
+        """
+        Records are not holding lines of the file, just their offsets.
+        The text is read again only to report an error.
+        Records of the streamed file (`--url`) are holding their raw lines instead.
+        """
+        if isinstance(offset, bytes):
+            return offset.decode().replace('\r\n', '\n')
+        with open(self.file_name, 'rb') as file:
+            file.seek(offset)
+            return file.readline().decode().replace('\r\n', '\n')
+
+    def handle_employee_bulk(self, error, values, offset, line_number):
+        self.employees_counter += 1
+        if error is not None:
+            self.print_io(self.style.ERROR(f'{line_number}:ERROR:{error}:') + self.line_text(offset))
+            return
+        external_id, name = values
+        if external_id in self.employees:
+            self.print_io(self.style.WARNING(f'{self.employees_counter}:employee EXISTS:') + f"{name} - {external_id}")
+        else:
+            employee = Employee(name=name, external_id=external_id)
+            self.employees[external_id] = employee
+            self.employees_buffer.append(employee)
+            if len(self.employees_buffer) >= self.batch_size:
+                self.flush_employees()
+            self.print_io(self.style.WARNING(f'{self.employees_counter}: ') + f"{employee}")
+
+    def handle_meeting_bulk(self, error, values, offset, line_number):
+        self.meetings_counter += 1
+        if isinstance(error, Exception):
+            raise error
+        if error is not None:
+            self.print_io(self.style.ERROR(f'{line_number}:ERROR:{error}:') + self.line_text(offset))
+            return
+        external_id, start, end, fingerprint = values
+        employee = self.employees.get(external_id)
+        if employee is not None:
+            meeting = Meeting(employee=employee, start=start, end=end, fingerprint=fingerprint)
+            meeting_key = (external_id, start, end)
+            if meeting_key in self.meetings:
+                meeting_id, meeting_fingerprint = self.meetings[meeting_key]
+                if meeting_fingerprint is None and meeting_id is not None:
+                    # Meeting loaded before fingerprints were stored.
+                    self.meetings[meeting_key] = (meeting_id, fingerprint)
+                    self.fingerprints[fingerprint] = meeting_id
+                    self.fingerprints_buffer.append(Meeting(id=meeting_id, fingerprint=fingerprint))
+                self.print_io(self.style.WARNING(f'{self.meetings_counter}:ALREADY LOADED:') + f"{meeting}")
+            else:
+                self.meetings[meeting_key] = (None, fingerprint)
+                self.meetings_buffer.append(meeting)
+                if len(self.meetings_buffer) >= self.batch_size:
+                    self.flush_meetings()
+                self.print_io(self.style.SUCCESS(f'{self.meetings_counter}:') + f"{meeting}")
+        else:
+            self.print_io(self.style.ERROR(f'{line_number}:ERROR:EMPLOYEE DOES NOT EXISTS:') + self.line_text(offset))
+
+    def handle_record(self, record, line_number, offset, defer_meetings=True):
+        """
+        Employee and meeting records are routed to separate pipelines.
+        Meetings of employees which are not seen yet are deferred.
+        In the incremental mode all changed meetings are deferred.
+        """
+        kind, error, values = record
+        try:
+            if kind == dump.EMPLOYEE:
+                self.handle_employee_bulk(error, values, offset, line_number)
+            elif kind == dump.MEETING:
+                if defer_meetings and error is None:
+                    external_id, start, end, fingerprint = values
+                    if self.incremental:
+                        self.seen_fingerprints.add(fingerprint)
+                        if fingerprint in self.fingerprints:
+                            self.unchanged_counter += 1
+                        else:
+                            self.deferred_meetings.append((line_number, record, offset))
+                        return
+                    if external_id not in self.employees:
+                        self.deferred_meetings.append((line_number, record, offset))
+                        return
+                self.handle_meeting_bulk(error, values, offset, line_number)
+            else:
+                self.print_io(self.style.ERROR(f'{line_number}:ERROR:{error}:') + self.line_text(offset))
+        except OperationalError as e:
+            self.print_io(self.style.WARNING(f"[handle_record] ") + self.style.ERROR(str(e)), force_print=True)
             exit(1)
         except Exception as e:
-            self.print_io(self.style.WARNING(f"[handle_meeting_data] ") + self.style.ERROR(e), force_print=True)
+            self.print_io(self.style.WARNING(f"[handle_record] ") + self.style.ERROR(str(e)), force_print=True)
+
+    def handle_data_bulk(self):
+        """
+        Single pass over the memory mapped file. With workers, lines are parsed and validated
+        in separate processes and records are stored by this (single) process.
+        With the URL, lines are parsed while the file is downloading (nothing is written to the disk).
+        Compressed files are streamed - they can not be split for workers.
+        """
+        if self.url:
+            chunks = [dump.read_stream_records(download.stream_chunks(self.url))]
+        elif self.workers and not compression.detect_file(self.file_name):
+            chunks = dump.parse_file_in_processes(self.file_name, self.workers)
+        else:
+            chunks = [dump.read_file_records(self.file_name)]
+        line_number = 0
+        for records in chunks:
+            for offset, record in records:
+                line_number += 1
+                self.handle_record(record, line_number, offset)
+
+    def load_data_bulk(self):
+        self.employees_counter = 0
+        self.meetings_counter = 0
+        self.deferred_meetings = []
+        self.seen_fingerprints = set()
+        self.unchanged_counter = 0
+        with transaction.atomic():
+            self.prefetch_data()
+            self.handle_data_bulk()
+            if self.incremental:
+                deleted_meetings = self.delete_stale_meetings()
+                self.print_io(self.style.SUCCESS(f"Skipped {self.unchanged_counter} unchanged meetings lines"),
+                              force_print=True)
+                self.print_io(self.style.SUCCESS(f"Deleted {deleted_meetings} meetings removed from the file"),
+                              force_print=True)
+            # Employees of deferred meetings are placed below their meetings in the file, or do not exist.
+            for line_number, record, offset in self.deferred_meetings:
+                self.handle_record(record, line_number, offset, defer_meetings=False)
+            self.deferred_meetings = []
+            self.flush_meetings()
+        return self.employees_counter, self.meetings_counter
 
     def handle(self, *args, **options):
         try:
@@ -125,9 +327,21 @@ class Command(BaseCommand):
             if options['verbose']:
                 self.verbose = options['verbose'].lower() in ['yes', 'y', '1', 'true', 't', 'yep']
 
+            if options['batch_size']:
+                self.batch_size = options['batch_size']
+
             start_time = time.time()
-            employees_lines = self.handle_employee_data()
-            meetings_lines = self.handle_meeting_data()
+            self.incremental = options['incremental']
+            self.workers = options['workers']
+            self.url = options['url']
+            # Busy intervals of employees with new or deleted meetings are merged once, after loading
+            with busy.rebuilt_busy_intervals():
+                if options['bulk'] or self.incremental or self.workers or self.url:
+                    employees_lines, meetings_lines = self.load_data_bulk()
+                else:
+                    employees_lines = self.handle_employee_data()
+                    meetings_lines = self.handle_meeting_data()
+            busy_calendar_cache.bump_generation()
             elapsed = time.time() - start_time
 
             self.print_io(self.style.SUCCESS(f"Data loaded in {timedelta(seconds=elapsed)}"), force_print=True)
@@ -139,5 +353,5 @@ class Command(BaseCommand):
                           force_print=True)
             # self.print_errors()
         except Exception as e:
-            self.print_io("[handle] " + self.style.ERROR(e), force_print=True)
+            self.print_io("[handle] " + self.style.ERROR(str(e)), force_print=True)
             exit(1)
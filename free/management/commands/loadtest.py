@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Simple load test of a running server - the same request is sent by concurrent clients.
+    Used to compare the WSGI and ASGI deployments of the free time endpoint.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', type=str, help="Requested URL (with query parameters)")
+        parser.add_argument('--requests', type=int, default=500, help="Amount of requests [500]")
+        parser.add_argument('--concurrency', type=int, default=20, help="Amount of concurrent clients [20]")
+
+    def handle(self, *args, **options):
+        url = options['url']
+        amount = options['requests']
+        concurrency = options['concurrency']
+        session = requests.Session()
+        session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+        def call(_):
+            start = time.perf_counter()
+            try:
+                status_code = session.get(url).status_code
+            except requests.RequestException:
+                status_code = None
+            return status_code, time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(call, range(amount)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for status_code, _ in results if status_code != 200)
+        self.stdout.write(self.style.SUCCESS(f"{amount} requests, {concurrency} concurrent clients in {elapsed:.2f} s"))
+        self.stdout.write(f"Throughput: {amount / elapsed:.1f} requests/s")
+        for percentile in (50, 95, 99):
+            latency = latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)]
+            self.stdout.write(f"Latency p{percentile}: {latency * 1000:.1f} ms")
+        if errors:
+            self.stdout.write(self.style.ERROR(f"Failed requests: {errors}"))
+
+# python3 manage.py loadtest 'http://127.0.0.1:8000/api/free/?employee_ids=...' --concurrency 50
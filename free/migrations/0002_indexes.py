@@ -0,0 +1,22 @@
+# Generated by Django 4.1.5 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('free', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='employee',
+            name='external_id',
+            field=models.CharField(blank=True, default=None, max_length=50, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['employee', 'start', 'end'], name='meeting_employee_start_end'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('free', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='fingerprint',
+            field=models.CharField(blank=True, default=None, max_length=32, null=True),
+        ),
+    ]
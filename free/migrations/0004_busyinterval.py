@@ -0,0 +1,45 @@
+# Generated by Django 4.1.5 on 2026-10-18 17:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from free.utils.engines import merge_busy_intervals
+
+
+def build_busy_intervals(apps, schema_editor):
+    """
+    Busy intervals of already loaded meetings.
+    """
+    Meeting = apps.get_model('free', 'Meeting')
+    BusyInterval = apps.get_model('free', 'BusyInterval')
+    calendars = {}
+    meetings = Meeting.objects.filter(start__isnull=False, end__isnull=False).values_list('employee_id', 'start', 'end')
+    for employee_id, start, end in meetings.iterator(chunk_size=2000):
+        calendars.setdefault(employee_id, []).append((start, end))
+    BusyInterval.objects.bulk_create((BusyInterval(employee_id=employee_id, start=start, end=end)
+                                      for employee_id, calendar in calendars.items()
+                                      for start, end in merge_busy_intervals(calendar)), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('free', '0003_meeting_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusyInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='busy_intervals', to='free.employee')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='busyinterval',
+            index=models.Index(fields=['employee', 'start', 'end'], name='busy_employee_start_end'),
+        ),
+        migrations.RunPython(build_busy_intervals, migrations.RunPython.noop),
+    ]
@@ -3,7 +3,7 @@ from django.db import models
 
 class Employee(models.Model):
     name = models.CharField(max_length=255)
-    external_id = models.CharField(max_length=50, blank=True, null=True, default=None)  # 39
+    external_id = models.CharField(max_length=50, blank=True, null=True, default=None, unique=True)  # 39
 
     def __str__(self):
         return f"{self.name} - {self.external_id}"
@@ -21,9 +21,39 @@ class Meeting(models.Model):
     employee = models.ForeignKey(Employee, related_name="meetings", on_delete=models.CASCADE)
     start = models.DateTimeField(null=True, blank=True, default=None)
     end = models.DateTimeField(null=True, blank=True, default=None)
+    # Fingerprint of the dump file line, used by the incremental `loaddata`
+    fingerprint = models.CharField(max_length=32, blank=True, null=True, default=None)
+
+    class Meta:
+        indexes = [
+            # Covers the free time window lookup: employee_id = ? AND start < ? AND end > ?
+            models.Index(fields=['employee', 'start', 'end'], name='meeting_employee_start_end'),
+        ]
 
     def __str__(self):
         return f"{self.employee.name}: {self.start} - {self.end}"
 
     def get_time_frame(self):
         return f"{self.start} - {self.end}"
+
+
+class BusyInterval(models.Model):
+    """
+    Busy time of the employee - meetings merged into non-overlapping intervals.
+    Derived from meetings: rebuilt by `loaddata` and kept up to date by signals (see `free.busy`).
+
+     Xxxx--         Xxxxxxx--
+     --Xxxxx-  ->
+     ------Xx
+    """
+    employee = models.ForeignKey(Employee, related_name="busy_intervals", on_delete=models.CASCADE)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['employee', 'start', 'end'], name='busy_employee_start_end'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id}: {self.start} - {self.end}"
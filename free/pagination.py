@@ -0,0 +1,21 @@
+from rest_framework.pagination import CursorPagination
+
+from freebusy.settings import LIST_MAX_PAGE_SIZE, LIST_PAGE_SIZE
+
+
+class MeetingCursorPagination(CursorPagination):
+    """
+    Pages of meetings ordered by (start, id). The cursor keeps working while new meetings are added.
+    The start is a part of the cursor, so meetings without the start are not listed.
+    """
+    ordering = ('start', 'id')
+    page_size = LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = LIST_MAX_PAGE_SIZE
+
+
+class EmployeeCursorPagination(CursorPagination):
+    ordering = ('id',)
+    page_size = LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = LIST_MAX_PAGE_SIZE
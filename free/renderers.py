@@ -0,0 +1,56 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline delimited JSON - one object per line. Lists are streamed by `StreamingListMixin`,
+    the renderer is used only for other responses (ex. errors).
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(ndjson_line(row) for row in rows).encode()
+
+
+def ndjson_line(row):
+    return json.dumps(row, cls=JSONEncoder, separators=(',', ':')) + '\n'
+
+
+class EpochMinutesRenderer(JSONRenderer):
+    """
+    Free time slots as minutes since the Unix epoch (`?format=epoch`).
+    """
+    media_type = 'application/vnd.freebusy.epoch+json'
+    format = 'epoch'
+
+
+class SlotRangesRenderer(JSONRenderer):
+    """
+    Free time slots as `[first, amount]` runs of consecutive slots (`?format=ranges`).
+    """
+    media_type = 'application/vnd.freebusy.ranges+json'
+    format = 'ranges'
+
+
+FREE_TIME_RENDERERS = (EpochMinutesRenderer, SlotRangesRenderer)
+
+
+def get_free_time_renderer(request):
+    """
+    Compact renderer of free time slots requested by `?format=` or the `Accept` header (for plain Django views),
+    None for the default text encoding.
+    """
+    format_param = request.GET.get('format')
+    accept = request.headers.get('Accept', '')
+    for renderer in FREE_TIME_RENDERERS:
+        if format_param == renderer.format or (format_param is None and renderer.media_type in accept):
+            return renderer
+    return None
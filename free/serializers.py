@@ -1,10 +1,35 @@
-from datetime import datetime, timedelta
+import logging
+from datetime import timedelta
+from itertools import islice
 
 from rest_framework import serializers
 
+from free.cache import busy_calendar_cache, busy_intervals_between, busy_minutes_between
+from free import timing
 from free.models import Employee, Meeting
-from free.utils import parser
-from freebusy.settings import DATETIME_FORMAT_RESPONSE
+from free.utils import engines, minutes, parser, slots
+from freebusy.settings import DATETIME_FORMAT_RESPONSE, FREE_TIME_BATCH_MAX_QUERIES, FREE_TIME_ENGINE
+
+logger = logging.getLogger(__name__)
+
+
+class FieldsSelectionMixin:
+    """
+    Only fields listed by the `?fields=` parameter (comma separated) are serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request.query_params.get('fields') if request is not None else None
+        if not fields:
+            return
+        selected = set(fields.split(','))
+        unknown = selected - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        for field_name in set(self.fields) - selected:
+            self.fields.pop(field_name)
 
 
 class EmployeeSerializer(serializers.ModelSerializer):
@@ -14,81 +39,262 @@ class EmployeeSerializer(serializers.ModelSerializer):
 
 
 class MeetingSerializer(serializers.ModelSerializer):
-    employee = EmployeeSerializer()
+    employee = EmployeeSerializer(read_only=True)
+    # New meetings refer to the employee by the external id
+    employee_id = serializers.SlugRelatedField(source='employee', slug_field='external_id',
+                                               queryset=Employee.objects.all(), write_only=True)
 
     class Meta:
         model = Meeting
-        fields = ("employee", "start", "end")
+        fields = ("employee", "employee_id", "start", "end")
+        # Meetings without time are not busy time and can not be listed (see `MeetingCursorPagination`)
+        extra_kwargs = {'start': {'required': True, 'allow_null': False},
+                        'end': {'required': True, 'allow_null': False}}
+
+    def validate(self, attrs):
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError({'end': "The end must be after the start."})
+        return attrs
+
+
+class EmployeeListSerializer(FieldsSelectionMixin, EmployeeSerializer):
+    pass
+
+
+class MeetingListSerializer(FieldsSelectionMixin, MeetingSerializer):
+    pass
 
 
 class ResponseFreeTimeSerializer(serializers.Serializer):
+    """
+    Free time slots are formatted by the fast path (`parser.get_datetime_texts`), not field by field.
+    Compact encodings are selected by `encoding` in the context (see `free.renderers`):
+
+     text:    {"freetimes": ["2/14/2015 2:00:00 PM", "2/14/2015 2:30:00 PM", "2/15/2015 8:00:00 AM"]}
+     epoch:   {"freetimes": [23732040, 23732070, 23733120]}           minutes since the Unix epoch
+     ranges:  {"freetimes": [[23732040, 2], [23733120, 1]], "step": 30}  [first, amount] of consecutive slots
+    """
+    TEXT = 'text'
+    EPOCH = 'epoch'
+    RANGES = 'ranges'
+
     freetimes = serializers.ListField(child=serializers.DateTimeField(format=DATETIME_FORMAT_RESPONSE))
+    # Free participants of each free time slot (only for `min_free` queries)
+    counts = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def to_representation(self, instance):
+        encoding = self.context.get('encoding', self.TEXT)
+        counts = None if instance.counts is None else list(instance.counts)
+        if encoding == self.EPOCH:
+            data = {'freetimes': parser.get_epoch_minutes(instance.freetimes)}
+        elif encoding == self.RANGES:
+            step = self.context.get('shortest_time_slot', 30)
+            ranges, counts = slots.slot_ranges(parser.get_epoch_minutes(instance.freetimes), step, counts)
+            data = {'freetimes': ranges, 'step': step}
+        else:
+            data = {'freetimes': parser.get_datetime_texts(instance.freetimes)}
+        if counts is not None:
+            data['counts'] = counts
+        return data
+
+
+def get_non_negative_integer(value):
+    number = int(value)
+    if number < 0:
+        raise ValueError(f"{number} is negative")
+    return number
+
+
+def get_positive_integer(value):
+    number = int(value)
+    if number < 1:
+        raise ValueError(f"{number} is not positive")
+    return number
+
+
+def get_external_ids(employee_ids):
+    """
+    Comma separated text (query params) or a list (JSON) of text or numeric ids. External ids are text.
+    """
+    if isinstance(employee_ids, str):
+        return employee_ids.split(",")
+    if not isinstance(employee_ids, list):
+        raise ValueError("employee ids are not a list")
+    if not all(isinstance(external_id, (str, int)) and not isinstance(external_id, bool)
+               for external_id in employee_ids):
+        raise ValueError("employee id is not a scalar")
+    return [str(external_id) for external_id in employee_ids]
 
 
 class FreeTimes:
 
-    def __init__(self, freetimes):
+    def __init__(self, freetimes, counts=None):
         self.freetimes = freetimes
+        self.counts = counts
 
 
 class RequestFreeTimeSerializer:
+    ASCENDING = 'asc'
+    DESCENDING = 'desc'
+    # Expected formats of fields, reported for invalid values
+    FIELD_ERRORS = {
+        'duration': 'expected minutes, ex. "60"',
+        'earliest_start': 'expected "M/D/YYYY h:mm:ss AM"',
+        'latest_start': 'expected "M/D/YYYY h:mm:ss AM"',
+        'office_hours': 'expected "H[:MM]-H[:MM]" between 0:00 and 24:00',
+        'employee_ids': 'expected comma separated ids or a list of ids',
+        'limit': 'expected a positive integer',
+        'order': f'expected "{ASCENDING}" or "{DESCENDING}"',
+        'min_free': 'expected a positive integer',
+    }
 
-    def __init__(self, data, shortest_time_slot=30):
+    def __init__(self, data, shortest_time_slot=30, engine=FREE_TIME_ENGINE, timer=timing.NULL_TIMER):
         self.data = data
         self.shortest_time_slot = shortest_time_slot
+        self.engine = engine
+        # Durations of the stages (see `free.timing`)
+        self.timer = timer
         self.meeting_length = None
         self.earliest_start = None
         self.latest_start = None
-        self.start_office_hour = None
-        self.end_office_hour = None
+        # End of the latest possible meeting - meetings starting before it can overlap a free time slot
+        self.latest_end = None
+        self.start_office_minutes = None
+        self.end_office_minutes = None
         self.external_ids = None
+        self.limit = None
+        self.order = self.ASCENDING
+        self.min_free = None
+        self.error = None
 
     def is_valid(self):
+        with self.timer.stage(timing.VALIDATE):
+            return self._is_valid()
+
+    def _is_valid(self):
         try:
-            self.meeting_length = int(self.data.get('duration'))
-            self.earliest_start = parser.get_datetime(self.data.get('earliest_start'))
-            self.latest_start = parser.get_datetime(self.data.get('latest_start'))
-            self.start_office_hour, self.end_office_hour = parser.get_start_end_hours(self.data.get('office_hours'))
-            self.external_ids = self.data.get('employee_ids').split(",")
-        except:
+            self.meeting_length = self._field('duration', get_non_negative_integer)
+            self.earliest_start = self._field('earliest_start', parser.get_datetime)
+            self.latest_start = self._field('latest_start', parser.get_datetime)
+            # Zero length meeting still needs its start minute to be free
+            self.latest_end = self.latest_start + timedelta(minutes=max(self.meeting_length, 1))
+            self.start_office_minutes, self.end_office_minutes = \
+                self._field('office_hours', parser.get_start_end_minutes)
+            self.external_ids = self._field('employee_ids', get_external_ids)
+            # Optional - only the first `limit` free time slots (earliest or latest ones)
+            self.limit = self._field('limit', get_positive_integer, optional=True)
+            self.order = self._field('order', self._get_order, optional=True) or self.ASCENDING
+            # Optional - slots when at least `min_free` of the employees are free
+            self.min_free = self._field('min_free', get_positive_integer, optional=True)
+        except Exception as e:
+            self.error = str(e)
             return False
         return True
 
-    def get_freetimes(self):
-        employees_meetings = self._employees_meetings()
-
-        free_times_slots = set()
-        possible_start_times = self._possible_start_times()
-        for possible_time_slot in possible_start_times:
-            possible_start = possible_time_slot
-            possible_end = possible_start + timedelta(minutes=self.meeting_length)
-            valid = True
-            for meeting in employees_meetings:
-                meeting_start = meeting.start
-                meeting_end = meeting.end
-                if meeting_start <= possible_start < meeting_end:
-                    """
-                    Possible free time slot is placed in meeting
-                     ---XxYyxx--- or ---XxYy--- or ---XxYyPp---
-                     y = p & x
-                    """
-                    valid = False
-                    break
-                if possible_start <= meeting_start < possible_end:
-                    """
-                    Possible free time slot starts before and ends during the meeting.
-                     ---PpYyx--- or ---Ppp---
-                     y = p & x
-                    """
-                    valid = False
-                    break
-
-            if valid:
-                free_times_slots.add(possible_time_slot)
-
-        free_times_list = sorted(list(free_times_slots))
+    def _field(self, name, parse, optional=False):
+        """
+        Parsed value of the field. Errors are reported by the field name and its expected format.
+        """
+        value = self.data.get(name)
+        if optional and value in (None, ''):
+            return None
+        try:
+            return parse(value)
+        except Exception:
+            raise ValueError(f"{name}: {self.FIELD_ERRORS[name]}") from None
+
+    def _get_order(self, order):
+        if order not in (self.ASCENDING, self.DESCENDING):
+            raise ValueError(order)
+        return order
+
+    def get_freetimes(self, calendars=None, possible_start_times=None):
+        """
+        Calendars (busy intervals by employee) and possible start times can be given
+        when they are already known (batch of queries, async view).
+        """
+        if calendars is None:
+            with self.timer.stage(timing.DB):
+                calendars = busy_calendar_cache.calendars(self.external_ids, self.earliest_start, self.latest_end)
+        employees_calendars = [calendars[external_id] for external_id in set(self.external_ids)]
+        if self.searches_minutes():
+            return self._minutes_freetimes(employees_calendars)
+        if self.min_free is not None:
+            return self._counted_freetimes(employees_calendars, possible_start_times)
+        busy_intervals = busy_intervals_between(employees_calendars, self.earliest_start, self.latest_end)
+        if self.limit is not None or self.order == self.DESCENDING:
+            # Start times are generated lazily during the search
+            with self.timer.stage(timing.SEARCH):
+                return FreeTimes(self._first_freetimes(busy_intervals, possible_start_times))
+        if possible_start_times is None:
+            possible_start_times = self._possible_start_times()
+        find_freetimes = engines.get_engine(self.engine)
+        with self.timer.stage(timing.SEARCH):
+            free_times_list = find_freetimes(possible_start_times, busy_intervals,
+                                             self.meeting_length, self.shortest_time_slot)
         return FreeTimes(free_times_list)
 
+    def searches_minutes(self):
+        """
+        All free time slots by the sweep line are searched on minutes (integers) instead of datetimes -
+        possible start times are then computed from the earliest start, which must be at a whole minute.
+        Busy intervals with seconds are rounded to minutes (see `BusyCalendar.minutes`), they still overlap
+        exactly the same slots.
+        """
+        return (self.engine == 'sweep' and self.min_free is None and self.limit is None
+                and self.order == self.ASCENDING and minutes.is_whole_minute(self.earliest_start))
+
+    def _minutes_freetimes(self, employees_calendars):
+        with self.timer.stage(timing.SLOTS):
+            possible_start_minutes = slots.possible_start_minutes(self.earliest_start, self.latest_start,
+                                                                  self.meeting_length, self.start_office_minutes,
+                                                                  self.end_office_minutes, self.shortest_time_slot)
+        with self.timer.stage(timing.SEARCH):
+            busy_minutes = busy_minutes_between(employees_calendars, self.earliest_start, self.latest_end,
+                                                round_starts_up=self.meeting_length == 0)
+            free_minutes = engines.sweep_line_minutes(possible_start_minutes, busy_minutes, self.meeting_length)
+        return FreeTimes(minutes.get_datetimes(free_minutes))
+
+    def _first_freetimes(self, busy_intervals, possible_start_times=None):
+        """
+        Possible start times are generated and checked lazily in the requested order,
+        so it stops as soon as `limit` free time slots are found.
+        """
+        reverse = self.order == self.DESCENDING
+        if possible_start_times is None:
+            possible_start_times = slots.iter_possible_start_times(self.earliest_start, self.latest_start,
+                                                                   self.meeting_length, self.start_office_minutes,
+                                                                   self.end_office_minutes, self.shortest_time_slot,
+                                                                   reverse=reverse)
+        elif reverse:
+            possible_start_times = reversed(possible_start_times)
+        free_times = engines.iter_sweep_line_freetimes(possible_start_times, busy_intervals, self.meeting_length,
+                                                       reverse=reverse)
+        return list(islice(free_times, self.limit))
+
+    def _counted_freetimes(self, employees_calendars, possible_start_times=None):
+        """
+        Free time slots of at least `min_free` employees, with the amount of free employees.
+        """
+        if possible_start_times is None:
+            possible_start_times = self._possible_start_times()
+        participants_busy_intervals = (busy_intervals_between([calendar], self.earliest_start, self.latest_end)
+                                       for calendar in employees_calendars)
+        with self.timer.stage(timing.SEARCH):
+            counted = engines.counting_freetimes(possible_start_times, participants_busy_intervals,
+                                                 self.meeting_length, self.shortest_time_slot, self.min_free)
+        if self.order == self.DESCENDING:
+            counted.reverse()
+        counted = counted[:self.limit]
+        return FreeTimes([free_time for free_time, _ in counted], [free for _, free in counted])
+
+    def slots_key(self):
+        """
+        Queries with the same key have the same possible start times.
+        """
+        return (self.earliest_start, self.latest_start, self.meeting_length,
+                self.start_office_minutes, self.end_office_minutes, self.shortest_time_slot)
+
     def _employees_meetings(self):
         """
         'x' = meeting 30 min (`X` - meeting start)
@@ -99,12 +305,14 @@ class RequestFreeTimeSerializer:
 
         In the example above, three meeting should be taken into a consideration
         between earliest_start and latest_start time frames.
+        Meetings starting before `latest_end` are selected - the meeting starting at latest_start
+        must not overlap them either.
         Meetings can be spread over several days.
         Meetings are orederd by start time.
         """
 
         return Meeting.objects.filter(employee__external_id__in=self.external_ids,
-                                      start__lt=self.latest_start,
+                                      start__lt=self.latest_end,
                                       end__gt=self.earliest_start).order_by('start')
 
     def _possible_start_times(self):
@@ -112,19 +320,70 @@ class RequestFreeTimeSerializer:
         Get possible start times between earliest and latest start time and duration.
         Also considering the working hours.
         """
-        meeting_slots_set = set()
-        duration = timedelta(minutes=self.meeting_length)
-        meeting_step_unit = timedelta(minutes=self.shortest_time_slot)
-        meeting_slot_start = self.earliest_start
-        meeting_slot_end = meeting_slot_start + duration
-        while self.latest_start >= meeting_slot_start:
-            if self.start_office_hour <= meeting_slot_start.hour < self.end_office_hour \
-                    and meeting_slot_end <= datetime(meeting_slot_start.year,
-                                                     meeting_slot_start.month,
-                                                     meeting_slot_start.day,
-                                                     self.end_office_hour, 0):  # office_end_minutes (was not required)
-                meeting_slots_set.add(meeting_slot_start)
-            meeting_slot_start = meeting_slot_start + meeting_step_unit
-            meeting_slot_end = meeting_slot_start + duration
-
-        return sorted(list(meeting_slots_set))
+        with self.timer.stage(timing.SLOTS):
+            return list(slots.possible_start_times(self.earliest_start, self.latest_start, self.meeting_length,
+                                                   self.start_office_minutes, self.end_office_minutes,
+                                                   self.shortest_time_slot))
+
+
+class RequestBatchFreeTimeSerializer:
+    """
+    Many free time queries answered together. Meetings of all involved employees are loaded
+    with (at most) one query and possible start times are computed once for queries with the same window.
+    Invalid queries are reported in their results, they do not fail the whole batch.
+    """
+
+    def __init__(self, data, shortest_time_slot=30, engine=FREE_TIME_ENGINE,
+                 max_queries=FREE_TIME_BATCH_MAX_QUERIES, timer=timing.NULL_TIMER):
+        self.data = data
+        self.shortest_time_slot = shortest_time_slot
+        self.engine = engine
+        self.max_queries = max_queries
+        self.timer = timer
+        self.queries = None
+
+    def is_valid(self):
+        queries = self.data.get('queries') if hasattr(self.data, 'get') else self.data
+        if not isinstance(queries, list) or len(queries) > self.max_queries:
+            return False
+        self.queries = [RequestFreeTimeSerializer(query if isinstance(query, dict) else {},
+                                                  self.shortest_time_slot, self.engine, self.timer)
+                        for query in queries]
+        return True
+
+    def get_results(self):
+        """
+        `FreeTimes` of valid queries and error texts of invalid ones, in the order of queries.
+        """
+        valid = [query.is_valid() for query in self.queries]
+        valid_queries = [query for query, query_valid in zip(self.queries, valid) if query_valid]
+        calendars = {}
+        if valid_queries:
+            external_ids = set().union(*(query.external_ids for query in valid_queries))
+            with self.timer.stage(timing.DB):
+                calendars = busy_calendar_cache.calendars(external_ids,
+                                                          min(query.earliest_start for query in valid_queries),
+                                                          max(query.latest_end for query in valid_queries))
+        possible_start_times = {}
+        results = []
+        for query, query_valid in zip(self.queries, valid):
+            if not query_valid:
+                results.append(query.error)
+                continue
+            try:
+                results.append(self._get_freetimes(query, calendars, possible_start_times))
+            except Exception:
+                # One failing query does not fail the whole batch
+                logger.exception("Free time query %s of the batch failed", query.data)
+                results.append("free time search failed")
+        return results
+
+    @staticmethod
+    def _get_freetimes(query, calendars, possible_start_times):
+        if query.searches_minutes():
+            # Possible start minutes are cached by `slots.possible_start_minutes`
+            return query.get_freetimes(calendars)
+        slots_key = query.slots_key()
+        if slots_key not in possible_start_times:
+            possible_start_times[slots_key] = query._possible_start_times()
+        return query.get_freetimes(calendars, possible_start_times[slots_key])
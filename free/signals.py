@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from free import busy
+from free.cache import busy_calendar_cache
+from free.models import Employee, Meeting
+
+
+@receiver(pre_save, sender=Meeting)
+def remember_meeting_time(sender, instance, **kwargs):
+    """
+    Previous time of the updated meeting - only its busy interval is merged again.
+    """
+    if instance.pk is None:
+        return
+    instance._previous_time = Meeting.objects.filter(pk=instance.pk).values_list('employee_id', 'start', 'end').first()
+
+
+@receiver(post_save, sender=Meeting)
+def update_busy_intervals(sender, instance, created, **kwargs):
+    """
+    Busy intervals are updated before the calendar cache is invalidated (receivers are called in order).
+    """
+    previous_time = instance.__dict__.get('_previous_time')
+    if busy.maintenance_paused():
+        busy.mark_changed(instance.employee_id, previous_time and previous_time[0])
+        return
+    if previous_time is not None:
+        busy.remove_meeting(*previous_time)
+    busy.add_meeting(instance)
+
+
+@receiver(post_delete, sender=Meeting)
+def remove_busy_intervals(sender, instance, origin=None, **kwargs):
+    if busy.maintenance_paused():
+        busy.mark_changed(instance.employee_id)
+        return
+    busy.remove_deleted_meeting(instance, origin)
+
+
+@receiver(post_save, sender=Meeting)
+@receiver(post_delete, sender=Meeting)
+def invalidate_employee_calendar(sender, instance, origin=None, **kwargs):
+    """
+    Bulk writes (busy intervals maintenance is paused) bump the generation when they are done,
+    so do deletes of employees.
+    """
+    previous_time = instance.__dict__.pop('_previous_time', None)
+    if busy.maintenance_paused() or busy.deleted_with_employee(origin):
+        return
+    busy_calendar_cache.invalidate(busy_calendar_cache.external_id(instance.employee_id))
+    if previous_time is not None and previous_time[0] != instance.employee_id:
+        busy_calendar_cache.invalidate(busy_calendar_cache.external_id(previous_time[0]))
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def invalidate_calendars(sender, instance, **kwargs):
+    """
+    External id of the employee might be changed, so calendars are dropped in all processes - in other ones
+    when the change is committed, they would cache the previous data otherwise. Bulk writes (busy intervals
+    maintenance is paused) bump the generation once, when they are done.
+    """
+    if busy.maintenance_paused():
+        return
+    busy_calendar_cache.clear()
+    transaction.on_commit(busy_calendar_cache.bump_generation)
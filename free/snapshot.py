@@ -0,0 +1,134 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from free.models import BusyInterval, Employee
+from free.utils.minutes import BusyCalendar, get_microseconds
+
+MAGIC = b'FBSNAP03'
+# magic, cache generation (-1 - none), size of the invalidations log at the export, employees, intervals,
+# size of the external ids blob
+HEADER = struct.Struct('<8sqqIII')
+
+
+def write_snapshot(file_name, generation=None, invalidations_position=0, batch_size=2000):
+    """
+    Busy intervals of all employees (see `free.busy`) in the columnar binary file, written atomically:
+
+     header   | offsets                 | starts           | ends             | external ids
+     magic ..   uint32 x (employees + 1)  int64 x intervals  int64 x intervals  utf-8, '\n' separated
+
+    Employees are sorted by the external id. Intervals of the i-th employee are `offsets[i]:offsets[i + 1]`,
+    sorted by start, as microseconds since the Unix epoch (little endian). Returns (employees, intervals) amounts.
+    Employees invalidated after `invalidations_position` of the invalidations log (see `free.cache`)
+    might be outdated in the snapshot.
+    """
+    employees = dict(Employee.objects.exclude(external_id__isnull=True).values_list('id', 'external_id'))
+    external_ids = sorted(employees.values())
+    calendars = {external_id: BusyCalendar() for external_id in external_ids}
+    busy_intervals = BusyInterval.objects.order_by('employee_id', 'start').values_list('employee_id', 'start', 'end')
+    for employee_id, start, end in busy_intervals.iterator(chunk_size=batch_size):
+        external_id = employees.get(employee_id)
+        if external_id is not None:
+            calendars[external_id].append(start, end)
+
+    offsets = array('I', [0])
+    all_starts = array('q')
+    all_ends = array('q')
+    for external_id in external_ids:
+        calendar = calendars[external_id]
+        offsets.append(offsets[-1] + len(calendar))
+        all_starts.extend(calendar.starts)
+        all_ends.extend(calendar.ends)
+    keys = '\n'.join(external_ids).encode()
+    if sys.byteorder == 'big':
+        for column in (offsets, all_starts, all_ends):
+            column.byteswap()
+
+    temporary_name = file_name + '.tmp'
+    with open(temporary_name, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, -1 if generation is None else generation, invalidations_position,
+                               len(external_ids), len(all_starts), len(keys)))
+        offsets.tofile(file)
+        all_starts.tofile(file)
+        all_ends.tofile(file)
+        file.write(keys)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_name, file_name)
+    return len(external_ids), len(all_starts)
+
+
+class BusySnapshot:
+    """
+    Read only, memory mapped snapshot of busy intervals (see `write_snapshot`). The file is shared
+    by all processes through the page cache, only the external ids index is built in each process.
+    """
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < HEADER.size or self.buffer[:len(MAGIC)] != MAGIC:
+            self.buffer.close()
+            raise ValueError(f"{file_name} is not a busy intervals snapshot")
+        _, generation, invalidations_position, employees, intervals, keys_size = HEADER.unpack_from(self.buffer)
+        if len(self.buffer) != HEADER.size + (employees + 1) * 4 + 2 * intervals * 8 + keys_size:
+            self.buffer.close()
+            raise ValueError(f"{file_name} is truncated")
+        self.generation = None if generation < 0 else generation
+        self.invalidations_position = invalidations_position
+        position = HEADER.size
+        self.offsets = self._column('I', position, employees + 1)
+        position += (employees + 1) * 4
+        self.starts = self._column('q', position, intervals)
+        position += intervals * 8
+        self.ends = self._column('q', position, intervals)
+        position += intervals * 8
+        keys = self.buffer[position:position + keys_size].decode()
+        self.index = {external_id: i for i, external_id in enumerate(keys.split('\n'))} if employees else {}
+
+    def _column(self, typecode, position, amount):
+        view = memoryview(self.buffer)[position:position + amount * array(typecode).itemsize]
+        if sys.byteorder == 'big':
+            column = array(typecode, view)
+            column.byteswap()
+            return column
+        return view.cast(typecode)
+
+    def __contains__(self, external_id):
+        return external_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def columns(self, external_id, earliest_start=None, latest_end=None):
+        """
+        `(starts, ends)` columns of the employee, only intervals between earliest_start and latest_end
+        when the window is given. Nothing is copied.
+        """
+        i = self.index[external_id]
+        first, last = self.offsets[i], self.offsets[i + 1]
+        if earliest_start is not None and latest_end is not None:
+            # Intervals are disjoint, so ends are sorted as well.
+            last = bisect_left(self.starts, get_microseconds(latest_end), first, last)
+            first = bisect_right(self.ends, get_microseconds(earliest_start), first, last)
+        return self.starts[first:last], self.ends[first:last]
+
+    def calendar(self, external_id, earliest_start=None, latest_end=None):
+        """
+        Busy intervals of the employee - the same as the cache holds. Columns are copied as they are.
+        """
+        starts, ends = self.columns(external_id, earliest_start, latest_end)
+        calendar = BusyCalendar()
+        calendar.starts.frombytes(starts.tobytes())
+        calendar.ends.frombytes(ends.tobytes())
+        return calendar
+
+    def close(self):
+        for column in (self.offsets, self.starts, self.ends):
+            if isinstance(column, memoryview):
+                column.release()
+        self.buffer.close()
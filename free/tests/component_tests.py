@@ -1,11 +1,21 @@
 import datetime
+import gzip
+import io
+import lzma
+import os
+import random
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
 
-from free.models import Employee, Meeting
-from free.serializers import RequestFreeTimeSerializer
+from free.cache import BusyCalendarCache, busy_calendar_cache
+from free import benchmarks, busy, snapshot
+from free.models import BusyInterval, Employee, Meeting
+from free.serializers import FreeTimes, RequestBatchFreeTimeSerializer, RequestFreeTimeSerializer
 from free.tests import utils
 from free.tests.utils import create_meeting_frames
+from free.utils import download, engines, synthetic
 
 
 @pytest.mark.django_db
@@ -188,3 +198,782 @@ def test_whole_working_day_time_slot():
     assert time_slots == [datetime.datetime(2023, 2, 13, 8, 0),
                           datetime.datetime(2023, 2, 13, 8, 30),
                           datetime.datetime(2023, 2, 13, 9, 0)]
+
+
+def test_possible_start_times_with_office_hours_minutes():
+    year, month, day = 2023, 2, 13
+    params = utils.request_free_time_data(
+        [],
+        earliest=datetime.datetime(year, month, day, 7, 0),
+        latest=datetime.datetime(year, month, day, 9, 0) + datetime.timedelta(days=1),
+        duration=60 * 9,
+        office_hours='7:30-17:30'
+    )
+
+    free_times_query = RequestFreeTimeSerializer(data=params)
+    assert free_times_query.is_valid()
+
+    time_slots = free_times_query._possible_start_times()
+
+    assert time_slots == [datetime.datetime(year, month, day, 7, 30),
+                          datetime.datetime(year, month, day, 8, 0),
+                          datetime.datetime(year, month, day, 8, 30),
+                          datetime.datetime(year, month, day, 7, 30) + datetime.timedelta(days=1),
+                          datetime.datetime(year, month, day, 8, 0) + datetime.timedelta(days=1),
+                          datetime.datetime(year, month, day, 8, 30) + datetime.timedelta(days=1)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('second_start_minute', [30, 45])
+def test_freetimes_at_latest_start_with_meeting_after_latest_start(set_up, second_start_minute):
+    """
+    Free time slot starting at the latest start ends after it:
+
+       12   13   14   15   16
+     ------Xxxxxxx|Xxxxx---      latest start 14:30, duration 60
+                  ^ busy, whether the meetings touch (14:30) or not (14:45)
+    """
+    busy_calendar_cache.clear()
+    employee = Employee.objects.first()
+    year, month, day = 2023, 2, 13
+    Meeting.objects.create(employee=employee, start=datetime.datetime(year, month, day, 13, 0),
+                           end=datetime.datetime(year, month, day, 14, 30))
+    Meeting.objects.create(employee=employee, start=datetime.datetime(year, month, day, 14, second_start_minute),
+                           end=datetime.datetime(year, month, day, 15, 30))
+    params = utils.request_free_time_data([employee],
+                                          datetime.datetime(year, month, day, 12, 0),
+                                          datetime.datetime(year, month, day, 14, 30))
+    for engine in ('nested_loop', 'bitmap', 'sweep'):
+        free_times_query = RequestFreeTimeSerializer(data=params, engine=engine)
+        assert free_times_query.is_valid()
+        assert free_times_query.get_freetimes().freetimes == [datetime.datetime(year, month, day, 12, 0)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('earliest_second', [0, 30])
+def test_freetimes_with_seconds(set_up, earliest_second):
+    """
+    Busy time is not extended to whole minutes - the slot right after the meeting ending at 9:00:10 is free:
+
+         8:30      9:00:10
+     ----Xxxxxxxxxx|---------      slots 8:00:30 and 8:30:30 are busy, 9:00:30 is free (duration 30)
+    """
+    employee = Employee.objects.first()
+    year, month, day = 2023, 2, 13
+    Meeting.objects.create(employee=employee, start=datetime.datetime(year, month, day, 8, 30),
+                           end=datetime.datetime(year, month, day, 9, 0, 10))
+    params = utils.request_free_time_data([employee],
+                                          datetime.datetime(year, month, day, 8, 0, earliest_second),
+                                          datetime.datetime(year, month, day, 12, 0),
+                                          duration=30, office_hours='0-24')
+    expected = [datetime.datetime(year, month, day, 9, 0, 30), datetime.datetime(year, month, day, 9, 30, 30)] \
+        if earliest_second else [datetime.datetime(year, month, day, 8, 0), datetime.datetime(year, month, day, 9, 30)]
+    for engine in ('nested_loop', 'bitmap', 'sweep'):
+        free_times_query = RequestFreeTimeSerializer(data=params, engine=engine)
+        assert free_times_query.is_valid()
+        assert free_times_query.get_freetimes().freetimes[:2] == expected
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('max_intervals', [0, 10000])
+@pytest.mark.parametrize('seconds', [0, 60])
+def test_freetimes_equal_nested_loop_over_meetings(set_up, monkeypatch, max_intervals, seconds):
+    """
+    Free time slots from the (merged) busy intervals equal the reference search over the meetings themselves.
+    Meetings often touch or overlap each other. Meetings and queries have random seconds when `seconds` is given.
+    """
+    monkeypatch.setattr(busy_calendar_cache, 'max_intervals', max_intervals)
+    busy_calendar_cache.clear()
+    rnd = random.Random(max_intervals + seconds)
+
+    def random_seconds():
+        return datetime.timedelta(seconds=rnd.randrange(seconds)) if seconds and rnd.random() < 0.5 \
+            else datetime.timedelta()
+
+    employees = list(Employee.objects.all()[:3])
+    day = datetime.datetime(2023, 2, 13)
+    for employee in employees:
+        for _ in range(40):
+            start = day + datetime.timedelta(minutes=rnd.randrange(0, 3 * 24 * 60, 15)) + random_seconds()
+            end = start + datetime.timedelta(minutes=rnd.choice([15, 30, 45, 60, 90])) + random_seconds()
+            Meeting.objects.create(employee=employee, start=start, end=end)
+
+    for _ in range(60):
+        earliest_start = day + datetime.timedelta(minutes=rnd.randrange(0, 2 * 24 * 60, 30)) + random_seconds()
+        latest_start = earliest_start + datetime.timedelta(minutes=rnd.randrange(0, 24 * 60, 30))
+        query_employees = rnd.sample(employees, rnd.randrange(1, len(employees) + 1))
+        params = utils.request_free_time_data(query_employees, earliest_start, latest_start,
+                                              duration=rnd.choice([0, 30, 60, 90]), office_hours='0-24')
+        reference_query = RequestFreeTimeSerializer(data=params)
+        assert reference_query.is_valid()
+        meetings = [(meeting.start, meeting.end) for meeting in reference_query._employees_meetings()]
+        expected = engines.nested_loop_freetimes(reference_query._possible_start_times(), meetings,
+                                                 reference_query.meeting_length)
+
+        for engine in ('nested_loop', 'bitmap', 'sweep'):
+            free_times_query = RequestFreeTimeSerializer(data=params, engine=engine)
+            free_times_query.is_valid()
+            assert free_times_query.get_freetimes().freetimes == expected
+        for extra, expected_freetimes in (({'limit': 3}, expected[:3]),
+                                          ({'order': 'desc'}, expected[::-1]),
+                                          ({'min_free': len(query_employees)}, expected)):
+            free_times_query = RequestFreeTimeSerializer(data=dict(params, **extra))
+            free_times_query.is_valid()
+            assert free_times_query.get_freetimes().freetimes == expected_freetimes
+
+
+@pytest.mark.django_db
+def test_freetimes_engines_return_the_same_results(set_up):
+    employees = Employee.objects.all()
+    year, month, day = 2023, 2, 13
+    for hour, employee in zip([8, 9, 11, 13, 14], employees):
+        start, end = create_meeting_frames(year, month, day, hour, 30, hour + 1, 0)
+        Meeting.objects.create(employee=employee, start=start, end=end)
+
+    params = utils.request_free_time_data(employees,
+                                          datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year, month, day, 16, 0),
+                                          duration=60)
+
+    reference_query = RequestFreeTimeSerializer(data=params, engine='nested_loop')
+    reference_query.is_valid()
+    free_times_query = RequestFreeTimeSerializer(data=params)
+    free_times_query.is_valid()
+    assert free_times_query.searches_minutes() and not reference_query.searches_minutes()
+
+    assert free_times_query.get_freetimes().freetimes == reference_query.get_freetimes().freetimes
+    assert free_times_query.get_freetimes().freetimes == [datetime.datetime(year, month, day, 10, 0),
+                                                          datetime.datetime(year, month, day, 10, 30),
+                                                          datetime.datetime(year, month, day, 12, 0),
+                                                          datetime.datetime(year, month, day, 12, 30),
+                                                          datetime.datetime(year, month, day, 15, 0),
+                                                          datetime.datetime(year, month, day, 15, 30),
+                                                          datetime.datetime(year, month, day, 16, 0)]
+
+
+@pytest.mark.django_db
+def test_busy_calendar_cache_hit_does_not_query_database(set_up, django_assert_num_queries):
+    employee = Employee.objects.first()
+    year, month, day = 2023, 2, 13
+    earliest, latest = datetime.datetime(year, month, day, 8, 0), datetime.datetime(year, month, day, 17, 0)
+    start, end = create_meeting_frames(year, month, day, 9, 0, 10, 0)
+    Meeting.objects.create(employee=employee, start=start, end=end)
+
+    cache = BusyCalendarCache(max_intervals=100, generation_file=None)
+    assert cache.busy_intervals([employee.external_id], earliest, latest) == [(start, end)]
+    with django_assert_num_queries(0):
+        assert cache.busy_intervals([employee.external_id], earliest, latest) == [(start, end)]
+        assert cache.busy_intervals([employee.external_id], earliest, start) == []
+
+
+@pytest.mark.django_db
+def test_free_times_cache_is_invalidated_by_signals(set_up):
+    employee = Employee.objects.first()
+    year, month, day = 2023, 2, 13
+    params = utils.request_free_time_data([employee],
+                                          datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year, month, day, 9, 0))
+    free_times_query = RequestFreeTimeSerializer(data=params)
+    free_times_query.is_valid()
+    assert len(free_times_query.get_freetimes().freetimes) == 3
+
+    start, end = create_meeting_frames(year, month, day, 8, 0, 10, 0)
+    meeting = Meeting.objects.create(employee=employee, start=start, end=end)
+    assert free_times_query.get_freetimes().freetimes == []
+
+    meeting.delete()
+    assert len(free_times_query.get_freetimes().freetimes) == 3
+
+
+@pytest.mark.django_db
+def test_busy_calendar_cache_evicts_least_recently_used(set_up):
+    employees = list(Employee.objects.all()[:3])
+    year, month, day = 2023, 2, 13
+    for employee in employees:
+        start, end = create_meeting_frames(year, month, day, 9, 0, 10, 0)
+        Meeting.objects.create(employee=employee, start=start, end=end)
+
+    cache = BusyCalendarCache(max_intervals=4, generation_file=None)
+    earliest, latest = datetime.datetime(year, month, day, 8, 0), datetime.datetime(year, month, day, 17, 0)
+    cache.busy_intervals([employees[0].external_id], earliest, latest)
+    cache.busy_intervals([employees[1].external_id], earliest, latest)
+    cache.busy_intervals([employees[0].external_id], earliest, latest)
+    cache.busy_intervals([employees[2].external_id], earliest, latest)
+
+    assert list(cache.entries) == [employees[0].external_id, employees[2].external_id]
+    assert cache.intervals_counter == 4
+
+
+@pytest.mark.django_db
+def test_busy_calendar_cache_generation_bump(set_up, tmp_path):
+    employee = Employee.objects.first()
+    generation_file = str(tmp_path / "generation")
+    cache = BusyCalendarCache(max_intervals=100, generation_file=generation_file)
+    other_process_cache = BusyCalendarCache(max_intervals=100, generation_file=generation_file)
+    earliest, latest = datetime.datetime(2023, 2, 13, 8, 0), datetime.datetime(2023, 2, 13, 17, 0)
+    cache.busy_intervals([employee.external_id], earliest, latest)
+    other_process_cache.busy_intervals([employee.external_id], earliest, latest)
+
+    cache.bump_generation()
+    assert not cache.entries
+
+    other_process_cache.busy_intervals([], earliest, latest)
+    assert not other_process_cache.entries
+
+    # Bumped again within the same timestamp tick of the file system
+    other_process_cache.busy_intervals([employee.external_id], earliest, latest)
+    mtime = os.stat(generation_file).st_mtime_ns
+    cache.bump_generation()
+    os.utime(generation_file, ns=(mtime, mtime))
+    other_process_cache.busy_intervals([], earliest, latest)
+    assert not other_process_cache.entries
+
+
+@pytest.mark.django_db
+def test_employee_changes_bump_generation_once_committed(tmp_path, django_capture_on_commit_callbacks):
+    generation = busy_calendar_cache.file_generation()
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        employee = Employee.objects.create(external_id='1', name='Employee')
+        employee.name = 'Renamed'
+        employee.save()
+        # Other processes keep the committed data
+        assert busy_calendar_cache.file_generation() == generation
+    assert len(callbacks) == 2
+    assert busy_calendar_cache.file_generation() > generation
+
+    # Loaded employees bump the generation once, when the data are loaded
+    generation = busy_calendar_cache.file_generation()
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        call_command('loaddata', file=utils.create_freebusy_file(tmp_path / "freebusy.txt"), verbose='No',
+                     stdout=io.StringIO())
+    assert Employee.objects.count() > 2
+    assert callbacks == []
+    assert busy_calendar_cache.file_generation() == generation + 1
+
+
+@pytest.mark.parametrize('max_intervals', [0, 100])
+@pytest.mark.django_db
+def test_busy_calendar_cache_invalidated_by_other_process(set_up, tmp_path, max_intervals,
+                                                          django_assert_max_num_queries):
+    employee1, employee2 = Employee.objects.all()[:2]
+    earliest, latest = datetime.datetime(2023, 2, 13, 8, 0), datetime.datetime(2023, 2, 13, 17, 0)
+    snapshot_file = str(tmp_path / "busy.snapshot")
+    snapshot.write_snapshot(snapshot_file, busy_calendar_cache.file_generation())
+    # Meetings are saved by this process (`busy_calendar_cache`), the other one reads the same files
+    other_process_cache = BusyCalendarCache(max_intervals=max_intervals,
+                                            generation_file=busy_calendar_cache.generation_file,
+                                            snapshot_file=snapshot_file)
+    assert other_process_cache.busy_intervals([employee1.external_id], earliest, latest) == []
+
+    start, end = create_meeting_frames(2023, 2, 13, 9, 0, 10, 0)
+    with django_assert_max_num_queries(6):
+        meeting = Meeting.objects.create(employee=employee1, start=start, end=end)
+    assert other_process_cache.busy_intervals([employee1.external_id], earliest, latest) == [(start, end)]
+    # Employee of the meeting is changed
+    meeting.employee = employee2
+    meeting.save()
+    assert other_process_cache.busy_intervals([employee1.external_id, employee2.external_id], earliest, latest) == \
+           [(start, end)]
+    assert other_process_cache.busy_intervals([employee1.external_id], earliest, latest) == []
+
+    employee2.external_id = 'renamed'
+    employee2.save()
+    assert other_process_cache.busy_intervals(['renamed'], earliest, latest) == [(start, end)]
+
+
+@pytest.mark.parametrize('max_intervals', [0, 1000])
+@pytest.mark.django_db
+def test_async_busy_intervals(set_up, max_intervals):
+    employees = list(Employee.objects.all())
+    year, month, day = 2023, 2, 13
+    for hour, employee in enumerate(employees, start=8):
+        start, end = create_meeting_frames(year, month, day, hour, 0, hour + 2, 0)
+        Meeting.objects.create(employee=employee, start=start, end=end)
+
+    cache = BusyCalendarCache(max_intervals, generation_file=None)
+    external_ids = [employee.external_id for employee in employees[1:]]
+    earliest, latest = datetime.datetime(year, month, day, 9, 30), datetime.datetime(year, month, day, 11, 0)
+    busy_intervals = async_to_sync(cache.abusy_intervals)(external_ids, earliest, latest)
+    assert busy_intervals == cache.busy_intervals(external_ids, earliest, latest)
+    assert [start.hour for start, end in busy_intervals] == [9, 10]
+    assert len(cache.entries) == (4 if max_intervals else 0)
+
+
+@pytest.mark.django_db
+def test_busy_intervals_without_cache(set_up):
+    employee = Employee.objects.first()
+    year, month, day = 2023, 2, 13
+    start, end = create_meeting_frames(year, month, day, 9, 0, 10, 0)
+    Meeting.objects.create(employee=employee, start=start, end=end)
+
+    cache = BusyCalendarCache(max_intervals=0, generation_file=None)
+    earliest, latest = datetime.datetime(year, month, day, 8, 0), datetime.datetime(year, month, day, 17, 0)
+    assert cache.busy_intervals([employee.external_id], earliest, latest) == [(start, end)]
+    assert cache.busy_intervals([employee.external_id], end, latest) == []
+    assert not cache.entries
+
+
+@pytest.mark.parametrize('max_intervals', [0, 1000])
+@pytest.mark.django_db
+def test_batch_free_time_loads_meetings_with_one_query(set_up, django_assert_num_queries, monkeypatch, max_intervals):
+    employees = list(Employee.objects.all())
+    year, month, day = 2023, 2, 13
+    for hour, employee in enumerate(employees, start=8):
+        start, end = create_meeting_frames(year, month, day, hour, 0, hour + 1, 0)
+        Meeting.objects.create(employee=employee, start=start, end=end)
+    monkeypatch.setattr('free.serializers.busy_calendar_cache', BusyCalendarCache(max_intervals, generation_file=None))
+
+    queries = [utils.request_free_time_data(employees[:amount],
+                                            datetime.datetime(year, month, day, 8, 0),
+                                            datetime.datetime(year, month, day + amount % 2, 16, 0))
+               for amount in range(1, len(employees) + 1)]
+    batch_query = RequestBatchFreeTimeSerializer(data={'queries': queries + [{'duration': 'x'}]})
+    assert batch_query.is_valid()
+    with django_assert_num_queries(1):
+        results = batch_query.get_results()
+
+    assert isinstance(results[-1], str)
+    for query, result in zip(queries, results):
+        free_times_query = RequestFreeTimeSerializer(data=query)
+        assert free_times_query.is_valid()
+        assert isinstance(result, FreeTimes)
+        assert result.freetimes == free_times_query.get_freetimes().freetimes
+
+
+@pytest.mark.parametrize('options', [{}, {'bulk': True}, {'bulk': True, 'batch_size': 1}, {'workers': 2}])
+@pytest.mark.django_db
+def test_loaddata(tmp_path, options):
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt")
+    stdout = io.StringIO()
+    call_command('loaddata', file=file_name, verbose='No', stdout=stdout, **options)
+    call_command('loaddata', file=file_name, verbose='Yes', stdout=stdout, **options)
+
+    output = stdout.getvalue()
+    assert '6:ERROR:START >= END:' in output
+    assert '7:ERROR:employee VALIDATION:' in output
+    assert '8:ERROR:EMPLOYEE DOES NOT EXISTS:' in output
+    assert '9:ERROR:TRASH:' in output
+    assert '10:ERROR:TRASH:' in output
+    assert '2:ALREADY LOADED:Faye Moody' in output
+
+    assert sorted(Employee.objects.values_list('name', flat=True)) == ['Colin Gomez', 'Faye Moody']
+    assert sorted(Meeting.objects.values_list('employee__name', 'start', 'end')) == [
+        ('Colin Gomez', datetime.datetime(2015, 1, 18, 8, 0), datetime.datetime(2015, 1, 18, 9, 30)),
+        ('Faye Moody', datetime.datetime(2015, 1, 18, 9, 0), datetime.datetime(2015, 1, 18, 10, 0)),
+    ]
+    assert sorted(BusyInterval.objects.values_list('employee__name', 'start', 'end')) == \
+           sorted(Meeting.objects.values_list('employee__name', 'start', 'end'))
+
+
+@pytest.mark.django_db
+def test_loaddata_bulk_defers_meetings_of_employees_placed_below(tmp_path):
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt", [
+        "139016136604805407078985976850150049467;1/18/2015 9:00:00 AM;1/18/2015 10:00:00 AM;9A8DC0",
+        "111111111111111111111111111111111111111;1/19/2015 9:00:00 AM;1/19/2015 10:00:00 AM;CC01",
+        "139016136604805407078985976850150049467;Faye Moody",
+    ])
+    stdout = io.StringIO()
+    call_command('loaddata', file=file_name, verbose='Yes', stdout=stdout, bulk=True)
+
+    assert list(Meeting.objects.values_list('employee__name', 'start')) == [
+        ('Faye Moody', datetime.datetime(2015, 1, 18, 9, 0)),
+    ]
+    assert '2:ERROR:EMPLOYEE DOES NOT EXISTS:' in stdout.getvalue()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('options', [{}, {'workers': 2}])
+def test_loaddata_incremental(tmp_path, options):
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt")
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO())
+    assert Meeting.objects.filter(fingerprint__isnull=False).count() == 2
+
+    lines = [line for line in utils.FREEBUSY_LINES if not line.endswith("3B75E0CA3D")]
+    lines.append("139016136604805407078985976850150049467;1/20/2015 9:00:00 AM;1/20/2015 10:00:00 AM;DD02")
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt", lines)
+    stdout = io.StringIO()
+    call_command('loaddata', file=file_name, verbose='No', stdout=stdout, incremental=True, **options)
+
+    assert sorted(Meeting.objects.values_list('employee__name', 'start')) == [
+        ('Faye Moody', datetime.datetime(2015, 1, 18, 9, 0)),
+        ('Faye Moody', datetime.datetime(2015, 1, 20, 9, 0)),
+    ]
+    assert 'Skipped 2 unchanged meetings lines' in stdout.getvalue()
+    assert 'Deleted 1 meetings removed from the file' in stdout.getvalue()
+    assert sorted(BusyInterval.objects.values_list('employee__name', 'start')) == [
+        ('Faye Moody', datetime.datetime(2015, 1, 18, 9, 0)),
+        ('Faye Moody', datetime.datetime(2015, 1, 20, 9, 0)),
+    ]
+
+
+@pytest.mark.django_db
+def test_loaddata_incremental_keeps_meetings_created_without_file(set_up, tmp_path):
+    employee = Employee.objects.first()
+    start, end = create_meeting_frames(2015, 1, 18, 9, 0, 10, 0)
+    Meeting.objects.create(employee=employee, start=start, end=end)
+
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt")
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(), incremental=True)
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(), incremental=True)
+
+    assert Meeting.objects.filter(employee=employee).count() == 1
+    assert Meeting.objects.count() == 3
+
+
+def stored_busy_intervals():
+    return sorted(BusyInterval.objects.values_list('employee_id', 'start', 'end'))
+
+
+@pytest.mark.django_db
+def test_loaddata_rebuilds_busy_intervals_of_changed_employees(tmp_path, monkeypatch):
+    rebuilt_employee_ids = []
+    rebuild_busy_intervals = busy.rebuild_busy_intervals
+
+    def recorded_rebuild(**kwargs):
+        rebuilt_employee_ids.append(set(kwargs['employee_ids']))
+        return rebuild_busy_intervals(**kwargs)
+
+    monkeypatch.setattr(busy, 'rebuild_busy_intervals', recorded_rebuild)
+    file_name = synthetic.write_synthetic_file(tmp_path / "freebusy.txt", employees=5, meetings_per_employee=20, days=5)
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(), incremental=True)
+    assert rebuilt_employee_ids == [set(Employee.objects.values_list('id', flat=True))]
+    loaded = stored_busy_intervals()
+
+    # Nothing is rebuilt when nothing was changed
+    rebuilt_employee_ids.clear()
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(), incremental=True)
+    assert rebuilt_employee_ids == []
+    assert stored_busy_intervals() == loaded
+
+    lines = open(file_name).read().splitlines()
+    meeting_lines = [line for line in lines if line.count(';') == 3]
+    removed, changed = meeting_lines[0], meeting_lines[-1]
+    external_id = changed.split(';')[0]
+    lines.remove(removed)
+    lines.append(f"{external_id};1/10/2014 9:00:00 AM;1/10/2014 10:00:00 AM;EE01")
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt", lines)
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(), incremental=True)
+    assert rebuilt_employee_ids == [set(Employee.objects.filter(
+        external_id__in=[external_id, removed.split(';')[0]]).values_list('id', flat=True))]
+    maintained = stored_busy_intervals()
+    assert maintained != loaded
+    rebuild_busy_intervals()
+    assert stored_busy_intervals() == maintained
+
+
+@pytest.mark.django_db
+def test_busy_intervals_are_maintained_by_meetings_changes(set_up):
+    employee1, employee2 = Employee.objects.all()[:2]
+    at = lambda hour, minutes=0: datetime.datetime(2023, 2, 13, hour, minutes)
+    meeting = Meeting.objects.create(employee=employee1, start=at(9), end=at(10))
+    Meeting.objects.create(employee=employee1, start=at(11), end=at(12))
+    Meeting.objects.create(employee=employee2, start=at(9, 30), end=at(11))
+    assert stored_busy_intervals() == [(employee1.id, at(9), at(10)), (employee1.id, at(11), at(12)),
+                                       (employee2.id, at(9, 30), at(11))]
+
+    # Touches both intervals of the employee
+    Meeting.objects.create(employee=employee1, start=at(10), end=at(11))
+    assert stored_busy_intervals() == [(employee1.id, at(9), at(12)), (employee2.id, at(9, 30), at(11))]
+    # Already covered
+    Meeting.objects.create(employee=employee1, start=at(9, 30), end=at(10, 30))
+    assert stored_busy_intervals() == [(employee1.id, at(9), at(12)), (employee2.id, at(9, 30), at(11))]
+
+    meeting.start, meeting.end = at(7), at(8)
+    meeting.save()
+    assert stored_busy_intervals() == [(employee1.id, at(7), at(8)), (employee1.id, at(9, 30), at(12)),
+                                       (employee2.id, at(9, 30), at(11))]
+    meeting.delete()
+    assert stored_busy_intervals() == [(employee1.id, at(9, 30), at(12)), (employee2.id, at(9, 30), at(11))]
+
+    rebuilt = stored_busy_intervals()
+    assert busy.rebuild_busy_intervals() == 2
+    assert stored_busy_intervals() == rebuilt
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.django_db
+def test_busy_intervals_maintained_meeting_by_meeting_equal_rebuilt(set_up, seed):
+    rnd = random.Random(seed)
+    employees = list(Employee.objects.all())
+    day = datetime.datetime(2023, 2, 13)
+    random_time = lambda: day + datetime.timedelta(minutes=rnd.randrange(0, 24 * 60, 30))
+    for _ in range(40):
+        start = random_time()
+        end = start + datetime.timedelta(minutes=rnd.randrange(0, 240, 30))
+        Meeting.objects.create(employee=rnd.choice(employees), start=start, end=end)
+    meetings = list(Meeting.objects.all())
+    rnd.shuffle(meetings)
+    for meeting in meetings[:10]:
+        meeting.start = random_time()
+        meeting.end = meeting.start + datetime.timedelta(minutes=rnd.randrange(0, 240, 30))
+        meeting.employee = rnd.choice(employees)
+        meeting.save()
+    for meeting in meetings[10:20]:
+        meeting.delete()
+    Meeting.objects.filter(id__in=[meeting.id for meeting in meetings[20:25]]).delete()
+    maintained = stored_busy_intervals()
+    busy.rebuild_busy_intervals()
+    assert stored_busy_intervals() == maintained
+
+
+@pytest.mark.django_db
+def test_busy_intervals_of_deleted_meetings_are_rebuilt_once(set_up, django_assert_max_num_queries):
+    employee1, employee2 = Employee.objects.all()[:2]
+    day = datetime.datetime(2023, 2, 13)
+    for employee in (employee1, employee2):
+        for step in range(96):
+            start = day + datetime.timedelta(minutes=45 * step)
+            Meeting.objects.create(employee=employee, start=start, end=start + datetime.timedelta(minutes=30))
+    meeting = Meeting.objects.filter(employee=employee1).first()
+
+    with django_assert_max_num_queries(8):
+        meeting.delete()
+    with django_assert_max_num_queries(8):
+        Meeting.objects.filter(employee=employee1).delete()
+    assert not BusyInterval.objects.filter(employee=employee1).exists()
+    with django_assert_max_num_queries(8):
+        employee2.delete()
+    assert not BusyInterval.objects.exists()
+
+
+@pytest.mark.django_db
+def test_benchmarks(tmp_path, monkeypatch):
+    file_name = synthetic.write_synthetic_file(tmp_path / "freebusy.txt", employees=4, meetings_per_employee=10, days=5)
+    monkeypatch.setattr(busy_calendar_cache, 'snapshot_file', str(tmp_path / "busy.snapshot"))
+    generation_file, generation = busy_calendar_cache.generation_file, busy_calendar_cache.file_generation()
+    temp_dir = tmp_path / "benchmark"
+    temp_dir.mkdir()
+    with benchmarks.isolated_busy_calendar_cache(str(temp_dir)):
+        assert busy_calendar_cache.snapshot_file is None
+        results = benchmarks.benchmark_loaddata(file_name)
+        results += benchmarks.benchmark_free_time(windows=[1, 7], participants=[2, 10], repeat=2)
+    # Generation of API processes is not bumped by loading into the benchmark database
+    assert busy_calendar_cache.generation_file == generation_file
+    assert busy_calendar_cache.file_generation() == generation
+    assert busy_calendar_cache.snapshot_file == str(tmp_path / "busy.snapshot")
+
+    assert [result['scenario'] for result in results[:2]] == ['loaddata_bulk', 'loaddata_incremental']
+    assert results[0]['params'] == {'meetings': Meeting.objects.count()}
+    # Participants above the amount of employees are skipped
+    assert {result['params'].get('participants') for result in results[2:]} == {2}
+    assert len(results) == 2 + 2 * (2 + 2 * len(benchmarks.ENGINES))
+    assert all(result['repeat'] == 2 and result['min'] <= result['median'] for result in results[2:])
+
+    slower = [dict(result, median=result['median'] * 2) for result in results]
+    comparison = benchmarks.compare(results, slower, threshold=1.5)
+    assert len(comparison) == len(results)
+    assert all(regression for _, _, _, regression in comparison)
+
+
+def test_fetchdata_streams_resumes_and_skips_unchanged_file(tmp_path):
+    content = "\n".join(utils.FREEBUSY_LINES * 50).encode()
+    file_name = str(tmp_path / "freebusy.txt")
+    with utils.DumpHTTPServer(content) as server:
+        # Interrupted download - the partial file is kept, the target file is not created
+        server.break_after = 1000
+        with pytest.raises(SystemExit):
+            call_command('fetchdata', url=server.url, file=file_name, chunk_size=100, stdout=io.StringIO())
+        assert not os.path.exists(file_name)
+        assert os.path.getsize(file_name + '.part') == 1000
+
+        out = io.StringIO()
+        call_command('fetchdata', url=server.url, file=file_name, chunk_size=100, stdout=out)
+        assert 'resumed' in out.getvalue()
+        assert server.requests[-1]['Range'] == 'bytes=1000-'
+        with open(file_name, 'rb') as file:
+            assert file.read() == content
+        assert not os.path.exists(file_name + '.part')
+
+        out = io.StringIO()
+        call_command('fetchdata', url=server.url, file=file_name, stdout=out)
+        assert 'up to date' in out.getvalue()
+        assert server.requests[-1]['If-None-Match'] == '"v1"'
+
+        # Modified remote file - downloaded again, also when the partial download belongs to the old version
+        server.content = content[::-1]
+        server.etag = '"v2"'
+        with open(file_name + '.part', 'wb') as file:
+            file.write(content[:10])
+        download._write_meta(file_name, server.url, {'part': {'etag': '"v1"'}})
+        out = io.StringIO()
+        call_command('fetchdata', url=server.url, file=file_name, stdout=out)
+        assert out.getvalue().strip().endswith('Download completed')
+        with open(file_name, 'rb') as file:
+            assert file.read() == content[::-1]
+
+
+@pytest.mark.parametrize('options', [{}, {'incremental': True}])
+@pytest.mark.django_db
+def test_loaddata_streamed_from_url(tmp_path, options):
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt")
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(), bulk=True)
+    loaded = sorted(Meeting.objects.values_list('employee__external_id', 'start', 'end', 'fingerprint'))
+    Meeting.objects.all().delete()
+    Employee.objects.all().delete()
+
+    with open(file_name, 'rb') as file, utils.DumpHTTPServer(file.read()) as server:
+        stdout = io.StringIO()
+        call_command('loaddata', url=server.url, file=str(tmp_path / "missing.txt"), verbose='Yes', stdout=stdout,
+                     **options)
+
+    assert sorted(Meeting.objects.values_list('employee__external_id', 'start', 'end', 'fingerprint')) == loaded
+    assert sorted(BusyInterval.objects.values_list('start', 'end')) == sorted(
+        Meeting.objects.values_list('start', 'end'))
+    output = stdout.getvalue()
+    assert '8:ERROR:EMPLOYEE DOES NOT EXISTS:111111111111111111111111111111111111111;1/19/2015 9:00:00 AM' in output
+    assert not os.path.exists(tmp_path / "missing.txt")
+
+
+@pytest.mark.django_db
+def test_loaddata_streamed_from_url_fails_with_http_error(tmp_path):
+    with utils.DumpHTTPServer(b"") as server:
+        with pytest.raises(SystemExit):
+            call_command('loaddata', url=server.url + '/missing', verbose='No', stdout=io.StringIO())
+    assert not Meeting.objects.exists()
+
+
+@pytest.mark.parametrize('file_compression', ['gzip', 'xz'])
+@pytest.mark.parametrize('options', [{}, {'bulk': True}, {'workers': 2}, {'incremental': True}])
+@pytest.mark.django_db
+def test_loaddata_compressed_file(tmp_path, file_compression, options):
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt")
+    call_command('loaddata', file=file_name, verbose='No', stdout=io.StringIO(), bulk=True)
+    loaded = sorted(Meeting.objects.values_list('employee__external_id', 'start', 'end', 'fingerprint'))
+    Meeting.objects.all().delete()
+    Employee.objects.all().delete()
+
+    with open(file_name, 'rb') as file:
+        content = file.read()
+    compressed_name = str(tmp_path / f"freebusy.txt.{file_compression}")
+    with open(compressed_name, 'wb') as file:
+        file.write(gzip.compress(content) if file_compression == 'gzip' else lzma.compress(content))
+    stdout = io.StringIO()
+    call_command('loaddata', file=compressed_name, verbose='Yes', stdout=stdout, **options)
+
+    assert sorted(Meeting.objects.values_list('employee__external_id', 'start', 'end', 'fingerprint')) == loaded
+    assert '9:ERROR:TRASH:170378154979885419149243073079764064027;1/19/2015 1:00:00 PM;' in stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_loaddata_compressed_file_streamed_from_url(tmp_path):
+    file_name = utils.create_freebusy_file(tmp_path / "freebusy.txt")
+    with open(file_name, 'rb') as file, utils.DumpHTTPServer(gzip.compress(file.read())) as server:
+        call_command('loaddata', url=server.url, verbose='No', stdout=io.StringIO())
+        stdout = io.StringIO()
+        call_command('fetchdata', url=server.url, file=str(tmp_path / "freebusy.txt.gz"), stdout=stdout)
+    assert Meeting.objects.count() == 2
+    assert 'File is gzip compressed' in stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_busy_snapshot_equals_database(set_up, tmp_path):
+    employees = list(Employee.objects.all())
+    rnd = random.Random(0)
+    for employee in employees[:-1]:
+        for _ in range(20):
+            start = datetime.datetime(2023, 2, 13, 8, 0) + datetime.timedelta(minutes=30 * rnd.randrange(100))
+            Meeting.objects.create(employee=employee, start=start,
+                                   end=start + datetime.timedelta(minutes=30 * rnd.randrange(1, 5)))
+    # Times with seconds and extreme dates are kept exactly
+    Meeting.objects.create(employee=employees[0], start=datetime.datetime(1, 1, 1),
+                           end=datetime.datetime(1, 1, 1, 0, 0, 10))
+    Meeting.objects.create(employee=employees[0], start=datetime.datetime(2023, 3, 1, 10, 0, 15),
+                           end=datetime.datetime(9000, 1, 1))
+    snapshot_file = str(tmp_path / "busy.snapshot")
+    assert snapshot.write_snapshot(snapshot_file, generation=7) == (len(employees), BusyInterval.objects.count())
+
+    busy_snapshot = snapshot.BusySnapshot(snapshot_file)
+    external_ids = {employee.external_id for employee in employees}
+    assert busy_snapshot.generation == 7
+    assert len(busy_snapshot) == len(employees)
+    assert {external_id: busy_snapshot.calendar(external_id) for external_id in external_ids} == \
+           BusyCalendarCache._load_calendars(external_ids)
+    assert len(busy_snapshot.calendar(employees[-1].external_id)) == 0
+    for earliest, latest in [(datetime.datetime(2023, 2, 14, 9, 0), datetime.datetime(2023, 2, 14, 17, 0)),
+                             (datetime.datetime(2023, 2, 13, 10, 0, 30), datetime.datetime(2023, 2, 13, 11, 0, 30)),
+                             (datetime.datetime(2023, 3, 1), datetime.datetime(2023, 3, 2)),
+                             (datetime.datetime(8999, 12, 31), datetime.datetime(9999, 1, 1))]:
+        assert {external_id: busy_snapshot.calendar(external_id, earliest, latest) for external_id in external_ids} \
+               == BusyCalendarCache._load_calendars(external_ids, earliest, latest)
+    busy_snapshot.close()
+
+
+@pytest.mark.parametrize('max_intervals', [0, 1000])
+@pytest.mark.django_db
+def test_busy_calendar_cache_reads_snapshot(set_up, tmp_path, django_assert_num_queries, monkeypatch,
+                                            max_intervals):
+    employee1, employee2 = Employee.objects.all()[:2]
+    start, end = create_meeting_frames(2023, 2, 13, 9, 0, 10, 0)
+    Meeting.objects.create(employee=employee1, start=start, end=end)
+    earliest, latest = datetime.datetime(2023, 2, 13, 8, 0), datetime.datetime(2023, 2, 13, 17, 0)
+    snapshot_file = str(tmp_path / "busy.snapshot")
+    generation_file = str(tmp_path / "generation")
+    cache = BusyCalendarCache(max_intervals=max_intervals, generation_file=generation_file,
+                              snapshot_file=snapshot_file)
+    cache.bump_generation()
+    # The same generation file as API processes
+    monkeypatch.setattr(busy_calendar_cache, 'generation_file', generation_file)
+    stdout = io.StringIO()
+    call_command('exportsnapshot', file=snapshot_file, stdout=stdout)
+    assert 'Exported 5 employees and 1 busy intervals' in stdout.getvalue()
+
+    with django_assert_num_queries(0):
+        assert cache.busy_intervals([employee1.external_id, employee2.external_id], earliest, latest) == \
+               [(start, end)]
+
+    # Changed employee is not read from the snapshot anymore
+    cache.invalidate(employee2.external_id)
+    with django_assert_num_queries(1):
+        assert cache.busy_intervals([employee2.external_id], earliest, latest) == []
+
+    # Data loaded after the export
+    cache.bump_generation()
+    with django_assert_num_queries(1):
+        assert cache.busy_intervals([employee1.external_id], earliest, latest) == [(start, end)]
+    assert cache.snapshot is None
+
+    # Exported again
+    call_command('exportsnapshot', file=snapshot_file, stdout=stdout)
+    cache.clear()
+    with django_assert_num_queries(0):
+        assert cache.busy_intervals([employee1.external_id], earliest, latest) == [(start, end)]
+
+
+@pytest.mark.django_db
+def test_busy_calendar_cache_reads_invalidated_employees_from_new_snapshot(set_up, tmp_path,
+                                                                           django_assert_num_queries):
+    employee1, employee2 = Employee.objects.all()[:2]
+    start, end = create_meeting_frames(2023, 2, 13, 9, 0, 10, 0)
+    earliest, latest = datetime.datetime(2023, 2, 13, 8, 0), datetime.datetime(2023, 2, 13, 17, 0)
+    snapshot_file = str(tmp_path / "busy.snapshot")
+    cache = BusyCalendarCache(max_intervals=0, generation_file=busy_calendar_cache.generation_file,
+                              snapshot_file=snapshot_file)
+    stdout = io.StringIO()
+    call_command('exportsnapshot', file=snapshot_file, stdout=stdout)
+    Meeting.objects.create(employee=employee1, start=start, end=end)
+    with django_assert_num_queries(1):
+        assert cache.busy_intervals([employee1.external_id], earliest, latest) == [(start, end)]
+
+    # Exported again, without clearing the cache
+    call_command('exportsnapshot', file=snapshot_file, stdout=stdout)
+    # Invalidated after the export
+    start2, end2 = create_meeting_frames(2023, 2, 13, 11, 0, 12, 0)
+    Meeting.objects.create(employee=employee2, start=start2, end=end2)
+    with django_assert_num_queries(1):
+        assert cache.busy_intervals([employee1.external_id, employee2.external_id], earliest, latest) == \
+               [(start, end), (start2, end2)]
+    assert set(cache.snapshot_stale_ids) == {employee2.external_id}
+
+    call_command('exportsnapshot', file=snapshot_file, stdout=stdout)
+    with django_assert_num_queries(0):
+        assert cache.busy_intervals([employee1.external_id, employee2.external_id], earliest, latest) == \
+               [(start, end), (start2, end2)]
+    assert cache.snapshot_stale_ids == {}
+
+
+def test_busy_calendar_cache_without_snapshot_file(tmp_path):
+    (tmp_path / "busy.snapshot").write_bytes(b"not a snapshot file")
+    for snapshot_file in [str(tmp_path / "missing.snapshot"), str(tmp_path / "busy.snapshot")]:
+        cache = BusyCalendarCache(generation_file=None, snapshot_file=snapshot_file)
+        assert cache._snapshot_calendars(['1']) == ({}, ['1'])
+        assert cache.snapshot is None
@@ -6,6 +6,7 @@ import pytest
 from faker import Faker
 from rest_framework.test import APIClient
 
+from free.cache import busy_calendar_cache
 from free.models import Employee
 
 sys.path.append(os.path.dirname(__file__))
@@ -19,6 +20,18 @@ def client():
     return client
 
 
+@pytest.fixture(autouse=True)
+def clear_busy_calendar_cache(tmp_path, monkeypatch):
+    # Database is rolled back after each test without any signals, so the cache must be dropped too.
+    # The generation file and the invalidations log of the test are not shared with running servers.
+    generation_file = str(tmp_path / '.busy_cache_generation')
+    monkeypatch.setattr(busy_calendar_cache, 'generation_file', generation_file)
+    monkeypatch.setattr(busy_calendar_cache, 'invalidations_file', generation_file + '.invalidations')
+    busy_calendar_cache.bump_generation()
+    yield
+    busy_calendar_cache.clear()
+
+
 @pytest.fixture
 def set_up():
     create_employees(5)
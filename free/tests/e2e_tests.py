@@ -1,10 +1,15 @@
 import datetime
+import json
 
 import pytest
+from asgiref.sync import async_to_sync
 from rest_framework import status
 
+from free import timing
 from free.models import Employee, Meeting
-from free.tests.utils import create_meeting_frames, http_call, request_free_time_data
+from free.serializers import RequestFreeTimeSerializer
+from free.tests.utils import API_URL, BATCH_API_URL, async_http_call, create_meeting_frames, http_call, \
+    request_free_time_data
 from free.utils.parser import get_datetime_text as ft
 
 
@@ -186,3 +191,429 @@ def test_404_error(client, set_up, http_method):
     response = http_call(client, http_method, request_data)
     assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+
+@pytest.mark.django_db
+def test_batch_free_time(client, set_up):
+    """
+     Results of the batch are the same as results of separate requests.
+     Invalid query is reported in its result.
+
+       8|--Xxxxxx--Xxxxxx--|17
+
+    """
+    employees = Employee.objects.all()
+    employee1 = employees.first()
+    employee2 = employees.last()
+    year, month, day = 2023, 2, 12
+    start_m1, end_m1 = create_meeting_frames(year, month, day, 9, 0, 12, 00)
+    start_m2, end_m2 = create_meeting_frames(year, month, day, 13, 0, 16, 00)
+    Meeting.objects.create(employee=employee1, start=start_m1, end=end_m1)
+    Meeting.objects.create(employee=employee2, start=start_m2, end=end_m2)
+
+    earliest, latest = datetime.datetime(year, month, day, 8, 0), datetime.datetime(year, month, day, 16, 0)
+    invalid_query = request_free_time_data([employee1], earliest, latest)
+    invalid_query['office_hours'] = "817"
+    queries = [request_free_time_data([employee1, employee2], earliest, latest),
+               invalid_query,
+               request_free_time_data([employee1], earliest, latest),
+               request_free_time_data([employee2], earliest, latest, duration=30)]
+    # Employees can be given as a list as well
+    queries[2]['employee_ids'] = [employee1.external_id]
+
+    response = client.post(BATCH_API_URL, {'queries': queries}, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    results = response.data['results']
+    assert len(results) == 4
+    assert results[0] == http_call(client, 'POST', queries[0]).data
+    assert results[0]['freetimes'] == [ft(datetime.datetime(year, month, day, 8, 0)),
+                                       ft(datetime.datetime(year, month, day, 12, 0)),
+                                       ft(datetime.datetime(year, month, day, 16, 0))]
+    assert list(results[1]) == ['error']
+    assert results[2]['freetimes'][0] == ft(datetime.datetime(year, month, day, 8, 0))
+    assert results[2]['freetimes'][-1] == ft(datetime.datetime(year, month, day, 16, 0))
+    assert results[3] == http_call(client, 'POST', queries[3]).data
+
+
+@pytest.mark.django_db
+def test_numeric_employee_ids(client):
+    employee = Employee.objects.create(name="Numeric", external_id="123")
+    year, month, day = 2023, 2, 12
+    start, end = create_meeting_frames(year, month, day, 9, 0, 16, 0)
+    Meeting.objects.create(employee=employee, start=start, end=end)
+    query = request_free_time_data([employee], datetime.datetime(year, month, day, 8, 0),
+                                   datetime.datetime(year, month, day, 16, 0))
+    query['employee_ids'] = [123]
+
+    response = http_call(client, 'POST', query)
+    assert response.status_code == status.HTTP_200_OK
+    freetimes = [ft(datetime.datetime(year, month, day, 8, 0)), ft(datetime.datetime(year, month, day, 16, 0))]
+    assert response.data['freetimes'] == freetimes
+    response = client.post(BATCH_API_URL, {'queries': [query]}, format='json')
+    assert response.data['results'] == [{'freetimes': freetimes}]
+
+
+@pytest.mark.django_db
+def test_batch_free_time_errors(client, set_up, monkeypatch):
+    employee = Employee.objects.first()
+    earliest, latest = datetime.datetime(2023, 2, 12, 8, 0), datetime.datetime(2023, 2, 12, 16, 0)
+    query = request_free_time_data([employee], earliest, latest)
+    invalid_queries = [dict(query, office_hours='817'), dict(query, duration=None), dict(query, limit='0'),
+                       dict(query, earliest_start='2023-02-12'), dict(query, employee_ids=[[1]]),
+                       dict(query, order='up')]
+    failing_query = dict(query, duration=45)
+    get_freetimes = RequestFreeTimeSerializer.get_freetimes
+
+    def failing_get_freetimes(self, *args, **kwargs):
+        if self.meeting_length == 45:
+            raise RuntimeError("search failed")
+        return get_freetimes(self, *args, **kwargs)
+
+    monkeypatch.setattr(RequestFreeTimeSerializer, 'get_freetimes', failing_get_freetimes)
+    response = client.post(BATCH_API_URL, {'queries': invalid_queries + [failing_query, query]}, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    results = response.data['results']
+    assert results[:len(invalid_queries)] == [
+        {'error': 'office_hours: expected "H[:MM]-H[:MM]" between 0:00 and 24:00'},
+        {'error': 'duration: expected minutes, ex. "60"'},
+        {'error': 'limit: expected a positive integer'},
+        {'error': 'earliest_start: expected "M/D/YYYY h:mm:ss AM"'},
+        {'error': 'employee_ids: expected comma separated ids or a list of ids'},
+        {'error': 'order: expected "asc" or "desc"'},
+    ]
+    assert results[-2] == {'error': 'free time search failed'}
+    assert results[-1] == http_call(client, 'POST', query).data
+
+
+@pytest.mark.parametrize('data', [{'queries': 'text'}, {}, {'queries': [{}] * 101}])
+@pytest.mark.django_db
+def test_batch_free_time_400_error(client, data):
+    response = client.post(BATCH_API_URL, data, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def create_meetings_of_employees(amount_per_employee):
+    meetings = []
+    for number, employee in enumerate(Employee.objects.all()):
+        for hour in range(8, 8 + amount_per_employee):
+            start, end = create_meeting_frames(2023, 2, 12, hour, number, hour, number + 30)
+            meetings.append(Meeting.objects.create(employee=employee, start=start, end=end))
+    return sorted(meetings, key=lambda meeting: (meeting.start, meeting.id))
+
+
+@pytest.mark.django_db
+def test_meetings_list_cursor_pagination(client, set_up, django_assert_num_queries):
+    meetings = create_meetings_of_employees(3)
+    listed = []
+    url = '/meetings/?page_size=4'
+    while url:
+        # Page and its employees are selected with one query
+        with django_assert_num_queries(1):
+            response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) <= 4
+        listed.extend(response.data['results'])
+        url = response.data['next']
+    assert len(listed) == len(meetings) == 15
+    assert [meeting['employee']['external_id'] for meeting in listed] == \
+           [meeting.employee.external_id for meeting in meetings]
+
+
+@pytest.mark.django_db
+def test_meetings_list_pages_past_meetings_without_time(client, set_up):
+    employee = Employee.objects.first()
+    meetings = create_meetings_of_employees(2)
+    Meeting.objects.create(employee=employee)
+    Meeting.objects.create(employee=employee)
+    listed = []
+    url = '/meetings/?page_size=3'
+    while url:
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        listed.extend(response.data['results'])
+        url = response.data['next']
+    assert [meeting['start'] for meeting in listed] == [meeting.start.isoformat() for meeting in meetings]
+
+    response = client.post('/meetings/', {'employee_id': employee.external_id}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert set(response.data) == {'start', 'end'}
+    response = client.post('/meetings/', {'employee_id': employee.external_id, 'start': '2023-02-12T10:00:00',
+                                          'end': '2023-02-12T09:00:00'}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert list(response.data) == ['end']
+
+
+@pytest.mark.django_db
+def test_list_fields_selection(client, set_up):
+    create_meetings_of_employees(1)
+    response = client.get('/meetings/', {'fields': 'start,end'})
+    assert response.status_code == status.HTTP_200_OK
+    assert all(list(meeting) == ['start', 'end'] for meeting in response.data['results'])
+
+    response = client.get('/employees/', {'fields': 'name'})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == 5
+    assert all(list(employee) == ['name'] for employee in response.data['results'])
+
+    response = client.get('/meetings/', {'fields': 'start,room'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_meetings_list_ndjson_stream(client, set_up):
+    meetings = create_meetings_of_employees(2)
+    response = client.get('/meetings/', {'format': 'ndjson', 'fields': 'employee,start'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response['Content-Type'] == 'application/x-ndjson'
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [row['employee']['external_id'] for row in rows] == [meeting.employee.external_id for meeting in meetings]
+    assert all(list(row) == ['employee', 'start'] for row in rows)
+
+    response = client.get('/employees/', HTTP_ACCEPT='application/x-ndjson')
+    assert response.status_code == status.HTTP_200_OK
+    assert len(b''.join(response.streaming_content).splitlines()) == 5
+
+
+@pytest.mark.parametrize('http_method', ['GET', 'POST'])
+@pytest.mark.django_db
+def test_async_free_time(client, set_up, http_method):
+    """
+     Async view returns the same free time slots as the sync one.
+
+       8|--Xxxxxx--Xxxxxx--|17
+
+    """
+    employees = Employee.objects.all()
+    employee1 = employees.first()
+    employee2 = employees.last()
+    year, month, day = 2023, 2, 12
+    start_m1, end_m1 = create_meeting_frames(year, month, day, 9, 0, 12, 00)
+    start_m2, end_m2 = create_meeting_frames(year, month, day, 13, 0, 16, 00)
+    Meeting.objects.create(employee=employee1, start=start_m1, end=end_m1)
+    Meeting.objects.create(employee=employee2, start=start_m2, end=end_m2)
+
+    request_data = request_free_time_data([employee1, employee2],
+                                          datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year, month, day + 1, 16, 0))
+    response = async_to_sync(async_http_call)(http_method, request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == http_call(client, http_method, request_data).data
+    assert response.json()['freetimes'][:3] == [ft(datetime.datetime(year, month, day, 8, 0)),
+                                                ft(datetime.datetime(year, month, day, 12, 0)),
+                                                ft(datetime.datetime(year, month, day, 16, 0))]
+
+    request_data['office_hours'] = "817"
+    response = async_to_sync(async_http_call)(http_method, request_data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize('http_method', ['GET', 'POST'])
+@pytest.mark.django_db
+def test_first_free_time_slots(client, set_up, http_method):
+    """
+     Only the first (or the last) free time slots are returned.
+
+       8|--Xxxxxx--Xxxxxx--|17
+
+    """
+    employee = Employee.objects.all().first()
+    year, month, day = 2023, 2, 12
+    start_m1, end_m1 = create_meeting_frames(year, month, day, 9, 0, 12, 00)
+    start_m2, end_m2 = create_meeting_frames(year, month, day, 13, 0, 16, 00)
+    Meeting.objects.create(employee=employee, start=start_m1, end=end_m1)
+    Meeting.objects.create(employee=employee, start=start_m2, end=end_m2)
+
+    request_data = request_free_time_data([employee],
+                                          datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year + 1, month, day, 16, 0))
+    request_data['limit'] = 2
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['freetimes'] == [ft(datetime.datetime(year, month, day, 8, 0)),
+                                          ft(datetime.datetime(year, month, day, 12, 0))]
+
+    request_data['order'] = 'desc'
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['freetimes'] == [ft(datetime.datetime(year + 1, month, day, 16, 0)),
+                                          ft(datetime.datetime(year + 1, month, day, 15, 30))]
+
+    request_data['limit'] = 0
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    request_data['limit'] = 1
+    request_data['order'] = 'random'
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_meeting_created_through_api_is_busy_time(client, set_up):
+    employee = Employee.objects.all().first()
+    year, month, day = 2023, 2, 12
+    response = client.post('/meetings/', {'employee_id': employee.external_id,
+                                          'start': '2023-02-12T08:00:00', 'end': '2023-02-12T16:00:00'}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['employee']['external_id'] == employee.external_id
+
+    request_data = request_free_time_data([employee],
+                                          datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year, month, day, 16, 0))
+    response = http_call(client, 'GET', request_data)
+    assert response.data['freetimes'] == [ft(datetime.datetime(year, month, day, 16, 0))]
+
+    response = client.post('/meetings/', {'employee_id': 'unknown', 'start': '2023-02-12T08:00:00',
+                                          'end': '2023-02-12T16:00:00'}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize('http_method', ['GET', 'POST'])
+@pytest.mark.django_db
+def test_far_future_meeting(client, set_up, http_method):
+    employee = Employee.objects.all().first()
+    year, month, day = 2023, 2, 13
+    response = client.post('/meetings/', {'employee_id': employee.external_id,
+                                          'start': '2023-02-13T12:00:00', 'end': '9000-01-01T00:00:00'}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+
+    request_data = request_free_time_data([employee],
+                                          datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year, month, day, 16, 0))
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['freetimes'] == [ft(datetime.datetime(year, month, day, 8, 0)),
+                                          ft(datetime.datetime(year, month, day, 8, 30)),
+                                          ft(datetime.datetime(year, month, day, 9, 0)),
+                                          ft(datetime.datetime(year, month, day, 9, 30)),
+                                          ft(datetime.datetime(year, month, day, 10, 0)),
+                                          ft(datetime.datetime(year, month, day, 10, 30)),
+                                          ft(datetime.datetime(year, month, day, 11, 0))]
+
+    request_data = request_free_time_data([employee],
+                                          datetime.datetime(8999, 12, 31, 8, 0),
+                                          datetime.datetime(9000, 1, 1, 16, 0))
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['freetimes'][0] == ft(datetime.datetime(9000, 1, 1, 8, 0))
+
+
+@pytest.mark.parametrize('http_method', ['GET', 'POST'])
+@pytest.mark.django_db
+def test_free_time_slots_of_at_least_k_employees(client, set_up, http_method):
+    """
+     Slots when at least 2 of 3 employees are free, with the amount of free employees.
+     Requested meeting duration is 60 minutes.
+
+       8|Xxxxxx------|14
+       8|--Xxxxxx----|14
+       8|----Xxxxxx--|14
+
+    """
+    employee1, employee2, employee3 = Employee.objects.all()[:3]
+    year, month, day = 2023, 2, 12
+    for employee, hour in [(employee1, 8), (employee2, 9), (employee3, 10)]:
+        start, end = create_meeting_frames(year, month, day, hour, 0, hour + 3, 0)
+        Meeting.objects.create(employee=employee, start=start, end=end)
+
+    request_data = request_free_time_data([employee1, employee2, employee3],
+                                          datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year, month, day, 13, 0), office_hours='8-14')
+    request_data['min_free'] = 2
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['freetimes'] == [ft(datetime.datetime(year, month, day, 8, 0)),
+                                          ft(datetime.datetime(year, month, day, 12, 0)),
+                                          ft(datetime.datetime(year, month, day, 12, 30)),
+                                          ft(datetime.datetime(year, month, day, 13, 0))]
+    assert response.data['counts'] == [2, 2, 2, 3]
+
+    request_data['min_free'] = 1
+    request_data['limit'] = 2
+    request_data['order'] = 'desc'
+    response = http_call(client, http_method, request_data)
+    assert response.data['freetimes'] == [ft(datetime.datetime(year, month, day, 13, 0)),
+                                          ft(datetime.datetime(year, month, day, 12, 30))]
+    assert response.data['counts'] == [3, 2]
+
+    request_data['min_free'] = 0
+    response = http_call(client, http_method, request_data)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_free_time_stage_timing(client, set_up, monkeypatch, tmp_path, caplog):
+    """
+     Durations of the request stages are returned in the `Server-Timing` header,
+     logged (`FREE_TIME_TIMING_LOG`) and `?profile=1` requests are profiled.
+    """
+    monkeypatch.setattr(timing, 'FREE_TIME_TIMING_LOG', True)
+    monkeypatch.setattr(timing, 'FREE_TIME_PROFILE_DIR', str(tmp_path))
+    employees = Employee.objects.all()
+    request_data = request_free_time_data(employees, datetime.datetime(2023, 2, 13, 8, 0),
+                                          datetime.datetime(2023, 2, 13, 16, 0))
+
+    with caplog.at_level('INFO', logger='free.timing'):
+        response = http_call(client, 'GET', request_data)
+    assert response.status_code == status.HTTP_200_OK
+    stages = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+    assert stages == ['validate', 'db', 'slots', 'search', 'serialize', 'total']
+    log_line = json.loads(caplog.records[-1].getMessage())
+    assert log_line['status'] == 200
+    assert list(log_line['stages']) == stages[:-1]
+    assert 'X-Profile' not in response
+
+    for profile in ['1', 'True']:
+        response = http_call(client, 'GET', dict(request_data, profile=profile))
+        assert response.status_code == status.HTTP_200_OK
+        assert (tmp_path / response['X-Profile']).exists()
+    for profile in ['0', 'false', '']:
+        response = http_call(client, 'GET', dict(request_data, profile=profile))
+        assert 'X-Profile' not in response
+
+    response = http_call(client, 'GET', dict(request_data, duration='x'))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response['Server-Timing'].startswith('validate;dur=')
+
+    monkeypatch.setattr(timing, 'FREE_TIME_TIMING', False)
+    monkeypatch.setattr(timing, 'FREE_TIME_TIMING_LOG', False)
+    response = http_call(client, 'GET', request_data)
+    assert 'Server-Timing' not in response
+
+
+@pytest.mark.django_db
+def test_free_time_compact_encodings(client, set_up):
+    """
+     Free time slots as minutes since the epoch or as runs of consecutive slots,
+     selected by `?format=` or the `Accept` header. Requested meeting duration is 60 minutes.
+
+       8|----Xxxx----|14
+
+    """
+    employee = Employee.objects.first()
+    year, month, day = 2023, 2, 12
+    start, end = create_meeting_frames(year, month, day, 10, 0, 12, 0)
+    Meeting.objects.create(employee=employee, start=start, end=end)
+    request_data = request_free_time_data([employee], datetime.datetime(year, month, day, 8, 0),
+                                          datetime.datetime(year, month, day, 13, 0), office_hours='8-14')
+    day_minutes = (datetime.datetime(year, month, day) - datetime.datetime(1970, 1, 1)) // datetime.timedelta(minutes=1)
+    epoch = [day_minutes + minutes for minutes in (480, 510, 540, 720, 750, 780)]
+    ranges = {'freetimes': [[day_minutes + 480, 3], [day_minutes + 720, 3]], 'step': 30}
+
+    response = client.get(API_URL, dict(request_data, format='epoch'))
+    assert response.status_code == status.HTTP_200_OK
+    assert response['Content-Type'] == 'application/vnd.freebusy.epoch+json'
+    assert response.json() == {'freetimes': epoch}
+
+    response = client.post(API_URL, request_data, format='json', HTTP_ACCEPT='application/vnd.freebusy.ranges+json')
+    assert response.json() == ranges
+
+    response = client.post(BATCH_API_URL + '?format=ranges', {'queries': [request_data]}, format='json')
+    assert response.json() == {'results': [ranges]}
+
+    response = async_to_sync(async_http_call)('GET', dict(request_data, format='epoch'))
+    assert response['Content-Type'] == 'application/vnd.freebusy.epoch+json'
+    assert response.json() == {'freetimes': epoch}
+
+    response = client.get(API_URL, request_data)
+    assert response.json()['freetimes'][:2] == [ft(datetime.datetime(year, month, day, 8, 0)),
+                                                ft(datetime.datetime(year, month, day, 8, 30))]
@@ -1,6 +1,15 @@
+import datetime
+import gzip
+import lzma
+import random
+
 import pytest
 
-from free.utils.parser import get_start_end_hours
+from free import timing
+from free.tests.utils import FREEBUSY_LINES, create_freebusy_file
+from free.utils import compression, dump, engines, minutes, slots, synthetic
+from free.utils.parser import get_datetime, get_datetime_fast, get_datetime_text, get_datetime_texts, \
+    get_epoch_minutes, get_start_end_hours, get_start_end_minutes
 
 
 @pytest.mark.parametrize('hours_text', ['8-17', '08-17'])
@@ -8,3 +17,318 @@ def test_get_start_end_hours(hours_text):
     start_hours, end_hours = get_start_end_hours(hours_text)
     assert start_hours == 8
     assert end_hours == 17
+
+
+@pytest.mark.parametrize('datetime_text', ['1/29/2015 2:00:00 PM', '01/29/2015 02:00:00 PM', '12/1/2015 12:30:00 AM',
+                                           '2/28/2015 12:00:00 PM', '3/9/2015 11:59:59 pm'])
+def test_get_datetime_fast(datetime_text):
+    assert get_datetime_fast(datetime_text) == get_datetime(datetime_text)
+
+
+@pytest.mark.parametrize('datetime_text', ['1/1/2015 12:00:0', '1/1/2015 12:00:00', '2/30/2015 2:00:00 PM',
+                                           '1/29/2015 13:00:00 PM', '1/29/15 2:00:00 PM', '1/29/2015 2:00:00 XM',
+                                           '1/29/2015 2:60:00 PM', '', '1/29/2015'])
+def test_get_datetime_fast_errors(datetime_text):
+    with pytest.raises(ValueError):
+        get_datetime(datetime_text)
+    with pytest.raises(ValueError):
+        get_datetime_fast(datetime_text)
+
+
+def random_busy_intervals(rnd, day, amount, minutes_step=15):
+    busy_intervals = []
+    for _ in range(amount):
+        start = day + datetime.timedelta(minutes=rnd.randrange(-60, 3 * 24 * 60, minutes_step))
+        end = start + datetime.timedelta(minutes=rnd.randrange(0, 300, minutes_step))
+        busy_intervals.append((start, end))
+    return busy_intervals
+
+
+@pytest.mark.parametrize('engine', ['sweep', 'bitmap'])
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('meeting_length', [0, 30, 45, 60, 120])
+@pytest.mark.parametrize('minutes_step', [15, 30])
+def test_engine_equals_nested_loop(engine, seed, meeting_length, minutes_step):
+    rnd = random.Random(seed)
+    day = datetime.datetime(2023, 2, 13)
+    possible_start_times = [day + datetime.timedelta(minutes=30 * step) for step in range(3 * 48)]
+    busy_intervals = random_busy_intervals(rnd, day, rnd.randrange(0, 40), minutes_step)
+
+    expected = engines.nested_loop_freetimes(possible_start_times, busy_intervals, meeting_length)
+    find_freetimes = engines.get_engine(engine)
+    assert find_freetimes(possible_start_times, busy_intervals, meeting_length) == expected
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('meeting_length', [0, 30, 45, 120])
+def test_iter_sweep_line_freetimes_in_reverse_order(seed, meeting_length):
+    rnd = random.Random(seed)
+    day = datetime.datetime(2023, 2, 13)
+    possible_start_times = [day + datetime.timedelta(minutes=30 * step) for step in range(3 * 48)]
+    busy_intervals = random_busy_intervals(rnd, day, rnd.randrange(0, 40))
+
+    expected = engines.nested_loop_freetimes(possible_start_times, busy_intervals, meeting_length)
+    free_times = engines.iter_sweep_line_freetimes(possible_start_times[::-1], busy_intervals, meeting_length,
+                                                   reverse=True)
+    assert list(free_times) == expected[::-1]
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('meeting_length', [0, 30, 45, 120])
+def test_sweep_line_minutes_equals_sweep_line_freetimes(seed, meeting_length):
+    rnd = random.Random(seed)
+    day = datetime.datetime(2023, 2, 13)
+    possible_start_times = [day + datetime.timedelta(minutes=30 * step) for step in range(3 * 48)]
+    busy_intervals = random_busy_intervals(rnd, day, rnd.randrange(0, 40))
+
+    expected = engines.sweep_line_freetimes(possible_start_times, busy_intervals, meeting_length)
+    free_minutes = engines.sweep_line_minutes([minutes.get_minutes(start) for start in possible_start_times],
+                                              [(minutes.get_minutes(start), minutes.get_minutes(end))
+                                               for start, end in busy_intervals],
+                                              meeting_length)
+    assert minutes.get_datetimes(free_minutes) == expected
+
+
+def test_busy_calendar():
+    day = datetime.datetime(2023, 2, 13)
+    calendar = minutes.BusyCalendar()
+    calendar.append(day.replace(hour=8), day.replace(hour=9))
+    # Seconds are kept, they are rounded outward only to minutes
+    meeting = (day.replace(hour=10, second=30), day.replace(hour=10, minute=30, second=1, microsecond=5))
+    calendar.append(*meeting)
+    calendar.append(day.replace(hour=12), day.replace(hour=13))
+    # Far future meetings fit as well
+    far_future = (datetime.datetime(9000, 1, 1), datetime.datetime.max)
+    calendar.append(*far_future)
+
+    assert len(calendar) == 4
+    assert calendar.starts.itemsize == 8
+    assert calendar.intervals()[1] == meeting
+    assert calendar.intervals()[3] == far_future
+    assert calendar.intervals(day.replace(hour=9), day.replace(hour=12)) == [meeting]
+    assert calendar.intervals(day.replace(hour=10, minute=30, second=1, microsecond=5), day.replace(hour=12)) == []
+    assert calendar.intervals(day.replace(hour=8, minute=59), day.replace(hour=12, second=1)) == \
+           calendar.intervals()[:3]
+    assert list(calendar.minutes(day.replace(hour=9), day.replace(hour=12))) == \
+           [(minutes.get_minutes(day.replace(hour=10)), minutes.get_minutes(day.replace(hour=10, minute=31)))]
+    assert list(calendar.minutes(day.replace(hour=13), day.replace(hour=14))) == []
+    assert minutes.get_datetime(minutes.get_minutes(day)) == day
+
+
+def test_possible_start_minutes_equal_possible_start_times():
+    day = datetime.datetime(2023, 2, 13, 7, 30)
+    args = (day, day + datetime.timedelta(days=3), 60, 8 * 60, 17 * 60, 30)
+    assert minutes.get_datetimes(slots.possible_start_minutes(*args)) == list(slots.possible_start_times(*args))
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('meeting_length', [0, 30, 45, 120])
+@pytest.mark.parametrize('minutes_step', [15, 30])
+def test_counting_freetimes_equals_nested_loop_per_participant(seed, meeting_length, minutes_step):
+    rnd = random.Random(seed)
+    day = datetime.datetime(2023, 2, 13)
+    possible_start_times = [day + datetime.timedelta(minutes=30 * step) for step in range(3 * 48) if step % 48 > 10]
+    participants = [random_busy_intervals(rnd, day, rnd.randrange(0, 15), minutes_step)
+                    for _ in range(rnd.randrange(1, 8))]
+    min_free = rnd.randrange(1, len(participants) + 1)
+
+    free_counts = {possible_start: 0 for possible_start in possible_start_times}
+    for busy_intervals in participants:
+        for free_time in engines.nested_loop_freetimes(possible_start_times, busy_intervals, meeting_length):
+            free_counts[free_time] += 1
+    expected = [(possible_start, free) for possible_start, free in free_counts.items() if free >= min_free]
+    assert engines.counting_freetimes(possible_start_times, participants, meeting_length,
+                                      min_free=min_free) == expected
+
+
+def test_merge_busy_intervals():
+    day = datetime.datetime(2023, 2, 13)
+    at = lambda hour, minutes=0: day.replace(hour=hour, minute=minutes)
+    busy_intervals = [(at(9), at(10)), (at(8), at(9)), (at(9, 30), at(11)), (at(11), at(11)), (at(13), at(14))]
+    assert engines.merge_busy_intervals(busy_intervals) == [(at(8), at(11)), (at(11), at(11)), (at(13), at(14))]
+
+
+def test_free_runs_bitmap():
+    assert engines.free_runs_bitmap(0b0111011110, 3) == 0b0001000110
+    assert engines.free_runs_bitmap(0b0111011110, 1) == 0b0111011110
+    assert engines.free_runs_bitmap(0b0111011110, 5) == 0
+
+
+@pytest.mark.parametrize('chunk_size', [1, 10, 100, 10000])
+def test_parse_file_chunks(tmp_path, chunk_size):
+    file_name = create_freebusy_file(tmp_path / "freebusy.txt")
+    records = [record for start, end in dump.split_file(file_name, chunk_size)
+               for record in dump.parse_chunk(file_name, start, end)]
+
+    assert [str(record) for _, record in records] == [str(dump.parse_line(line)) for line in FREEBUSY_LINES]
+    with open(file_name, 'rb') as file:
+        content = file.read()
+    assert [content[offset:].split(b'\n')[0].decode() for offset, _ in records] == FREEBUSY_LINES
+
+
+def test_parse_line():
+    assert dump.parse_line(FREEBUSY_LINES[0]) == (dump.EMPLOYEE, None, ('170378154979885419149243073079764064027',
+                                                                        'Colin Gomez'))
+    assert dump.parse_line(FREEBUSY_LINES[5]) == (dump.MEETING, 'START >= END', None)
+    assert dump.parse_line(FREEBUSY_LINES[6]) == (dump.EMPLOYEE, 'employee VALIDATION', None)
+    assert dump.parse_line(FREEBUSY_LINES[8]) == (dump.TRASH, 'TRASH', None)
+    kind, error, values = dump.parse_line("1;1/1/2015 12:00:0;1/1/2015 1:00:00 PM;AB")
+    assert kind == dump.MEETING and isinstance(error, ValueError)
+
+
+@pytest.mark.parametrize('line', FREEBUSY_LINES + [
+    "170378154979885419149243073079764064027;Zoë Łukasik\r\n",
+    " 170378154979885419149243073079764064027;1/18/2015 8:00:00 AM;1/18/2015 9:30:00 AM;3B75E0CA3D \r\n",
+    "170378154979885419149243073079764064027;1/18/2015 8:00:00 AM;1/18/2015 9:30:00 AM;3B;75",
+    "170378154979885419149243073079764064027;1/18/2015 8:00:00 AM;1/18/2015 9:30:00 AM;",
+    " 170378154979885419149243073079764064027;Colin Gomez ",
+    "\r\n",
+])
+def test_parse_raw_line(line):
+    buffer = line.encode()
+    assert str(dump.parse_raw_line(buffer, 0, len(buffer))) == str(dump.parse_line(line))
+
+
+def reference_possible_start_times(earliest_start, latest_start, meeting_length, start_office_minutes,
+                                   end_office_minutes, shortest_time_slot=30):
+    """
+    Every step between earliest and latest start is checked.
+    """
+    meeting_slots = []
+    duration = datetime.timedelta(minutes=meeting_length)
+    meeting_slot_start = earliest_start
+    while latest_start >= meeting_slot_start:
+        midnight = datetime.datetime.combine(meeting_slot_start.date(), datetime.time())
+        office_start = midnight + datetime.timedelta(minutes=start_office_minutes)
+        office_end = midnight + datetime.timedelta(minutes=end_office_minutes)
+        if office_start <= meeting_slot_start < office_end and meeting_slot_start + duration <= office_end:
+            meeting_slots.append(meeting_slot_start)
+        meeting_slot_start += datetime.timedelta(minutes=shortest_time_slot)
+    return meeting_slots
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_possible_start_times_jumps_over_nights(seed):
+    rnd = random.Random(seed)
+    earliest = datetime.datetime(2023, 2, 13, rnd.randrange(24), rnd.choice([0, 15, 30, 45]))
+    latest = earliest + datetime.timedelta(minutes=rnd.randrange(0, 60 * 24 * 10, 15))
+    start_office_minutes = rnd.randrange(0, 12 * 60, 15)
+    end_office_minutes = rnd.randrange(start_office_minutes, 24 * 60 + 1, 15)
+    params = (earliest, latest, rnd.choice([0, 15, 30, 60, 90, 480, 1200]), start_office_minutes, end_office_minutes,
+              rnd.choice([15, 30, 45, 50]))
+    assert list(slots.iter_possible_start_times(*params)) == reference_possible_start_times(*params)
+    assert slots.possible_start_times(*params) == tuple(reference_possible_start_times(*params))
+    assert slots.possible_start_times(*params) is slots.possible_start_times(*params)
+    assert list(slots.iter_possible_start_times(*params, reverse=True)) == reference_possible_start_times(*params)[::-1]
+
+
+def test_day_template_with_minutes_precision():
+    template = slots.day_template(7 * 60 + 30, 17 * 60 + 30, 120)
+    assert template[0] == datetime.timedelta(hours=7, minutes=30)
+    assert template[-1] == datetime.timedelta(hours=15, minutes=30)
+    assert len(template) == 17
+    # Steps of the earliest start placed at quarters
+    template = slots.day_template(7 * 60 + 30, 17 * 60 + 30, 120, phase=datetime.timedelta(minutes=15))
+    assert template[0] == datetime.timedelta(hours=7, minutes=45)
+    assert template[-1] == datetime.timedelta(hours=15, minutes=15)
+
+
+@pytest.mark.parametrize('hours_text, minutes', [('8-17', (480, 1020)), ('08-17', (480, 1020)),
+                                                 ('7:30-17:30', (450, 1050)), ('0-24', (0, 1440)),
+                                                 ('07:05 - 16:45', (425, 1005))])
+def test_get_start_end_minutes(hours_text, minutes):
+    assert get_start_end_minutes(hours_text) == minutes
+
+
+@pytest.mark.parametrize('hours_text', ['817', '8-17-18', '8:60-17', '25-26', '8-24:30', 'a-b', '-1-17'])
+def test_get_start_end_minutes_errors(hours_text):
+    with pytest.raises(ValueError):
+        get_start_end_minutes(hours_text)
+
+
+@pytest.mark.parametrize('overlap', [0, 0.5])
+def test_synthetic_lines(overlap):
+    lines = synthetic.synthetic_lines(employees=5, meetings_per_employee=20, overlap=overlap, days=10)
+    assert lines == synthetic.synthetic_lines(employees=5, meetings_per_employee=20, overlap=overlap, days=10)
+    records = [dump.parse_line(line) for line in lines]
+    assert all(error is None for _, error, _ in records)
+    assert sum(1 for kind, _, _ in records if kind == dump.EMPLOYEE) == 5
+    meetings = [values for kind, _, values in records if kind == dump.MEETING]
+    assert len(meetings) == 100
+    first_day, last_day = datetime.datetime(2015, 1, 1), datetime.datetime(2015, 1, 11)
+    assert all(first_day <= start < end <= last_day for _, start, end, _ in meetings)
+    assert synthetic.get_dump_datetime_text(datetime.datetime(2015, 1, 18, 0, 30)) == '1/18/2015 12:30:00 AM'
+
+
+def test_stage_timer():
+    timer = timing.StageTimer()
+    with timer.stage(timing.DB):
+        pass
+    with timer.stage(timing.SEARCH):
+        pass
+    with timer.stage(timing.DB):
+        pass
+    assert list(timer.durations) == [timing.DB, timing.SEARCH]
+    metrics = timer.server_timing().split(', ')
+    assert [metric.split(';dur=')[0] for metric in metrics] == ['db', 'search', 'total']
+    assert all(float(metric.split(';dur=')[1]) >= 0 for metric in metrics)
+    with timing.NULL_TIMER.stage(timing.DB):
+        pass
+
+
+def test_get_datetime_texts():
+    start = datetime.datetime(2015, 2, 8, 0, 0)
+    datetimes = [start + datetime.timedelta(minutes=30 * step) for step in range(200)]
+    datetimes += [datetime.datetime(2015, 12, 1, 12, 15, 20), datetime.datetime(2015, 12, 1, 0, 45)]
+    assert get_datetime_texts(datetimes) == [get_datetime_text(datime_obj) for datime_obj in datetimes]
+    assert get_datetime_texts(datetimes[::-1]) == [get_datetime_text(datime_obj) for datime_obj in datetimes[::-1]]
+    assert get_epoch_minutes([datetime.datetime(1970, 1, 2, 1, 30, 59)]) == [1440 + 90]
+
+
+@pytest.mark.parametrize('start_minutes, counts, ranges, range_counts', [
+    ([], None, [], None),
+    ([480, 510, 540, 720, 750, 1920], None, [[480, 3], [720, 2], [1920, 1]], None),
+    ([1920, 750, 720, 540], None, [[1920, 1], [750, 2], [540, 1]], None),
+    ([480, 510, 540, 570], [2, 2, 3, 3], [[480, 2], [540, 2]], [2, 3]),
+])
+def test_slot_ranges(start_minutes, counts, ranges, range_counts):
+    assert slots.slot_ranges(start_minutes, 30, counts) == (ranges, range_counts)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 100000])
+def test_read_stream_records(tmp_path, chunk_size):
+    file_name = create_freebusy_file(tmp_path / "freebusy.txt", FREEBUSY_LINES + ["", "Ünicode;Ñame", "last;line"])
+    with open(file_name, 'rb') as file:
+        content = file.read()[:-1]
+    chunks = (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+    streamed = list(dump.read_stream_records(chunks))
+    assert [record for _, record in streamed] == [record for _, record in dump.read_records(file_name)]
+    assert b''.join(line for line, _ in streamed) == content
+
+
+def _compress(compression_name, data):
+    if compression_name == compression.GZIP:
+        return gzip.compress(data)
+    if compression_name == compression.XZ:
+        return lzma.compress(data)
+    zstandard = pytest.importorskip('zstandard')
+    return zstandard.ZstdCompressor().compress(data)
+
+
+@pytest.mark.parametrize('compression_name', [compression.GZIP, compression.XZ, compression.ZSTD])
+@pytest.mark.parametrize('chunk_size', [1, 100, 100000])
+def test_decompress_chunks(compression_name, chunk_size):
+    data = "\n".join(FREEBUSY_LINES * 20).encode()
+    compressed = _compress(compression_name, data[:1000]) + _compress(compression_name, data[1000:])
+    assert compression.detect(compressed) == compression_name
+    chunks = [compressed[i:i + chunk_size] for i in range(0, len(compressed), chunk_size)]
+    assert b''.join(compression.decompress_chunks(chunks)) == data
+
+    with pytest.raises(EOFError):
+        list(compression.decompress_chunks([compressed[:-10]]))
+
+
+@pytest.mark.parametrize('chunks', [[], [b''], [b'1'], [b'12', b'3;name\n', b'4']])
+def test_decompress_plain_chunks(chunks):
+    assert compression.detect(b''.join(chunks)) is None
+    assert b''.join(compression.decompress_chunks(chunks)) == b''.join(chunks)
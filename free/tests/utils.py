@@ -1,8 +1,15 @@
 import datetime
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import AsyncClient
 
 from free.utils.parser import get_datetime_text
 
 API_URL = "/api/free/"
+BATCH_API_URL = "/api/free/batch/"
+ASYNC_API_URL = "/api/free/async/"
 
 
 def create_meeting_frames(year, month, day, hour_from, minutes_from, hour_to, minutes_to):
@@ -18,6 +25,14 @@ def http_call(client, http_method, request_data):
         return client.post(API_URL, request_data, format='json')
 
 
+async def async_http_call(http_method, request_data):
+    client = AsyncClient()
+    if http_method == "GET":
+        return await client.get(ASYNC_API_URL, request_data)
+    else:
+        return await client.post(ASYNC_API_URL, request_data, content_type='application/json')
+
+
 def request_free_time_data(employees, earliest, latest, duration=60, office_hours='8-17'):
     return {
         'employee_ids': ",".join([employee.external_id for employee in employees]),
@@ -26,3 +41,95 @@ def request_free_time_data(employees, earliest, latest, duration=60, office_hour
         'latest_start': get_datetime_text(latest),
         'office_hours': office_hours
     }
+
+
+FREEBUSY_LINES = [
+    "170378154979885419149243073079764064027;Colin Gomez",
+    "139016136604805407078985976850150049467;Faye Moody",
+    "170378154979885419149243073079764064027;1/18/2015 8:00:00 AM;1/18/2015 9:30:00 AM;3B75E0CA3D",
+    "139016136604805407078985976850150049467;1/18/2015 9:00:00 AM;1/18/2015 10:00:00 AM;9A8DC0",
+    "139016136604805407078985976850150049467;1/18/2015 9:00:00 AM;1/18/2015 10:00:00 AM;9A8DC0",
+    "139016136604805407078985976850150049467;1/19/2015 2:00:00 PM;1/19/2015 9:00:00 AM;AB12",
+    "320426673944415970493216791331086532677;",
+    "111111111111111111111111111111111111111;1/19/2015 9:00:00 AM;1/19/2015 10:00:00 AM;CC01",
+    "170378154979885419149243073079764064027;1/19/2015 1:00:00 PM;",
+    "",
+    "170378154979885419149243073079764064027;Colin Gomez",
+]
+
+
+def create_freebusy_file(path, lines=None):
+    with open(path, 'w') as file:
+        file.write("\n".join(FREEBUSY_LINES if lines is None else lines) + "\n")
+    return str(path)
+
+
+class DumpHTTPServer(ThreadingHTTPServer):
+    """
+    Local stand-in of the remote dump file server - `ETag`, `Last-Modified`, `Range` and `If-Range` support.
+    The body of the next response is cut after `break_after` bytes (interrupted download).
+    """
+
+    def __init__(self, content, etag='"v1"'):
+        super().__init__(('127.0.0.1', 0), DumpRequestHandler)
+        self.content = content
+        self.etag = etag
+        self.last_modified = formatdate(0, usegmt=True)
+        self.break_after = None
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.01,), daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/freebusy.txt"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class DumpRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if self.path != '/freebusy.txt':
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == server.etag or \
+                self.headers.get('If-Modified-Since') == server.last_modified and 'If-None-Match' not in self.headers:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        content = server.content
+        start = 0
+        ranged = self.headers.get('Range')
+        if ranged and self.headers.get('If-Range', server.etag) in (server.etag, server.last_modified):
+            start = int(ranged.split('=')[1].rstrip('-'))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(content)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(content) - 1}/{len(content)}")
+        else:
+            self.send_response(200)
+        body = content[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', server.etag)
+        self.send_header('Last-Modified', server.last_modified)
+        self.end_headers()
+        if server.break_after is not None:
+            body = body[:server.break_after]
+            server.break_after = None
+            self.close_connection = True
+        self.wfile.write(body)
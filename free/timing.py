@@ -0,0 +1,128 @@
+import cProfile
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from freebusy.settings import FREE_TIME_PROFILE_DIR, FREE_TIME_TIMING, FREE_TIME_TIMING_LOG
+
+logger = logging.getLogger('free.timing')
+
+# Stages of the free time request
+VALIDATE = 'validate'
+DB = 'db'
+SLOTS = 'slots'
+SEARCH = 'search'
+SERIALIZE = 'serialize'
+
+
+class StageTimer:
+    """
+    Durations of the stages of one request. A stage which is entered several times (batch of queries) is summed.
+
+     validate  | db      | slots | search        | serialize
+     is_valid    busy      possible start times    response
+                 intervals         engine
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+
+    def stage(self, name):
+        return _Stage(self.durations, name)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """
+        `Server-Timing` header value (milliseconds), ex. 'validate;dur=0.052, db;dur=1.310, total;dur=2.004'.
+        """
+        durations = list(self.durations.items()) + [('total', self.total())]
+        return ', '.join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in durations)
+
+    def log(self, request, response):
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'stages': {name: round(seconds * 1000, 3) for name, seconds in self.durations.items()},
+            'total': round(self.total() * 1000, 3),
+        }))
+
+
+class _Stage:
+    __slots__ = ('durations', 'name', 'started')
+
+    def __init__(self, durations, name):
+        self.durations = durations
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.durations[self.name] = self.durations.get(self.name, 0) + time.perf_counter() - self.started
+
+
+class _NullStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullTimer:
+    """
+    Timer of requests when timing is disabled - stages cost one method call.
+    """
+    _null_stage = _NullStage()
+
+    def stage(self, name):
+        return self._null_stage
+
+
+NULL_TIMER = NullTimer()
+
+
+def new_timer():
+    return StageTimer() if FREE_TIME_TIMING or FREE_TIME_TIMING_LOG else NULL_TIMER
+
+
+def finish(timer, request, response, profile_name=None):
+    """
+    `Server-Timing` header and the log line of the timed request.
+    """
+    if timer is NULL_TIMER:
+        return
+    if FREE_TIME_TIMING:
+        response['Server-Timing'] = timer.server_timing()
+    if FREE_TIME_TIMING_LOG:
+        timer.log(request, response)
+    if profile_name is not None:
+        response['X-Profile'] = profile_name
+
+
+@contextmanager
+def profiled(enabled):
+    """
+    Debug switch - the request is run with cProfile and the stats are written to `FREE_TIME_PROFILE_DIR`
+    (`python3 -m pstats <file>`). Yields the name of the stats file, or None when the request is not profiled.
+    """
+    if not enabled or not FREE_TIME_PROFILE_DIR:
+        yield None
+        return
+    profile_name = f"free-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile_name
+    finally:
+        profile.disable()
+        os.makedirs(FREE_TIME_PROFILE_DIR, exist_ok=True)
+        profile.dump_stats(os.path.join(FREE_TIME_PROFILE_DIR, profile_name))
@@ -0,0 +1,92 @@
+import lzma
+import zlib
+from itertools import chain
+
+try:
+    import zstandard
+except ImportError:  # optional dependency - zstd dumps are not supported without it
+    zstandard = None
+
+GZIP = 'gzip'
+XZ = 'xz'
+ZSTD = 'zstd'
+
+MAGIC_BYTES = (
+    (b'\x1f\x8b', GZIP),
+    (b'\xfd7zXZ\x00', XZ),
+    (b'\x28\xb5\x2f\xfd', ZSTD),
+)
+MAGIC_SIZE = max(len(magic) for magic, _ in MAGIC_BYTES)
+CHUNK_SIZE = 256 * 1024
+
+
+def detect(head):
+    """
+    Compression of the data by its first bytes, None for the plain text.
+    """
+    for magic, compression in MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def detect_file(file_name):
+    with open(file_name, 'rb') as file:
+        return detect(file.read(MAGIC_SIZE))
+
+
+def _decompressor(compression):
+    if compression == GZIP:
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    if compression == XZ:
+        return lzma.LZMADecompressor()
+    if zstandard is None:
+        raise ValueError("zstd compressed dump requires the zstandard package (pip install zstandard)")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def decompress_chunks(chunks):
+    """
+    Yields decompressed chunks of the gzip, xz or zstd stream, detected by the magic bytes.
+    Plain data are yielded as they are. Only one chunk is decompressed at a time, never the whole file.
+    Concatenated streams (ex. `cat a.gz b.gz`) are decompressed one after the other.
+    """
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= MAGIC_SIZE:
+            break
+    compression = detect(head)
+    if compression is None:
+        if head:
+            yield head
+        yield from chunks
+        return
+
+    decompressor = _decompressor(compression)
+    # Data of the current stream were given to the decompressor
+    pending = False
+    for data in chain([head], chunks):
+        while data:
+            pending = True
+            decompressed = decompressor.decompress(data)
+            if decompressed:
+                yield decompressed
+            if not decompressor.eof:
+                break
+            # The next stream follows the end of the previous one
+            data = decompressor.unused_data
+            decompressor = _decompressor(compression)
+            pending = False
+    if pending:
+        raise EOFError(f"{compression} compressed dump ended before the end of the stream")
+
+
+def read_file_chunks(file_name, chunk_size=CHUNK_SIZE):
+    with open(file_name, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,159 @@
+import json
+import os
+import queue
+import threading
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+# Chunks of the streamed body waiting for the loader - the network reader is blocked when the buffer is full
+STREAM_CHUNK_SIZE = 256 * 1024
+STREAM_BUFFER_CHUNKS = 16
+
+DOWNLOADED = 'downloaded'
+RESUMED = 'resumed'
+NOT_MODIFIED = 'not modified'
+
+
+def part_file_name(file_name):
+    return file_name + '.part'
+
+
+def meta_file_name(file_name):
+    return file_name + '.meta.json'
+
+
+def download(url, file_name, chunk_size=CHUNK_SIZE, force=False, session=None):
+    """
+    Stream the remote file into `<file>.part` and rename it to the file when the whole body is written,
+    so the file is never half written. Validators of the response (`ETag`, `Last-Modified`)
+    are kept in `<file>.meta.json`:
+
+     - the file is downloaded again only when it was modified (`If-None-Match` / `If-Modified-Since`),
+     - the partial download is resumed (`Range`) when the remote file is still the same one (`If-Range`).
+
+    Returns DOWNLOADED, RESUMED or NOT_MODIFIED.
+    """
+    session = session or requests.Session()
+    part_name = part_file_name(file_name)
+    meta = {} if force else _read_meta(file_name, url)
+    # Content-Encoding would make ranges of the decoded body meaningless.
+    headers = {'Accept-Encoding': 'identity'}
+
+    offset = 0
+    part_validator = _validator(meta.get('part'))
+    if part_validator and os.path.exists(part_name) and os.path.getsize(part_name) > 0:
+        offset = os.path.getsize(part_name)
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = part_validator
+    elif meta.get('file') and os.path.exists(file_name):
+        if meta['file'].get('etag'):
+            headers['If-None-Match'] = meta['file']['etag']
+        if meta['file'].get('last_modified'):
+            headers['If-Modified-Since'] = meta['file']['last_modified']
+
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            return NOT_MODIFIED
+        if response.status_code == 416 and offset:
+            # The partial file is not a part of the remote file anymore
+            os.remove(part_name)
+            return download(url, file_name, chunk_size, force=True, session=session)
+        response.raise_for_status()
+
+        resumed = response.status_code == 206
+        if resumed and not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+            raise requests.HTTPError(f"Unexpected Content-Range {response.headers.get('Content-Range')!r}",
+                                     response=response)
+        meta['part'] = {'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')}
+        _write_meta(file_name, url, meta)
+
+        with open(part_name, 'ab' if resumed else 'wb') as file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+
+    os.replace(part_name, file_name)
+    meta['file'] = meta.pop('part')
+    _write_meta(file_name, url, meta)
+    return RESUMED if resumed else DOWNLOADED
+
+
+def _validator(validators):
+    """
+    `If-Range` value - the strong ETag, otherwise the last modification date.
+    """
+    if not validators:
+        return None
+    etag = validators.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return validators.get('last_modified')
+
+
+def _read_meta(file_name, url):
+    try:
+        with open(meta_file_name(file_name)) as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    # Validators of another URL are not valid
+    return meta if isinstance(meta, dict) and meta.get('url') == url else {}
+
+
+def _write_meta(file_name, url, meta):
+    meta_name = meta_file_name(file_name)
+    with open(meta_name + '.tmp', 'w') as file:
+        json.dump(dict(meta, url=url), file)
+    os.replace(meta_name + '.tmp', meta_name)
+
+
+def stream_chunks(url, chunk_size=STREAM_CHUNK_SIZE, buffer_chunks=STREAM_BUFFER_CHUNKS, session=None):
+    """
+    Yields chunks of the response body. The body is read by a separate thread, so the network I/O overlaps
+    with the consumer (ex. parsing and database inserts). At most `buffer_chunks` chunks are buffered.
+
+     network -> reader thread -> [bounded queue] -> consumer
+    """
+    session = session or requests.Session()
+    buffer = queue.Queue(maxsize=buffer_chunks)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item):
+        # The consumer might stop early, the reader must not wait for it forever.
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            with session.get(url, stream=True, timeout=TIMEOUT) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if not put(chunk):
+                        return
+            put(end)
+        except Exception as e:
+            put(e)
+
+    reader = threading.Thread(target=read, name='stream_chunks', daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # The reader ends with the next chunk (daemon thread, the consumer does not wait for it)
+        stopped.set()
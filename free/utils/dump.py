@@ -0,0 +1,208 @@
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from hashlib import blake2b
+from multiprocessing import get_context
+
+from free.utils import compression
+from free.utils.parser import get_datetime_fast, get_line_fingerprint
+
+EMPLOYEE = 'employee'
+MEETING = 'meeting'
+TRASH = 'TRASH'
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# ASCII characters removed by `str.strip()`
+WHITESPACE = frozenset(b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f')
+
+
+def parse_line(line):
+    """
+    Split and validate a line of the dump file (freebusy.txt). Returns `(kind, error, values)`:
+
+     employee:  (EMPLOYEE, None, (external_id, name))
+     meeting:   (MEETING, None, (external_id, start, end, fingerprint))
+     invalid:   (kind, 'employee VALIDATION' | 'START >= END' | 'TRASH', None)
+     broken:    (MEETING, ValueError(...), None) - ex. time format is not correct
+
+    Existence of the employee is not checked - it depends on the lines which are already loaded.
+    """
+    data = line.strip().split(';')
+    data_len = len(data)
+    if data_len == 2:
+        external_id = data[0]
+        name = data[1]
+        if name is None or len(name) < 1:
+            return EMPLOYEE, 'employee VALIDATION', None
+        return EMPLOYEE, None, (external_id, name)
+    if data_len == 4:
+        try:
+            start = get_datetime_fast(data[1])
+            end = get_datetime_fast(data[2])
+        except ValueError as e:
+            return MEETING, e, None
+        if start >= end:
+            return MEETING, 'START >= END', None
+        return MEETING, None, (data[0], start, end, get_line_fingerprint(line))
+    return TRASH, 'TRASH', None
+
+
+def parse_raw_line(buffer, start, end, view=None):
+    """
+    The same as `parse_line`, for the line placed between the offsets of the bytes buffer (memory mapped file).
+    `;` are searched in the raw bytes and only the id, name and time fields are decoded.
+    The trailing hash column is only hashed (as a part of the fingerprint), it is never copied.
+    """
+    while start < end and buffer[start] in WHITESPACE:
+        start += 1
+    while end > start and buffer[end - 1] in WHITESPACE:
+        end -= 1
+    if start < end and (buffer[start] > 127 or buffer[end - 1] > 127):
+        # Not ASCII characters might be stripped as well.
+        return parse_line(buffer[start:end].decode())
+
+    first = buffer.find(b';', start, end)
+    if first < 0:
+        return TRASH, 'TRASH', None
+    second = buffer.find(b';', first + 1, end)
+    if second < 0:
+        if first + 1 == end:
+            return EMPLOYEE, 'employee VALIDATION', None
+        return EMPLOYEE, None, (buffer[start:first].decode(), buffer[first + 1:end].decode())
+    third = buffer.find(b';', second + 1, end)
+    if third < 0 or buffer.find(b';', third + 1, end) >= 0:
+        return TRASH, 'TRASH', None
+    try:
+        start_time = get_datetime_fast(buffer[first + 1:second].decode())
+        end_time = get_datetime_fast(buffer[second + 1:third].decode())
+    except ValueError as e:
+        return MEETING, e, None
+    if start_time >= end_time:
+        return MEETING, 'START >= END', None
+    if view is None:
+        with memoryview(buffer) as view:
+            fingerprint = blake2b(view[start:end], digest_size=16).hexdigest()
+    else:
+        fingerprint = blake2b(view[start:end], digest_size=16).hexdigest()
+    return MEETING, None, (buffer[start:first].decode(), start_time, end_time, fingerprint)
+
+
+@contextmanager
+def open_mapped(file_name):
+    """
+    Read only memory map of the file. Empty file is mapped to empty bytes.
+    """
+    with open(file_name, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def read_records(file_name, start=0, end=None):
+    """
+    Yields `(line_offset, record)` for lines of the file between the byte offsets.
+    """
+    with open_mapped(file_name) as buffer, memoryview(buffer) as view:
+        end = len(buffer) if end is None else end
+        find = buffer.find
+        position = start
+        while position < end:
+            line_end = find(b'\n', position, end) + 1 or end
+            yield position, parse_raw_line(buffer, position, line_end, view)
+            position = line_end
+
+
+def read_stream_records(chunks):
+    """
+    Yields `(line, record)` for lines of the streamed file - an iterable of bytes chunks (ex. HTTP body).
+    Compressed files (gzip, xz, zstd) are decompressed chunk by chunk.
+    Lines are split incrementally, the incomplete last line of a chunk is carried over to the next one.
+    """
+    rest = b''
+    for chunk in compression.decompress_chunks(chunks):
+        buffer = rest + chunk if rest else chunk
+        position = 0
+        while True:
+            line_end = buffer.find(b'\n', position) + 1
+            if not line_end:
+                break
+            line = buffer[position:line_end]
+            yield line, parse_raw_line(line, 0, len(line))
+            position = line_end
+        rest = buffer[position:]
+    if rest:
+        yield rest, parse_raw_line(rest, 0, len(rest))
+
+
+def read_file_records(file_name):
+    """
+    Yields `(line_offset, record)` of the plain file (see `read_records`),
+    or `(line, record)` of the compressed one - it can not be memory mapped, so it is streamed.
+    """
+    if compression.detect_file(file_name):
+        return read_stream_records(compression.read_file_chunks(file_name))
+    return read_records(file_name)
+
+
+def read_lines(file_name):
+    """
+    Yields lines of the file as text, read from the memory mapped file (or streamed when it is compressed).
+    """
+    if compression.detect_file(file_name):
+        for line, _ in read_stream_records(compression.read_file_chunks(file_name)):
+            yield line.decode().replace('\r\n', '\n')
+        return
+    with open_mapped(file_name) as buffer:
+        position = 0
+        while position < len(buffer):
+            new_line = buffer.find(b'\n', position)
+            line_end = len(buffer) if new_line < 0 else new_line + 1
+            yield buffer[position:line_end].decode().replace('\r\n', '\n')
+            position = line_end
+
+
+def split_file(file_name, chunk_size=CHUNK_SIZE):
+    """
+    Byte ranges of the file, aligned to the lines boundaries.
+    """
+    size = os.path.getsize(file_name)
+    boundaries = [0]
+    with open_mapped(file_name) as buffer:
+        position = chunk_size
+        while position < size:
+            # Move to the beginning of the next line.
+            new_line = buffer.find(b'\n', position)
+            if new_line < 0 or new_line + 1 >= size:
+                break
+            boundaries.append(new_line + 1)
+            position = new_line + 1 + chunk_size
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def parse_chunk(file_name, start, end):
+    """
+    Parse lines between the byte offsets. Returns list of `(line_offset, record)` pairs.
+    """
+    return list(read_records(file_name, start, end))
+
+
+def parse_file_in_processes(file_name, workers, chunk_size=CHUNK_SIZE):
+    """
+    Parse file chunks in separate processes. Yields parsed chunks in the file order.
+    Only a few chunks are parsed ahead, so memory stays bounded when the consumer is slower.
+    """
+    # Spawned processes do not inherit open database connections.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as executor:
+        pending = deque()
+        for start, end in split_file(file_name, chunk_size):
+            pending.append(executor.submit(parse_chunk, file_name, start, end))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,282 @@
+from array import array
+from datetime import timedelta
+from itertools import accumulate
+
+
+def nested_loop_freetimes(possible_start_times, busy_intervals, meeting_length, shortest_time_slot=30):
+    """
+    Reference implementation - every possible start time is checked against every meeting.
+    O(slots x meetings), kept for equivalence tests.
+    """
+    free_times_slots = set()
+    duration = timedelta(minutes=meeting_length)
+    for possible_time_slot in possible_start_times:
+        possible_start = possible_time_slot
+        possible_end = possible_start + duration
+        valid = True
+        for meeting_start, meeting_end in busy_intervals:
+            if meeting_start <= possible_start < meeting_end:
+                """
+                Possible free time slot is placed in meeting
+                 ---XxYyxx--- or ---XxYy--- or ---XxYyPp---
+                 y = p & x
+                """
+                valid = False
+                break
+            if possible_start <= meeting_start < possible_end:
+                """
+                Possible free time slot starts before and ends during the meeting.
+                 ---PpYyx--- or ---Ppp---
+                 y = p & x
+                """
+                valid = False
+                break
+
+        if valid:
+            free_times_slots.add(possible_time_slot)
+
+    return sorted(list(free_times_slots))
+
+
+def merge_busy_intervals(busy_intervals):
+    """
+    Merge overlapping meetings of all participants into sorted, disjoint busy intervals.
+
+     Xxxx--        Xxxxxxx--
+     --Xxxxx-  ->
+     ------Xx
+
+    Meetings without length (start == end) are kept as separate points when they only touch
+    the previous interval, because a new meeting can not start at such point.
+    """
+    merged = []
+    for start, end in sorted(busy_intervals):
+        if merged:
+            last_start, last_end = merged[-1]
+            if start < last_end or (start == last_end and end > start):
+                if end > last_end:
+                    merged[-1] = (last_start, end)
+                continue
+        merged.append((start, end))
+    return merged
+
+
+def sweep_line_freetimes(possible_start_times, busy_intervals, meeting_length, shortest_time_slot=30):
+    """
+    Possible start times and merged busy intervals are sorted, so both lists
+    are walked together in one linear pass.
+
+          P    P    P    P    P
+     --Xxxxxx-------Xx---Xxxx----
+          ^ in meeting   ^ meeting starts before the possible end
+
+    Possible start times must be sorted.
+    """
+    return list(iter_sweep_line_freetimes(possible_start_times, busy_intervals, meeting_length))
+
+
+def iter_sweep_line_freetimes(possible_start_times, busy_intervals, meeting_length, reverse=False):
+    """
+    Free start times generated lazily in the order of possible start times, so the caller can stop
+    after the first few. Possible start times must be sorted, descending when `reverse` is set.
+    """
+    return iter_sweep_line(possible_start_times, busy_intervals, timedelta(minutes=meeting_length), reverse)
+
+
+def sweep_line_minutes(possible_start_minutes, busy_minutes, meeting_length):
+    """
+    `sweep_line_freetimes` over minutes since the epoch (see `free.utils.minutes`) - integers are compared
+    instead of datetimes and free start times are collected into an int64 array.
+    """
+    return array('q', iter_sweep_line(possible_start_minutes, busy_minutes, meeting_length))
+
+
+def iter_sweep_line(possible_start_times, busy_intervals, duration, reverse=False):
+    """
+    Sweep line over datetimes (`duration` is timedelta) or over minutes (`duration` is int).
+    """
+    merged = merge_busy_intervals(busy_intervals)
+    if reverse:
+        # Walk from the last meeting. Meetings starting after the possible end are skipped,
+        # so the current one is the last meeting which might overlap.
+        i = len(merged) - 1
+        for possible_start in possible_start_times:
+            possible_end = possible_start + duration
+            while i >= 0 and merged[i][0] >= possible_end and merged[i][0] > possible_start:
+                i -= 1
+            if i >= 0:
+                meeting_start, meeting_end = merged[i]
+                if meeting_start <= possible_start < meeting_end:
+                    continue
+                if possible_start <= meeting_start < possible_end:
+                    continue
+            yield possible_start
+        return
+
+    merged_len = len(merged)
+    i = 0
+    for possible_start in possible_start_times:
+        # Skip intervals which are already finished before the possible start.
+        while i < merged_len and merged[i][1] <= possible_start and merged[i][0] < possible_start:
+            i += 1
+        if i < merged_len:
+            meeting_start, meeting_end = merged[i]
+            if meeting_start <= possible_start < meeting_end:
+                continue
+            if possible_start <= meeting_start < possible_start + duration:
+                continue
+        yield possible_start
+
+
+def slots_bitmap(busy_intervals, origin, step, size):
+    """
+    Busy time as a bitmap of time slots - bit `k` is set when the slot `origin + k * step` is taken.
+    Returns None when a meeting is not placed at the slots boundaries.
+
+     origin
+     |--Xxxx----Xx|  ->  0b001000001111 (slot 0 is the lowest bit)
+
+    Meeting without length still blocks the start at its time, so it takes the whole slot.
+    """
+    bitmap = 0
+    for start, end in busy_intervals:
+        start_offset, start_rest = divmod(start - origin, step)
+        end_offset, end_rest = divmod(end - origin, step)
+        if start_rest or end_rest:
+            return None
+        if start_offset == end_offset:
+            end_offset += 1
+        start_offset = max(start_offset, 0)
+        end_offset = min(end_offset, size)
+        if start_offset < end_offset:
+            bitmap |= ((1 << (end_offset - start_offset)) - 1) << start_offset
+    return bitmap
+
+
+def free_runs_bitmap(free_bitmap, slots_amount):
+    """
+    Bit `k` stays set only when `slots_amount` following slots (starting from `k`) are free.
+    The bitmap is shifted and AND-ed with itself, doubling the checked run length each time.
+    """
+    runs = free_bitmap
+    checked = 1
+    while checked < slots_amount:
+        shift = min(checked, slots_amount - checked)
+        runs &= runs >> shift
+        checked += shift
+    return runs
+
+
+def bitmap_freetimes(possible_start_times, busy_intervals, meeting_length, shortest_time_slot=30):
+    """
+    Meetings are placed at whole and half hours, so busy time of each employee is a bitmap of slots.
+    Busy bitmaps are OR-ed (the same as AND-ing free time bitmaps of all participants)
+    and fitting the meeting is a run-length check over the combined bitmap.
+
+    Falls back to the sweep line engine when the meeting length or any meeting
+    is not aligned to the time slots.
+    """
+    if not possible_start_times:
+        return []
+    step = timedelta(minutes=shortest_time_slot)
+    slots_amount, length_rest = divmod(meeting_length, shortest_time_slot)
+    if slots_amount < 1 or length_rest:
+        return sweep_line_freetimes(possible_start_times, busy_intervals, meeting_length, shortest_time_slot)
+
+    origin = possible_start_times[0]
+    size = (possible_start_times[-1] - origin) // step + slots_amount
+    busy_bitmap = slots_bitmap(busy_intervals, origin, step, size)
+    if busy_bitmap is None:
+        return sweep_line_freetimes(possible_start_times, busy_intervals, meeting_length, shortest_time_slot)
+
+    free_bitmap = ~busy_bitmap & ((1 << size) - 1)
+    runs = free_runs_bitmap(free_bitmap, slots_amount)
+    # Reversed binary text - character `k` is the bit `k`, read without shifting the whole bitmap.
+    runs_bits = format(runs, 'b')[::-1]
+    runs_len = len(runs_bits)
+    free_times_list = []
+    for possible_start in possible_start_times:
+        offset = (possible_start - origin) // step
+        if offset < runs_len and runs_bits[offset] == '1':
+            free_times_list.append(possible_start)
+    return free_times_list
+
+
+def blocked_slots_ranges(busy_intervals, origin, step, duration):
+    """
+    Ranges `[first, last)` of slots (`origin + k * step`) where the meeting can not start.
+    A meeting blocks starts from its start to its end and starts which end after the meeting start:
+
+     ----Xxxx--
+      ppPPPPP     (p - the meeting of `duration` would overlap, P - the start is in the meeting)
+
+    Overlapping ranges are merged, so every slot is counted once.
+    """
+    ranges = []
+    for start, end in busy_intervals:
+        # Starts in the meeting: start <= p < end
+        if end > start:
+            ranges.append((-((origin - start) // step), -((origin - end) // step)))
+        # Meeting starts before the possible end: start - duration < p <= start
+        if duration > timedelta():
+            ranges.append(((start - duration - origin) // step + 1, (start - origin) // step + 1))
+    ranges.sort()
+    merged = []
+    for first, last in ranges:
+        if first >= last:
+            continue
+        if merged and first <= merged[-1][1]:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+            continue
+        merged.append((first, last))
+    return merged
+
+
+def counting_freetimes(possible_start_times, participants_busy_intervals, meeting_length, shortest_time_slot=30,
+                       min_free=1):
+    """
+    Possible start times when at least `min_free` participants are free, as (start, free participants) pairs.
+    Busy participants are counted per slot with a difference array over the slots grid - every participant
+    adds +1 where its blocked range starts and -1 where it ends, the prefix sum is the busy count.
+
+     participant 1:  --++++------
+     participant 2:  ----+++++---
+     busy count:     001122111000
+
+    Possible start times must be sorted and placed every `shortest_time_slot` minutes from the first one.
+    """
+    if not possible_start_times:
+        return []
+    step = timedelta(minutes=shortest_time_slot)
+    duration = timedelta(minutes=meeting_length)
+    origin = possible_start_times[0]
+    size = (possible_start_times[-1] - origin) // step + 1
+    participants = 0
+    difference = [0] * (size + 1)
+    for busy_intervals in participants_busy_intervals:
+        participants += 1
+        for first, last in blocked_slots_ranges(busy_intervals, origin, step, duration):
+            first, last = max(first, 0), min(last, size)
+            if first < last:
+                difference[first] += 1
+                difference[last] -= 1
+
+    busy_counts = list(accumulate(difference))
+    free_times_list = []
+    for possible_start in possible_start_times:
+        free = participants - busy_counts[(possible_start - origin) // step]
+        if free >= min_free:
+            free_times_list.append((possible_start, free))
+    return free_times_list
+
+
+ENGINES = {
+    'bitmap': bitmap_freetimes,
+    'nested_loop': nested_loop_freetimes,
+    'sweep': sweep_line_freetimes,
+}
+
+
+def get_engine(name):
+    return ENGINES[name]
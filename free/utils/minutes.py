@@ -0,0 +1,105 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+MICROSECOND = timedelta(microseconds=1)
+MICROSECONDS_PER_MINUTE = MINUTE // MICROSECOND
+
+
+def get_minutes(datime_obj, round_up=False):
+    """
+    Minutes since the Unix epoch. Seconds are rounded down, or up with `round_up`.
+    """
+    minutes, rest = divmod(datime_obj - EPOCH, MINUTE)
+    return minutes + 1 if round_up and rest else minutes
+
+
+def get_microseconds(datime_obj):
+    """
+    Microseconds since the Unix epoch - exact for any datetime.
+    """
+    return (datime_obj - EPOCH) // MICROSECOND
+
+
+@lru_cache(maxsize=65536)
+def get_datetime(minutes):
+    """
+    Datetime of minutes since the Unix epoch. Meetings and free time slots start at a few times
+    (ex. half hours), so datetimes are shared.
+    """
+    return EPOCH + timedelta(minutes=minutes)
+
+
+def get_datetimes(minutes):
+    return [get_datetime(value) for value in minutes]
+
+
+@lru_cache(maxsize=65536)
+def get_microseconds_datetime(microseconds):
+    return EPOCH + timedelta(microseconds=microseconds)
+
+
+def is_whole_minute(datime_obj):
+    return datime_obj.second == 0 and datime_obj.microsecond == 0
+
+
+class BusyCalendar:
+    """
+    Busy intervals of one employee as microseconds since the epoch - two int64 columns sorted by start.
+    Intervals are disjoint (see `free.busy`), so ends are sorted as well.
+    An interval takes 16 bytes instead of a tuple of two datetimes, times with seconds are kept exactly.
+
+     starts  | 1423922400000000 | 1423929600000000 | ...
+     ends    | 1423926000000000 | 1423931400000000 | ...
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, starts=None, ends=None):
+        self.starts = array('q') if starts is None else starts
+        self.ends = array('q') if ends is None else ends
+
+    def append(self, start, end):
+        self.starts.append(get_microseconds(start))
+        self.ends.append(get_microseconds(end))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        return isinstance(other, BusyCalendar) and self.starts == other.starts and self.ends == other.ends
+
+    def __repr__(self):
+        return f"BusyCalendar({self.intervals()!r})"
+
+    def window(self, earliest_start, latest_end):
+        """
+        Indexes `[first, last)` of intervals between earliest_start and latest_end (start < latest, end > earliest).
+        """
+        last = bisect_left(self.starts, get_microseconds(latest_end))
+        first = bisect_right(self.ends, get_microseconds(earliest_start), 0, last)
+        return first, last
+
+    def minutes(self, earliest_start, latest_end, round_starts_up=False):
+        """
+        (start, end) minutes of intervals between earliest_start and latest_end. Ends are rounded up and
+        starts down, so they overlap exactly the same meetings at whole minutes as the exact times.
+        Meetings without duration are blocked only from the start on - starts are rounded up for them.
+        """
+        first, last = self.window(earliest_start, latest_end)
+        ends = [-(-end // MICROSECONDS_PER_MINUTE) for end in self.ends[first:last]]
+        if round_starts_up:
+            return list(zip([-(-start // MICROSECONDS_PER_MINUTE) for start in self.starts[first:last]], ends))
+        return list(zip([start // MICROSECONDS_PER_MINUTE for start in self.starts[first:last]], ends))
+
+    def intervals(self, earliest_start=None, latest_end=None):
+        """
+        (start, end) datetimes of intervals, only those between earliest_start and latest_end
+        when the window is given.
+        """
+        first, last = (0, len(self)) if earliest_start is None or latest_end is None \
+            else self.window(earliest_start, latest_end)
+        return [(get_microseconds_datetime(start), get_microseconds_datetime(end))
+                for start, end in zip(self.starts[first:last], self.ends[first:last])]
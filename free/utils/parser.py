@@ -1,4 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime, time
+from functools import lru_cache
+from hashlib import blake2b
 
 from freebusy.settings import DATETIME_FORMAT, DATETIME_FORMAT_RESPONSE
 
@@ -7,12 +9,118 @@ def get_datetime(datime_text):
     return datetime.strptime(datime_text, DATETIME_FORMAT)
 
 
+@lru_cache(maxsize=4096)
+def _get_date(date_text):
+    month, day, year = date_text.split('/')
+    if not (0 < len(month) <= 2 and 0 < len(day) <= 2 and len(year) == 4
+            and month.isdigit() and day.isdigit() and year.isdigit()):
+        raise ValueError(f"date {date_text!r} does not match format 'M/D/YYYY'")
+    return date(int(year), int(month), int(day))
+
+
+@lru_cache(maxsize=4096)
+def _get_time(time_text, period):
+    hour, minute, second = time_text.split(':')
+    period = period.upper()
+    if not (0 < len(hour) <= 2 and 0 < len(minute) <= 2 and 0 < len(second) <= 2
+            and hour.isdigit() and minute.isdigit() and second.isdigit()) or period not in ('AM', 'PM'):
+        raise ValueError(f"time {time_text!r} {period!r} does not match format 'h:mm:ss AM'")
+    hour = int(hour)
+    if not 1 <= hour <= 12:
+        raise ValueError(f"hour {hour} is out of range 1-12")
+    hour = hour % 12 + (12 if period == 'PM' else 0)
+    return time(hour, int(minute), int(second))
+
+
+def get_datetime_fast(datime_text):
+    """
+    The same as `get_datetime` for the fixed `M/D/YYYY h:mm:ss AM` format of the dump files,
+    but much faster than `strptime`. Dates and times repeat a lot, so both parts are cached.
+    """
+    date_text, time_text, period = datime_text.split(' ')
+    return datetime.combine(_get_date(date_text), _get_time(time_text, period))
+
+
+def get_line_fingerprint(line):
+    """
+    Short digest of the dump file line. Meeting lines end with a unique hash column,
+    so the fingerprint changes with the meeting data or with its hash.
+    """
+    return blake2b(line.strip().encode(), digest_size=16).hexdigest()
+
+
 def get_datetime_text(datime_obj):
     return datetime.strftime(datime_obj, DATETIME_FORMAT_RESPONSE)
 
 
+# '%-m/%d/%Y %-I:%M:%S %p' -> '%-m/%d/%Y', '%-I:%M:%S %p'
+DATE_FORMAT_RESPONSE, TIME_FORMAT_RESPONSE = DATETIME_FORMAT_RESPONSE.split(' ', 1)
+# Free time slots start at the half hours (with the default shortest time slot)
+HALF_HOURS_TEXTS = {time(hour, minute): time(hour, minute).strftime(TIME_FORMAT_RESPONSE)
+                    for hour in range(24) for minute in (0, 30)}
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=4096)
+def _get_time_text(time_obj):
+    return time_obj.strftime(TIME_FORMAT_RESPONSE)
+
+
+def get_datetime_texts(datetimes):
+    """
+    The same as `get_datetime_text` for many datetimes (free time slots) - a text is the date prefix
+    (formatted once per day) and the time of the day suffix (48 half hours are precomputed).
+
+     '2/14/2015' + ' ' + '2:00:00 PM'
+    """
+    texts = []
+    append = texts.append
+    half_hours_texts = HALF_HOURS_TEXTS
+    last_date = None
+    prefix = None
+    for datime_obj in datetimes:
+        date_obj = datime_obj.date()
+        if date_obj != last_date:
+            last_date = date_obj
+            prefix = date_obj.strftime(DATE_FORMAT_RESPONSE) + ' '
+        time_obj = datime_obj.time()
+        suffix = half_hours_texts.get(time_obj)
+        append(prefix + (suffix if suffix is not None else _get_time_text(time_obj)))
+    return texts
+
+
+def get_epoch_minutes(datetimes):
+    """
+    Datetimes as minutes since the Unix epoch (1/1/1970 12:00:00 AM, time zones are not used).
+    Seconds are truncated.
+    """
+    epoch_ordinal = EPOCH_ORDINAL
+    return [(datime_obj.toordinal() - epoch_ordinal) * 1440 + datime_obj.hour * 60 + datime_obj.minute
+            for datime_obj in datetimes]
+
+
 def get_start_end_hours(hours_text):
     hours = hours_text.split('-')
     start_hours = int(hours[0])
     end_hours = int(hours[1])
     return start_hours, end_hours
+
+
+def get_office_time_minutes(time_text):
+    """
+    '7', '07' or '7:30' as minutes since midnight. '24' (or '24:00') is the end of the day.
+    """
+    hours, _, minutes = time_text.strip().partition(':')
+    hours = int(hours)
+    minutes = int(minutes) if minutes else 0
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+        raise ValueError(f"office time {time_text!r} is out of range 0:00-24:00")
+    return hours * 60 + minutes
+
+
+def get_start_end_minutes(hours_text):
+    """
+    Office hours with minutes precision, ex. '8-17' or '7:30-17:30', as minutes since midnight.
+    """
+    start_text, end_text = hours_text.split('-')
+    return get_office_time_minutes(start_text), get_office_time_minutes(end_text)
@@ -0,0 +1,112 @@
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from free.utils.minutes import get_minutes
+from freebusy.settings import POSSIBLE_START_TIMES_CACHE_SIZE
+
+DAY = timedelta(days=1)
+
+
+@lru_cache(maxsize=POSSIBLE_START_TIMES_CACHE_SIZE)
+def day_template(start_office_minutes, end_office_minutes, meeting_length, shortest_time_slot=30, phase=timedelta()):
+    """
+    Valid start times of one day, as offsets from the midnight. The whole meeting must fit into the office hours.
+    Steps are placed at `phase + k * shortest_time_slot` (the phase keeps the steps of the earliest start).
+
+     0:00        7:30               17:30
+     |-----------|PPPPPPPPPPPPPPPP--|------|  -> (7:30, 8:00, ... 15:30) for 120 minutes meeting
+    """
+    step = timedelta(minutes=shortest_time_slot)
+    duration = timedelta(minutes=meeting_length)
+    office_start = timedelta(minutes=start_office_minutes)
+    office_end = timedelta(minutes=end_office_minutes)
+    offsets = []
+    offset = office_start + (phase - office_start) % step
+    while offset < office_end and offset + duration <= office_end:
+        offsets.append(offset)
+        offset += step
+    return tuple(offsets)
+
+
+def iter_possible_start_times(earliest_start, latest_start, meeting_length, start_office_minutes, end_office_minutes,
+                              shortest_time_slot=30, reverse=False):
+    """
+    Start times between earliest and latest start, every `shortest_time_slot` minutes counted from
+    the earliest start, when the whole meeting fits into the office hours.
+    The day template is stamped onto each day of the window, so night steps are never visited
+    and office hours are not checked step by step. Start times are generated lazily,
+    from the latest one when `reverse` is set.
+
+          earliest                               latest
+     8|---|PPPPPPPP--|17 (night) 8|PPPPPPPPPPPP--|17  ...
+    """
+    step = timedelta(minutes=shortest_time_slot)
+    first_midnight = datetime.combine(earliest_start.date(), time())
+    last_midnight = datetime.combine(latest_start.date(), time())
+    midnight = last_midnight if reverse else first_midnight
+    while first_midnight <= midnight <= last_midnight:
+        phase = (earliest_start - midnight) % step
+        template = day_template(start_office_minutes, end_office_minutes, meeting_length, shortest_time_slot, phase)
+        if reverse:
+            template = template[::-1]
+        if template:
+            if earliest_start <= midnight + min(template[0], template[-1]) and \
+                    midnight + max(template[0], template[-1]) <= latest_start:
+                yield from [midnight + offset for offset in template]
+            else:
+                # The first or the last day of the window
+                for offset in template:
+                    possible_start = midnight + offset
+                    if earliest_start <= possible_start <= latest_start:
+                        yield possible_start
+        midnight += -DAY if reverse else DAY
+
+
+@lru_cache(maxsize=POSSIBLE_START_TIMES_CACHE_SIZE)
+def possible_start_times(earliest_start, latest_start, meeting_length, start_office_minutes, end_office_minutes,
+                         shortest_time_slot=30):
+    """
+    Cached grid of start times - many requests are asking about the same time windows.
+    The grid is shared, so it is a tuple.
+    """
+    return tuple(iter_possible_start_times(earliest_start, latest_start, meeting_length,
+                                           start_office_minutes, end_office_minutes, shortest_time_slot))
+
+
+@lru_cache(maxsize=POSSIBLE_START_TIMES_CACHE_SIZE)
+def possible_start_minutes(earliest_start, latest_start, meeting_length, start_office_minutes, end_office_minutes,
+                           shortest_time_slot=30):
+    """
+    Cached grid of start times as minutes since the epoch - start times must be at whole minutes
+    (the earliest start has no seconds). A tuple, so the int objects are shared by all searches of the grid.
+    """
+    return tuple(get_minutes(possible_start)
+                 for possible_start in iter_possible_start_times(earliest_start, latest_start, meeting_length,
+                                                                 start_office_minutes, end_office_minutes,
+                                                                 shortest_time_slot))
+
+
+def slot_ranges(start_minutes, shortest_time_slot=30, counts=None):
+    """
+    Run-length encoding of free time slots (start times in minutes) - `[first, amount]` of each run of slots
+    which are `shortest_time_slot` apart, in the order of slots (runs of descending slots go backwards).
+    Runs are split as well where the amount of free employees (`counts`) changes.
+    Returns the ranges and the count of each range (None without `counts`).
+
+     8:00 8:30 9:00 | 12:00 12:30  ->  [[8:00, 3], [12:00, 2]]
+    """
+    ranges = []
+    range_counts = [] if counts is not None else None
+    previous = None
+    previous_count = None
+    for index, minutes in enumerate(start_minutes):
+        count = counts[index] if counts is not None else None
+        if previous is not None and abs(minutes - previous) == shortest_time_slot and count == previous_count:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([minutes, 1])
+            if counts is not None:
+                range_counts.append(count)
+        previous = minutes
+        previous_count = count
+    return ranges, range_counts
@@ -0,0 +1,48 @@
+import random
+from datetime import datetime, timedelta
+
+SYNTHETIC_START = datetime(2015, 1, 1)
+
+
+def get_dump_datetime_text(datime_obj):
+    """
+    Time in the format of the dump file, ex. '1/18/2015 8:00:00 AM'.
+    """
+    hour = datime_obj.hour % 12 or 12
+    period = 'AM' if datime_obj.hour < 12 else 'PM'
+    return f"{datime_obj.month}/{datime_obj.day}/{datime_obj.year} {hour}:{datime_obj.minute:02d}:00 {period}"
+
+
+def synthetic_lines(employees=140, meetings_per_employee=70, overlap=0.1, days=90, start=SYNTHETIC_START, seed=0):
+    """
+    Lines of a synthetic dump file (freebusy.txt). Meetings are placed at half hours during the office hours (8-17).
+    `overlap` is the probability that the meeting overlaps the previous meeting of the same employee.
+    Employees and meetings lines are shuffled, as in the real file (some employees are placed below their meetings).
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for number in range(employees):
+        external_id = str(rnd.getrandbits(128))
+        lines.append(f"{external_id};Employee {number}")
+        previous = None
+        for _ in range(meetings_per_employee):
+            if previous is not None and rnd.random() < overlap:
+                # Starts during the previous meeting (at the half hour)
+                half_hours = (previous[1] - previous[0]) // timedelta(minutes=30)
+                meeting_start = previous[0] + timedelta(minutes=30 * (half_hours // 2))
+            else:
+                day = start + timedelta(days=rnd.randrange(days))
+                meeting_start = day + timedelta(hours=8, minutes=30 * rnd.randrange(18))
+            meeting_end = meeting_start + timedelta(minutes=30 * rnd.randrange(1, 7))
+            previous = meeting_start, meeting_end
+            lines.append(f"{external_id};{get_dump_datetime_text(meeting_start)};"
+                         f"{get_dump_datetime_text(meeting_end)};{rnd.getrandbits(1024):0256X}")
+    rnd.shuffle(lines)
+    return lines
+
+
+def write_synthetic_file(file_name, **kwargs):
+    with open(file_name, 'w', newline='\r\n') as file:
+        for line in synthetic_lines(**kwargs):
+            file.write(line + '\n')
+    return file_name
@@ -1,20 +1,64 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework import generics, status
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from free import timing
+from free.cache import busy_calendar_cache
 from free.models import Employee, Meeting
-from free.serializers import EmployeeSerializer, ResponseFreeTimeSerializer, MeetingSerializer, RequestFreeTimeSerializer
+from free.pagination import EmployeeCursorPagination, MeetingCursorPagination
+from free.renderers import FREE_TIME_RENDERERS, NDJSONRenderer, get_free_time_renderer, ndjson_line
+from free.serializers import EmployeeListSerializer, FreeTimes, ResponseFreeTimeSerializer, MeetingListSerializer, \
+    RequestBatchFreeTimeSerializer, RequestFreeTimeSerializer
+from freebusy.settings import FREE_TIME_ASYNC_WORKERS, LIST_STREAM_CHUNK_SIZE
+
+# Free time slots are computed out of the event loop, by a bounded amount of threads.
+free_time_executor = ThreadPoolExecutor(max_workers=FREE_TIME_ASYNC_WORKERS, thread_name_prefix='free_time')
+
 
+class StageTimingMixin:
+    """
+    Durations of the request stages (see `free.timing`) in the `Server-Timing` header and an optional log line.
+    Requests with `?profile=1` are profiled when `FREE_TIME_PROFILE_DIR` is set.
+    """
 
-class FreeTimeView(APIView):
+    def dispatch(self, request, *args, **kwargs):
+        self.timer = timing.new_timer()
+        profile = request.GET.get('profile', '').lower() in ['yes', 'y', '1', 'true', 't', 'yep']
+        with timing.profiled(profile) as profile_name:
+            response = super().dispatch(request, *args, **kwargs)
+        timing.finish(self.timer, request, response, profile_name)
+        return response
+
+
+class FreeTimeEncodingMixin:
+    """
+    Free time slots as text or in the compact encodings - `?format=epoch|ranges` or the `Accept` header
+    (see `ResponseFreeTimeSerializer`).
+    """
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + list(FREE_TIME_RENDERERS)
+
+    def get_encoding_context(self, shortest_time_slot):
+        return {'encoding': self.request.accepted_renderer.format, 'shortest_time_slot': shortest_time_slot}
+
+
+class FreeTimeView(StageTimingMixin, FreeTimeEncodingMixin, APIView):
 
     def get_or_post(self, input_data):
-        free_times_query = RequestFreeTimeSerializer(data=input_data)
+        free_times_query = RequestFreeTimeSerializer(data=input_data, timer=self.timer)
         if not free_times_query.is_valid():
             return Response(status=status.HTTP_400_BAD_REQUEST)
         output_data = free_times_query.get_freetimes()
-        serializer = ResponseFreeTimeSerializer(output_data)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with self.timer.stage(timing.SERIALIZE):
+            context = self.get_encoding_context(free_times_query.shortest_time_slot)
+            data = ResponseFreeTimeSerializer(output_data, context=context).data
+        return Response(data, status=status.HTTP_200_OK)
 
     def get(self, request, *args, **kwargs):
         return self.get_or_post(request.query_params)
@@ -23,17 +67,113 @@ class FreeTimeView(APIView):
         return self.get_or_post(request.data)
 
 
-class EmployeeListView(generics.ListCreateAPIView):
+class AsyncFreeTimeView(View):
+    """
+    The same as `FreeTimeView` for ASGI servers. Waiting for the database does not hold a thread,
+    so one process serves many concurrent requests.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # JSON API, the same as DRF views
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Profiling (`?profile=1`) is not supported - cProfile does not follow the coroutine across awaits.
+        self.timer = timing.new_timer()
+        response = await super().dispatch(request, *args, **kwargs)
+        timing.finish(self.timer, request, response)
+        return response
+
+    async def get_or_post(self, input_data):
+        free_times_query = RequestFreeTimeSerializer(data=input_data, timer=self.timer)
+        if not free_times_query.is_valid():
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        with self.timer.stage(timing.DB):
+            calendars = await busy_calendar_cache.acalendars(free_times_query.external_ids,
+                                                             free_times_query.earliest_start,
+                                                             free_times_query.latest_end)
+        loop = asyncio.get_running_loop()
+        output_data = await loop.run_in_executor(free_time_executor, free_times_query.get_freetimes, calendars)
+        with self.timer.stage(timing.SERIALIZE):
+            renderer = get_free_time_renderer(self.request)
+            context = {'encoding': renderer and renderer.format,
+                       'shortest_time_slot': free_times_query.shortest_time_slot}
+            data = ResponseFreeTimeSerializer(output_data, context=context).data
+        return JsonResponse(data, status=status.HTTP_200_OK, json_dumps_params={'separators': (',', ':')},
+                            content_type=renderer.media_type if renderer else 'application/json')
+
+    async def get(self, request, *args, **kwargs):
+        return await self.get_or_post(request.GET)
+
+    async def post(self, request, *args, **kwargs):
+        if request.content_type == 'application/json':
+            try:
+                input_data = json.loads(request.body)
+            except ValueError:
+                return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(input_data, dict):
+                return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        else:
+            input_data = request.POST
+        return await self.get_or_post(input_data)
+
+
+class BatchFreeTimeView(StageTimingMixin, FreeTimeEncodingMixin, APIView):
+    """
+    Free time of many participant groups in one request:
+     {"queries": [{"employee_ids": ..., "duration": ..., "earliest_start": ..., ...}, ...]}
+    Results are in the order of queries - `{"freetimes": [...]}` or `{"error": "..."}` for an invalid query.
+    """
+
+    def post(self, request, *args, **kwargs):
+        batch_query = RequestBatchFreeTimeSerializer(data=request.data, timer=self.timer)
+        if not batch_query.is_valid():
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        results = []
+        context = self.get_encoding_context(batch_query.shortest_time_slot)
+        for result in batch_query.get_results():
+            with self.timer.stage(timing.SERIALIZE):
+                if isinstance(result, FreeTimes):
+                    results.append(ResponseFreeTimeSerializer(result, context=context).data)
+                else:
+                    results.append({'error': result})
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class StreamingListMixin:
+    """
+    Whole list streamed as NDJSON (`?format=ndjson` or `Accept: application/x-ndjson`), without pagination.
+    Rows are fetched in chunks, so the memory usage does not depend on the table size.
+    """
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer]
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != NDJSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer()
+        queryset = self.filter_queryset(self.get_queryset()).order_by(*self.pagination_class.ordering)
+        rows = (ndjson_line(serializer.to_representation(instance))
+                for instance in queryset.iterator(chunk_size=LIST_STREAM_CHUNK_SIZE))
+        return StreamingHttpResponse(rows, content_type=NDJSONRenderer.media_type)
+
+
+class EmployeeListView(StreamingListMixin, generics.ListCreateAPIView):
     """
     For testing purposes
     """
     queryset = Employee.objects.all()
-    serializer_class = EmployeeSerializer
+    serializer_class = EmployeeListSerializer
+    pagination_class = EmployeeCursorPagination
 
 
-class MeetingListView(generics.ListCreateAPIView):
+class MeetingListView(StreamingListMixin, generics.ListCreateAPIView):
     """
     For testing purposes
     """
-    queryset = Meeting.objects.all()
-    serializer_class = MeetingSerializer
+    # Meetings without the start (loaded before it was validated) can not be placed on the cursor
+    queryset = Meeting.objects.filter(start__isnull=False).select_related('employee')
+    serializer_class = MeetingListSerializer
+    pagination_class = MeetingCursorPagination
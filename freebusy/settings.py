@@ -130,3 +130,51 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DATETIME_FORMAT = '%m/%d/%Y %I:%M:%S %p'  # example: '01/29/2015 02:00:00 PM'
 DATETIME_FORMAT_RESPONSE = '%-m/%d/%Y %-I:%M:%S %p'  # example: '1/29/2015 2:00:00 PM'
+
+# Free time search algorithm: 'sweep' (default), 'bitmap' (large participant sets)
+# or 'nested_loop' (reference implementation)
+FREE_TIME_ENGINE = 'sweep'
+# Amount of cached grids of possible start times (time window, duration and office hours)
+POSSIBLE_START_TIMES_CACHE_SIZE = 256
+# Threads computing free time slots for the async (ASGI) free time view
+FREE_TIME_ASYNC_WORKERS = 4
+# Max amount of queries in one request to the batch free time endpoint
+FREE_TIME_BATCH_MAX_QUERIES = 100
+
+# Per-stage timers of free time requests - `Server-Timing` response header and (optionally) a JSON log line
+# of the `free.timing` logger
+FREE_TIME_TIMING = True
+FREE_TIME_TIMING_LOG = False
+# Debug switch - free time requests with `?profile=1` are run with cProfile, stats are written to the directory
+FREE_TIME_PROFILE_DIR = None
+
+# Pages of the employees and meetings lists (`?page_size=` up to the max)
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+# Rows fetched from the database at once by the NDJSON export (`?format=ndjson`)
+LIST_STREAM_CHUNK_SIZE = 2000
+
+# Busy calendar cache - max amount of cached meetings (0 disables the cache)
+BUSY_CACHE_MAX_INTERVALS = 200000
+# Touched after bulk data loading, so cached calendars are dropped in all processes
+BUSY_CACHE_GENERATION_FILE = os.path.join(BASE_DIR, '.busy_cache_generation')
+# Snapshot of busy intervals (`python3 manage.py exportsnapshot`) - calendars missing in the cache are read
+# from the memory mapped file instead of the database, until the data are changed (None disables it)
+BUSY_SNAPSHOT_FILE = None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'free.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
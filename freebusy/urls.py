@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.urls import path
 
-from free.views import EmployeeListView, FreeTimeView, MeetingListView
+from free.views import AsyncFreeTimeView, BatchFreeTimeView, EmployeeListView, FreeTimeView, MeetingListView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('employees/', EmployeeListView.as_view()),
     path('meetings/', MeetingListView.as_view()),
-    path('api/free/', FreeTimeView.as_view())
+    path('api/free/', FreeTimeView.as_view()),
+    path('api/free/batch/', BatchFreeTimeView.as_view()),
+    path('api/free/async/', AsyncFreeTimeView.as_view())
 ]